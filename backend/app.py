@@ -3,19 +3,38 @@ API REST para Sistema de Diagnóstico Médico
 Endpoints para predicción de enfermedades, solicitud de exámenes y generación de reportes
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
 import os
 import sys
+import hashlib
+import hmac
+import json
 import logging
+import threading
+import time
 from functools import wraps
+from sqlalchemy import and_, case, event, func, inspect, literal, or_, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 
-# Agregar ruta del modelo
+# Agregar ruta del modelo y de los módulos del backend
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.dirname(__file__))
 
-from train_model import load_model
+from inference import MAX_TOP_K, CascadeClassifier, artifact_version, top_k_diseases, vocabulary_coverage
+from inference_client import InferenceClient, InferenceServiceError
+from json_provider import FastJSONProvider
+from outbox import Outbox, OutboxWorker, outbox_table
+from partitioning import ensure_partitioned
+from metrics import metrics
+from serializers import compile_schema
+from explain import ForestExplainer, explain_linear
+from onnx_export import PortableTfidfVectorizer
+from similarity_index import SimilarityIndex, build_lock
+from symptom_suggest import SymptomSuggester
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +42,7 @@ logger = logging.getLogger(__name__)
 
 # Inicializar Flask
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Configuración de base de datos
@@ -30,11 +50,90 @@ DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://admin:password@db:5432/me
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Número de diagnósticos diferenciales que se guardan con cada diagnóstico
+DIFFERENTIAL_TOP_K = min(int(os.getenv('DIFFERENTIAL_TOP_K', 5)), MAX_TOP_K)
+
+# Filas por lote al leer historiales en modo streaming (cursor del lado del servidor)
+STREAM_YIELD_PER = int(os.getenv('STREAM_YIELD_PER', 500))
+
+# Backend de inferencia: 'sklearn' (pipeline joblib) u 'onnx' (onnxruntime CPU)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'sklearn').lower()
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', 1))
+
+# Cascada de inferencia: modelo lineal primero, RandomForest si la confianza < margen
+INFERENCE_CASCADE = os.getenv('INFERENCE_CASCADE', 'false').lower() == 'true'
+CASCADE_MARGIN = float(os.getenv('CASCADE_MARGIN', 0.8))
+
+# Términos por explicación (explain=true en /api/diagnose)
+EXPLAIN_TOP_TERMS = int(os.getenv('EXPLAIN_TOP_TERMS', 10))
+
+# Cobertura mínima del vocabulario para diagnosticar (0 = solo se rechazan textos sin términos conocidos)
+MIN_VOCABULARY_COVERAGE = float(os.getenv('MIN_VOCABULARY_COVERAGE', 0.0))
+
+# Servicio de inferencia independiente: si se define, la API no carga el modelo
+INFERENCE_URL = os.getenv('INFERENCE_URL', '')
+INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', 2.0))
+INFERENCE_POOL_SIZE = int(os.getenv('INFERENCE_POOL_SIZE', 8))
+
+# Cada proceso compara la versión del modelo publicado cada MODEL_CHECK_INTERVAL segundos (0 = nunca)
+# y lo recarga si cambió; /api/model/reload exige MODEL_RELOAD_TOKEN (sin token queda deshabilitado)
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'ml_model', 'models')
+MODEL_CHECK_INTERVAL = float(os.getenv('MODEL_CHECK_INTERVAL', 30))
+MODEL_RELOAD_TOKEN = os.getenv('MODEL_RELOAD_TOKEN', '')
+
+# Índice de casos similares (segmentos en disco + delta en memoria); la marca de agua
+# solo avanza sobre diagnósticos creados hace más de SIMILARITY_SETTLE_SECONDS
+SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH', os.path.join(os.path.dirname(__file__), 'data', 'similarity'))
+SIMILARITY_FLUSH_ROWS = int(os.getenv('SIMILARITY_FLUSH_ROWS', 10000))
+SIMILARITY_SETTLE_SECONDS = int(os.getenv('SIMILARITY_SETTLE_SECONDS', 60))
+SIMILAR_MAX_K = 100
+
+# Autocompletado de síntomas: diagnósticos recientes usados para las frecuencias
+SUGGEST_HISTORY_LIMIT = int(os.getenv('SUGGEST_HISTORY_LIMIT', 100000))
+SUGGEST_MAX_LIMIT = 50
+
+# Lista de trabajo del laboratorio: pruebas por lote y segundos antes de liberar una toma sin resultados
+WORKLIST_MAX_BATCH = 100
+WORKLIST_CLAIM_TTL = int(os.getenv('WORKLIST_CLAIM_TTL', 900))
+WORKLIST_STATUSES = ('recommended', 'claimed')
+
+# Registros por página en el historial completo del paciente
+TIMELINE_MAX_PER_PAGE = 200
+
+# Retroalimentación: origen de la enfermedad confirmada
+FEEDBACK_SOURCES = ('test', 'exam', 'clinician')
+
+# Escritura diferida: pruebas de apoyo y citas se crean desde la outbox (tabla `outbox`)
+DIAGNOSIS_WRITE_BEHIND = os.getenv('DIAGNOSIS_WRITE_BEHIND', 'false').lower() == 'true'
+
+# Escritura del diagnóstico con sentencias Core (opcional; por defecto la unidad de trabajo del ORM)
+DIAGNOSIS_CORE_WRITES = os.getenv('DIAGNOSIS_CORE_WRITES', 'false').lower() == 'true'
+
+# Particionamiento mensual de diagnoses, medical_tests y appointments (solo PostgreSQL)
+PARTITION_TABLES = os.getenv('PARTITION_TABLES', 'false').lower() == 'true'
+PARTITION_PREMAKE_MONTHS = int(os.getenv('PARTITION_PREMAKE_MONTHS', 3))
+
 # Inicializar BD
 db = SQLAlchemy(app)
 
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite solo aplica las claves foráneas (y ON DELETE CASCADE) si se activan en cada conexión"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', enable_sqlite_foreign_keys)
+
 # ==================== MODELOS DE BASE DE DATOS ====================
 
+def format_blood_pressure(patient):
+    """Presión arterial como 'sistólica/diastólica'"""
+    if not patient.blood_pressure_systolic:
+        return None
+    return f"{patient.blood_pressure_systolic}/{patient.blood_pressure_diastolic}"
+
 class Patient(db.Model):
     __tablename__ = 'patients'
     
@@ -73,131 +172,144 @@ class Patient(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relaciones
-    diagnoses = db.relationship('Diagnosis', backref='patient', lazy=True, cascade='all, delete-orphan')
-    exams = db.relationship('MedicalExam', backref='patient', lazy=True, cascade='all, delete-orphan')
-    appointments = db.relationship('Appointment', backref='patient', lazy=True, cascade='all, delete-orphan')
-    
-    def to_dict(self):
-        return {
-            'cedula': self.cedula,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender,
-            'email': self.email,
-            'phone': self.phone,
-            'height': self.height,
-            'weight': self.weight,
-            'blood_pressure': f"{self.blood_pressure_systolic}/{self.blood_pressure_diastolic}" if self.blood_pressure_systolic else None,
-            'temperature': self.temperature,
-            'previous_diseases': self.previous_diseases,
-            'surgeries': self.surgeries,
-            'allergies': self.allergies,
-            'medications': self.medications,
-            'parents_health': self.parents_health,
-            'diet': self.diet,
-            'exercise': self.exercise,
-            'smokes': self.smokes,
-            'alcohol_consumption': self.alcohol_consumption,
-            'medical_history': self.medical_history,
-            'created_at': self.created_at.isoformat()
-        }
+    # La BD borra el historial (ON DELETE CASCADE); el ORM no carga las filas para eliminarlas
+    diagnoses = db.relationship('Diagnosis', backref='patient', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    exams = db.relationship('MedicalExam', backref='patient', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    appointments = db.relationship('Appointment', backref='patient', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    
+    to_dict = compile_schema(
+        'cedula', 'name', 'age', 'gender', 'email', 'phone', 'height', 'weight',
+        ('blood_pressure', format_blood_pressure),
+        'temperature', 'previous_diseases', 'surgeries', 'allergies', 'medications',
+        'parents_health', 'diet', 'exercise', 'smokes', 'alcohol_consumption',
+        'medical_history', 'created_at'
+    )
 
 class Diagnosis(db.Model):
     __tablename__ = 'diagnoses'
     
     id = db.Column(db.Integer, primary_key=True)
-    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula'), nullable=False)
+    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula', ondelete='CASCADE'), nullable=False)
     symptoms = db.Column(db.Text, nullable=False)
     symptoms_json = db.Column(db.JSON)  # Síntomas detallados con tiempo e intensidad
     predicted_disease = db.Column(db.String(255), nullable=False)
     confidence = db.Column(db.Float)
     severity = db.Column(db.String(50))
     requires_exam = db.Column(db.Boolean, default=False)
-    recommended_tests = db.Column(db.JSON)  # Pruebas recomendadas si confidence < 84%
-    medications = db.Column(db.JSON)
+    # Pruebas recomendadas (si confidence < 84%) y medicamentos: referencias a catálogos versionados
+    test_panel_id = db.Column(db.Integer, db.ForeignKey('test_panels.id'))
+    medication_set_id = db.Column(db.Integer, db.ForeignKey('medication_sets.id'))
+    # Copias JSON de filas anteriores al catálogo (migrate_catalogs.py las convierte en referencias)
+    legacy_recommended_tests = db.Column('recommended_tests', db.JSON)
+    legacy_medications = db.Column('medications', db.JSON)
+    differential = db.Column(db.JSON)  # Top-k enfermedades con su confianza
+    explanation = db.Column(db.JSON)  # Contribución de cada término (explain=true)
+    confirmed_disease = db.Column(db.String(255))  # Enfermedad confirmada (última retroalimentación)
+    confirmed_at = db.Column(db.DateTime)
     recommendations = db.Column(db.Text)
     report_generated = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relaciones
-    medical_tests = db.relationship('MedicalTest', backref='diagnosis', lazy=True, cascade='all, delete-orphan')
-    
-    def to_dict(self):
-        return {
-            'diagnosis_id': self.id,
-            'id': self.id,
-            'patient_cedula': self.patient_cedula,
-            'symptoms': self.symptoms,
-            'symptoms_detail': self.symptoms_json,
-            'predicted_disease': self.predicted_disease,
-            'confidence': self.confidence,
-            'severity': self.severity,
-            'requires_exam': self.requires_exam,
-            'recommended_tests': self.recommended_tests,
-            'medications': self.medications,
-            'recommendations': self.recommendations,
-            'report_generated': self.report_generated,
-            'created_at': self.created_at.isoformat()
-        }
+    medical_tests = db.relationship('MedicalTest', backref='diagnosis', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    
+    @property
+    def recommended_tests(self):
+        if self.test_panel_id is not None:
+            return catalog_items(TestPanel, self.test_panel_id)
+        return self.legacy_recommended_tests or []
+    
+    @property
+    def medications(self):
+        if self.medication_set_id is not None:
+            return catalog_items(MedicationSet, self.medication_set_id)
+        return self.legacy_medications or []
+    
+    to_dict = compile_schema(
+        ('diagnosis_id', 'id'), 'id', 'patient_cedula', 'symptoms',
+        ('symptoms_detail', 'symptoms_json'), 'predicted_disease', 'confidence',
+        'severity', 'requires_exam', 'recommended_tests', 'medications',
+        'differential', 'explanation', 'confirmed_disease', 'confirmed_at',
+        'recommendations', 'report_generated', 'created_at'
+    )
+
+class MedicationSet(db.Model):
+    """Medicamentos de una enfermedad según el artefacto del modelo; filas inmutables, una por versión"""
+    __tablename__ = 'medication_sets'
+    __table_args__ = (db.UniqueConstraint('name', 'version'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)  # Enfermedad
+    version = db.Column(db.String(32), nullable=False)  # Huella del contenido
+    items = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TestPanel(db.Model):
+    """Conjunto de pruebas de apoyo recomendadas; filas inmutables, una por versión"""
+    __tablename__ = 'test_panels'
+    __table_args__ = (db.UniqueConstraint('name', 'version'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    version = db.Column(db.String(32), nullable=False)
+    items = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class MedicalTest(db.Model):
     """Pruebas de apoyo recomendadas (sangre, radiografía, ecografía, etc.)"""
     __tablename__ = 'medical_tests'
     
     id = db.Column(db.Integer, primary_key=True)
-    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id'), nullable=False)
-    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula'), nullable=False)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id', ondelete='CASCADE'), nullable=False)
+    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula', ondelete='CASCADE'), nullable=False)
     test_type = db.Column(db.String(255), nullable=False)  # Análisis de sangre, Radiografía, Ecografía, etc.
     description = db.Column(db.Text)
-    status = db.Column(db.String(50), default='recommended')  # recommended, scheduled, completed
+    status = db.Column(db.String(50), default='recommended')  # recommended, claimed, scheduled, completed
     scheduled_date = db.Column(db.DateTime)
     results = db.Column(db.Text)
     requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Lista de trabajo del laboratorio: cliente que tomó la prueba y cuándo
+    claimed_by = db.Column(db.String(100))
+    claimed_at = db.Column(db.DateTime)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'diagnosis_id': self.diagnosis_id,
-            'patient_cedula': self.patient_cedula,
-            'test_type': self.test_type,
-            'description': self.description,
-            'status': self.status,
-            'scheduled_date': self.scheduled_date.isoformat() if self.scheduled_date else None,
-            'results': self.results,
-            'requested_at': self.requested_at.isoformat()
-        }
+    __table_args__ = (
+        # Índice parcial: solo las pruebas pendientes o tomadas, que es lo que recorre la lista de trabajo
+        db.Index(
+            'ix_medical_tests_worklist', 'status', 'id',
+            postgresql_where=db.text("status IN ('recommended', 'claimed')"),
+            sqlite_where=db.text("status IN ('recommended', 'claimed')")
+        ),
+    )
+    
+    to_dict = compile_schema(
+        'id', 'diagnosis_id', 'patient_cedula', 'test_type', 'description',
+        'status', 'scheduled_date', 'results', 'requested_at', 'claimed_by', 'claimed_at'
+    )
 
 class Appointment(db.Model):
     """Citas de seguimiento"""
     __tablename__ = 'appointments'
     
     id = db.Column(db.Integer, primary_key=True)
-    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula'), nullable=False)
-    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id'))
+    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula', ondelete='CASCADE'), nullable=False)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id', ondelete='SET NULL'))
     scheduled_date = db.Column(db.DateTime, nullable=False)
     reason = db.Column(db.String(255))  # Seguimiento, Evaluación de pruebas, etc.
     notes = db.Column(db.Text)
     status = db.Column(db.String(50), default='scheduled')  # scheduled, completed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'patient_cedula': self.patient_cedula,
-            'diagnosis_id': self.diagnosis_id,
-            'scheduled_date': self.scheduled_date.isoformat(),
-            'reason': self.reason,
-            'notes': self.notes,
-            'status': self.status,
-            'created_at': self.created_at.isoformat()
-        }
+    to_dict = compile_schema(
+        'id', 'patient_cedula', 'diagnosis_id', 'scheduled_date', 'reason',
+        'notes', 'status', 'created_at'
+    )
 
 class MedicalExam(db.Model):
     __tablename__ = 'medical_exams'
     
     id = db.Column(db.Integer, primary_key=True)
-    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula'), nullable=False)
-    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id'))
+    patient_cedula = db.Column(db.String(20), db.ForeignKey('patients.cedula', ondelete='CASCADE'), nullable=False)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id', ondelete='SET NULL'))
     exam_type = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     status = db.Column(db.String(50), default='pending')  # pending, scheduled, completed
@@ -205,34 +317,360 @@ class MedicalExam(db.Model):
     results = db.Column(db.Text)
     requested_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'patient_cedula': self.patient_cedula,
-            'diagnosis_id': self.diagnosis_id,
-            'exam_type': self.exam_type,
-            'description': self.description,
-            'status': self.status,
-            'appointment_date': self.appointment_date.isoformat() if self.appointment_date else None,
-            'results': self.results,
-            'requested_at': self.requested_at.isoformat()
-        }
+    to_dict = compile_schema(
+        'id', 'patient_cedula', 'diagnosis_id', 'exam_type', 'description',
+        'status', 'appointment_date', 'results', 'requested_at'
+    )
+
+class DiagnosisRescore(db.Model):
+    """Predicción de un modelo candidato sobre un diagnóstico histórico (rescore.py)"""
+    __tablename__ = 'diagnosis_rescores'
+    
+    run_id = db.Column(db.String(64), primary_key=True)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id', ondelete='CASCADE'), primary_key=True)
+    predicted_disease = db.Column(db.String(255), nullable=False)
+    confidence = db.Column(db.Float)
+    scored_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DiagnosisFeedback(db.Model):
+    """Enfermedad confirmada para un diagnóstico; registro de solo inserción que consume feedback_trainer.py"""
+    __tablename__ = 'diagnosis_feedback'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('diagnoses.id', ondelete='CASCADE'), nullable=False, index=True)
+    confirmed_disease = db.Column(db.String(255), nullable=False)
+    source = db.Column(db.String(50), default='clinician')  # test, exam, clinician
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    to_dict = compile_schema(
+        'id', 'diagnosis_id', 'confirmed_disease', 'source', 'notes', 'created_at'
+    )
+
+# Tareas de escritura diferida, encoladas en la transacción que las origina
+outbox_tasks = outbox_table(db.metadata)
+
+class ProcessedTask(db.Model):
+    """Recibo de una tarea de la outbox aplicada; la clave única hace idempotentes los reintentos"""
+    __tablename__ = 'processed_tasks'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 # ==================== CARGA DEL MODELO ====================
 
 model = None
 disease_info = None
+cascade = None
+inference_client = None
+remote_vectorizer = None
+model_version = None
+model_next_check = 0.0
+model_lock = threading.Lock()
+
+def published_model_version():
+    """Versión del modelo publicado: artefacto en disco o modelo cargado en el servicio de inferencia"""
+    if INFERENCE_URL:
+        return inference_client.health().get('model_version') if inference_client is not None else None
+    return artifact_version(MODEL_DIR, INFERENCE_BACKEND)
 
 def load_ml_model():
     """Cargar modelo ML al iniciar la aplicación"""
-    global model, disease_info
+    global model, disease_info, cascade, inference_client, remote_vectorizer, model_version
     try:
-        model_path = os.path.join(os.path.dirname(__file__), '..', 'ml_model', 'models')
-        model, disease_info = load_model(model_path)
-        logger.info("Modelo ML cargado exitosamente")
+        model_path = MODEL_DIR
+        cascade = None
+        remote_vectorizer = None
+        if INFERENCE_URL:
+            # La predicción se delega al servicio de inferencia; aquí la info de enfermedades
+            # y el TF-IDF (cobertura, autocompletado y casos similares sin cargar el bosque)
+            client = InferenceClient(INFERENCE_URL, INFERENCE_TIMEOUT, pool_size=INFERENCE_POOL_SIZE)
+            version = client.health().get('model_version')
+            disease_info = client.disease_info()
+            try:
+                remote_vectorizer = PortableTfidfVectorizer(client.vectorizer_config())
+            except InferenceServiceError as e:
+                logger.warning(f"Vocabulario del servicio de inferencia no disponible: {str(e)}")
+            inference_client = client
+            logger.info(f"Servicio de inferencia remoto: {INFERENCE_URL}")
+        elif INFERENCE_BACKEND == 'onnx':
+            # No requiere scikit-learn ni joblib en el proceso de la API
+            from onnx_export import load_onnx_model
+            version = artifact_version(model_path, INFERENCE_BACKEND)
+            model, disease_info = load_onnx_model(model_path, ONNX_INTRA_OP_THREADS)
+            logger.info(f"Backend ONNX activo ({ONNX_INTRA_OP_THREADS} hilos intra-op)")
+            if INFERENCE_CASCADE:
+                logger.warning("La cascada requiere el backend sklearn; se ignora INFERENCE_CASCADE")
+        else:
+            from train_model import load_model, load_linear_model
+            version = artifact_version(model_path, INFERENCE_BACKEND)
+            model, disease_info = load_model(model_path)
+            if INFERENCE_CASCADE:
+                linear_model = load_linear_model(model_path)
+                if linear_model is not None:
+                    cascade = CascadeClassifier(model, linear_model, CASCADE_MARGIN)
+                    logger.info(f"Cascada de inferencia activa (margen {CASCADE_MARGIN})")
+                else:
+                    logger.warning("INFERENCE_CASCADE activo pero no hay modelo lineal entrenado")
+        model_version = version
+        logger.info(f"Modelo ML cargado exitosamente (versión {version})")
     except Exception as e:
         logger.error(f"Error cargando modelo: {str(e)}")
         raise
+    
+    # Catálogo de medicamentos del artefacto recién cargado
+    try:
+        sync_catalogs()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Catálogos no sincronizados: {str(e)}")
+    
+    # El autocompletado y las explicaciones dependen del modelo: se reconstruyen con cada carga
+    get_explainer()
+    try:
+        get_symptom_suggester()
+    except Exception as e:
+        logger.warning(f"Autocompletado de síntomas no disponible: {str(e)}")
+
+def refresh_model():
+    """
+    Recargar el modelo si se publicó otra versión (train_model.py,
+    feedback_trainer.py). Cada proceso lo comprueba por su cuenta, sin
+    depender de que /api/model/reload llegue a todos los workers.
+    """
+    global model_next_check
+    if MODEL_CHECK_INTERVAL <= 0 or time.monotonic() < model_next_check:
+        return
+    if not model_lock.acquire(blocking=False):
+        return  # Otro hilo ya comprueba; este sigue con el modelo actual
+    try:
+        model_next_check = time.monotonic() + MODEL_CHECK_INTERVAL
+        if published_model_version() != model_version:
+            logger.info("Nueva versión del modelo publicada; recargando")
+            load_ml_model()
+    except Exception as e:
+        logger.error(f"No se pudo recargar el modelo publicado: {str(e)}")
+    finally:
+        model_lock.release()
+
+# ==================== EXPLICACIONES ====================
+
+explainer = None
+explainer_lock = threading.Lock()
+
+def get_explainer():
+    """Explicador del bosque cargado (estadísticas por nodo precalculadas una vez por modelo)"""
+    global explainer
+    if model is None or not hasattr(model, 'named_steps'):
+        return None  # ONNX o servicio remoto: sin acceso a los árboles
+    with explainer_lock:
+        if explainer is None or explainer.forest is not model.named_steps['clf']:
+            explainer = ForestExplainer(model)
+        return explainer
+
+# ==================== AUTOCOMPLETADO DE SÍNTOMAS ====================
+
+symptom_suggester = None
+suggester_lock = threading.Lock()
+
+def get_symptom_suggester():
+    """Índice de prefijos del vocabulario actual con frecuencias del historial reciente"""
+    global symptom_suggester
+    vectorizer = model_vectorizer()
+    if vectorizer is None:
+        return None
+    with suggester_lock:
+        if symptom_suggester is None or symptom_suggester.vectorizer is not vectorizer:
+            history = (db.session.query(Diagnosis.symptoms)
+                       .order_by(Diagnosis.id.desc())
+                       .limit(SUGGEST_HISTORY_LIMIT)
+                       .yield_per(STREAM_YIELD_PER))
+            symptom_suggester = SymptomSuggester.from_vectorizer(vectorizer, (row.symptoms for row in history))
+            logger.info(f"Autocompletado de síntomas: {len(symptom_suggester)} términos")
+        return symptom_suggester
+
+# ==================== ÍNDICE DE CASOS SIMILARES ====================
+
+similarity_index = None
+similarity_build = None
+similarity_lock = threading.Lock()
+
+def model_vectorizer():
+    """TF-IDF del modelo cargado (pipeline sklearn o tokenizador portable de ONNX o del servicio remoto)"""
+    if model is None:
+        return remote_vectorizer
+    if hasattr(model, 'named_steps'):
+        return model.named_steps['tfidf']
+    return getattr(model, 'vectorizer', None)
+
+def sync_similarity_index(index):
+    """
+    Indexar los diagnósticos por encima de la marca de agua que el índice aún
+    no tiene. Un diagnóstico puede confirmarse después de otro con id mayor
+    (transacciones concurrentes), así que la marca solo avanza sobre los
+    creados hace más de SIMILARITY_SETTLE_SECONDS; los más recientes se
+    vuelven a leer en cada sincronización y add() descarta los ya indexados.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=SIMILARITY_SETTLE_SECONDS)
+    query = (db.session.query(Diagnosis.id, Diagnosis.symptoms, Diagnosis.created_at)
+             .filter(Diagnosis.id > index.watermark)
+             .order_by(Diagnosis.id))
+    settled = index.watermark
+    settling = True
+    batch = []
+    for row in query.yield_per(STREAM_YIELD_PER):
+        batch.append(row)
+        if settling and (row.created_at is None or row.created_at <= cutoff):
+            settled = row.id
+        else:
+            settling = False
+        if len(batch) >= STREAM_YIELD_PER:
+            index.add([r.id for r in batch], [r.symptoms for r in batch])
+            batch = []
+    if batch:
+        index.add([r.id for r in batch], [r.symptoms for r in batch])
+    index.settle(settled)
+
+def build_similarity_index(vectorizer):
+    """
+    Construir y persistir el índice completo de un vectorizador. Lo ejecuta
+    un hilo en segundo plano de la API o build_similarity_index.py; si otro
+    proceso ya lo está construyendo devuelve None y el índice se carga de
+    disco cuando termine.
+    """
+    with build_lock(SIMILARITY_INDEX_PATH) as acquired:
+        if not acquired:
+            return None
+        # Continuar desde lo que haya en disco (construcción interrumpida o ya terminada)
+        index = (
+            SimilarityIndex.load(SIMILARITY_INDEX_PATH, vectorizer, SIMILARITY_FLUSH_ROWS)
+            or SimilarityIndex(vectorizer, SIMILARITY_INDEX_PATH, SIMILARITY_FLUSH_ROWS)
+        )
+        with app.app_context():
+            sync_similarity_index(index)
+        index.flush()
+    logger.info(f"Índice de casos similares construido: {len(index)} diagnósticos")
+    return index
+
+def get_similarity_index():
+    """
+    Índice del vectorizador actual cargado de disco. Si no hay uno válido (o
+    cambió el modelo) se construye en segundo plano y mientras tanto devuelve None
+    """
+    global similarity_index, similarity_build
+    vectorizer = model_vectorizer()
+    if vectorizer is None:
+        return None
+    with similarity_lock:
+        if similarity_index is None or similarity_index.vectorizer is not vectorizer:
+            similarity_index = SimilarityIndex.load(SIMILARITY_INDEX_PATH, vectorizer, SIMILARITY_FLUSH_ROWS)
+            if similarity_index is None:
+                if similarity_build is None or not similarity_build.is_alive():
+                    similarity_build = threading.Thread(target=build_similarity_index, args=(vectorizer,),
+                                                        daemon=True)
+                    similarity_build.start()
+                return None
+            logger.info(f"Índice de casos similares: {len(similarity_index)} diagnósticos en disco")
+        index = similarity_index
+    sync_similarity_index(index)
+    return index
+
+# ==================== CATÁLOGOS ====================
+
+# Pruebas de apoyo estándar cuando la confianza es < 84%
+SUPPORT_TEST_PANEL = 'apoyo_baja_confianza'
+SUPPORT_TESTS = [
+    {
+        'test_type': 'Análisis de sangre',
+        'description': 'Hemograma completo para confirmar diagnóstico'
+    },
+    {
+        'test_type': 'Radiografía',
+        'description': 'Radiografía de tórax o área afectada según síntomas'
+    },
+    {
+        'test_type': 'Ecografía',
+        'description': 'Ecografía para evaluación detallada'
+    }
+]
+
+catalog_source = None  # disease_info con el que se sincronizaron los catálogos
+medication_set_ids = {}  # enfermedad -> id de MedicationSet vigente
+support_panel_id = None
+catalog_cache = {}  # (tabla, id) -> contenido; las filas del catálogo no cambian
+catalog_lock = threading.Lock()
+
+def catalog_version(items):
+    """Versión de una entrada del catálogo: huella de su contenido"""
+    encoded = json.dumps(items, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def catalog_entry_ids(catalog, entries):
+    """
+    Ids de las entradas (nombre, contenido) de un catálogo, creando las que
+    falten. El mismo contenido siempre resuelve a la misma fila; si otro
+    proceso inserta a la vez, la restricción única gana y se vuelve a leer.
+    """
+    wanted = {(name, catalog_version(items)): items for name, items in entries}
+    if not wanted:
+        return {}
+    
+    def existing():
+        rows = db.session.query(catalog.name, catalog.version, catalog.id).filter(
+            catalog.version.in_({version for _, version in wanted})
+        )
+        return {(name, version): entry_id for name, version, entry_id in rows if (name, version) in wanted}
+    
+    ids = existing()
+    missing = [key for key in wanted if key not in ids]
+    if missing:
+        try:
+            db.session.add_all([catalog(name=name, version=version, items=wanted[(name, version)])
+                                for name, version in missing])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        ids = existing()
+    return ids
+
+def catalog_items(catalog, entry_id):
+    """Contenido de una entrada del catálogo (caché en memoria del proceso)"""
+    key = (catalog.__tablename__, entry_id)
+    items = catalog_cache.get(key)
+    if items is None:
+        entry = db.session.get(catalog, entry_id)
+        items = entry.items if entry is not None else []
+        catalog_cache[key] = items
+    return items
+
+def sync_catalogs():
+    """Registrar los medicamentos del modelo cargado y el panel de pruebas de apoyo"""
+    global catalog_source, medication_set_ids, support_panel_id
+    source = disease_info
+    with catalog_lock:
+        if catalog_source is source:
+            return
+        medications = [(disease, details.get('medications', []))
+                       for disease, details in (source or {}).items() if details.get('medications')]
+        ids = catalog_entry_ids(MedicationSet, medications)
+        panel = catalog_entry_ids(TestPanel, [(SUPPORT_TEST_PANEL, SUPPORT_TESTS)])
+        medication_set_ids = {name: entry_id for (name, _), entry_id in ids.items()}
+        support_panel_id = next(iter(panel.values()))
+        catalog_source = source
+        logger.info(f"Catálogos sincronizados: {len(medication_set_ids)} conjuntos de medicamentos")
+
+# ==================== ESCRITURA DIFERIDA ====================
+
+outbox = None
+outbox_worker = None
+
+def start_outbox_worker():
+    """Abrir la outbox de la BD e iniciar el hilo que la procesa"""
+    global outbox, outbox_worker
+    outbox = Outbox(db.engine, outbox_tasks)
+    outbox_worker = OutboxWorker(outbox, handle_outbox_task)
+    outbox_worker.start()
+    logger.info("Escritura diferida activa")
 
 # ==================== DECORADORES ====================
 
@@ -260,84 +698,249 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
-        'model_loaded': model is not None
+        'model_loaded': model is not None or inference_client is not None,
+        'model_version': model_version
     }), 200
 
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Recargar el modelo en este proceso (y los índices que dependen del
+    vocabulario); los demás procesos lo detectan por la versión publicada
+    """
+    if not MODEL_RELOAD_TOKEN:
+        return jsonify({'error': 'Recarga deshabilitada: definir MODEL_RELOAD_TOKEN'}), 403
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {MODEL_RELOAD_TOKEN}'.encode()):
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    try:
+        with model_lock:
+            load_ml_model()
+    except Exception as e:
+        return jsonify({'error': f'No se pudo recargar el modelo: {str(e)}'}), 500
+    
+    suggester = symptom_suggester if model_vectorizer() is not None else None
+    return jsonify({
+        'status': 'reloaded',
+        'vocabulary_size': len(suggester) if suggester is not None else None
+    }), 200
+
+@app.route('/api/symptoms/suggest', methods=['GET'])
+def suggest_symptoms():
+    """Autocompletar síntomas con términos del vocabulario del modelo"""
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', 10, type=int)
+    if not prefix.strip():
+        return jsonify({'error': 'prefix requerido'}), 400
+    if not 1 <= limit <= SUGGEST_MAX_LIMIT:
+        return jsonify({'error': f'limit debe estar entre 1 y {SUGGEST_MAX_LIMIT}'}), 400
+    
+    suggester = get_symptom_suggester()
+    if suggester is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': suggester.suggest(prefix, limit)
+    }), 200
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas de inferencia de este proceso"""
+    values = metrics.snapshot()
+    
+    linear = values.get('inference_linear_count', 0)
+    forest = values.get('inference_forest_count', 0)
+    total = linear + forest
+    forest_mean = values['inference_forest_seconds'] / forest if forest else None
+    linear_mean = values['inference_linear_seconds'] / linear if linear else None
+    
+    values['cascade'] = {
+        'enabled': cascade is not None,
+        'margin': cascade.margin if cascade is not None else None,
+        'requests': total,
+        'escalation_rate': forest / total if total and cascade is not None else None,
+        # Tiempo ahorrado estimado: peticiones resueltas por la etapa lineal
+        # multiplicadas por la diferencia media de latencia respecto al bosque
+        'estimated_seconds_saved': linear * (forest_mean - linear_mean) if forest_mean and linear_mean else None
+    }
+    
+    terms = values.get('input_terms', 0)
+    values['input_quality'] = {
+        'checked': values.get('input_checked', 0),
+        'out_of_vocabulary': values.get('input_out_of_vocabulary', 0),
+        'insufficient_information': values.get('diagnose_insufficient_information', 0),
+        'mean_coverage': values.get('input_known_terms', 0) / terms if terms else None
+    }
+    return jsonify(values), 200
+
 # -------- Endpoints de Pacientes --------
 
+PATIENT_TEXT_FIELDS = (
+    'gender', 'phone', 'previous_diseases', 'surgeries', 'allergies', 'medications',
+    'parents_health', 'diet', 'exercise', 'alcohol_consumption', 'medical_history'
+)
+PATIENT_NUMERIC_FIELDS = (
+    'height', 'weight', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'temperature'
+)
+
+def validate_patient(data):
+    """Mensaje de error para un registro de paciente inválido (None si es válido)"""
+    # Validar datos requeridos
+    if not all(k in data for k in ['cedula', 'name', 'age', 'email']):
+        return 'Datos incompletos: cedula, name, age, email requeridos'
+    
+    # Validar que los campos no estén vacíos
+    if not data['cedula'] or not str(data['cedula']).strip():
+        return 'La cédula no puede estar vacía'
+    if not data['name'] or not str(data['name']).strip():
+        return 'El nombre no puede estar vacío'
+    if not data['email'] or not str(data['email']).strip():
+        return 'El email no puede estar vacío'
+    if not data['age'] or data['age'] < 1 or data['age'] > 120:
+        return 'La edad debe ser un número entre 1 y 120'
+    return None
+
+def patient_values(data):
+    """Columnas de un paciente a partir del JSON recibido (textos sin espacios extremos)"""
+    values = {
+        'cedula': str(data['cedula']).strip(),
+        'name': data['name'].strip(),
+        'age': int(data['age']),
+        'email': data['email'].strip(),
+        'smokes': data.get('smokes', False),
+    }
+    for field in PATIENT_TEXT_FIELDS:
+        values[field] = data[field].strip() if data.get(field) else None
+    for field in PATIENT_NUMERIC_FIELDS:
+        values[field] = data.get(field)
+    return values
+
+# INSERT con ON CONFLICT según el dialecto
+DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def patient_conflict_error(values):
+    """Restricción que violó un registro: la cédula (clave primaria) o el email único"""
+    if db.session.get(Patient, values['cedula']) is not None:
+        return 'Paciente con esta cédula ya existe'
+    return 'Ya existe un paciente registrado con este email'
+
+def insert_patient(values):
+    """
+    Crear el paciente en una sola sentencia; las restricciones de la tabla
+    detectan duplicados sin consultas previas. Devuelve la fila creada o None
+    si la cédula o el email ya existen.
+    """
+    table = Patient.__table__
+    insert = DIALECT_INSERTS.get(db.engine.dialect.name)
+    if insert is None:
+        statement = table.insert().values(values).returning(*table.c)
+    else:
+        statement = insert(table).values(values).on_conflict_do_nothing().returning(*table.c)
+    try:
+        row = db.session.execute(statement).first()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    db.session.commit()
+    return row
+
+def upsert_patient(values):
+    """
+    Crear o reemplazar el registro completo de un paciente por cédula en una
+    sola sentencia. Devuelve (fila, creado); un email de otro paciente lanza
+    IntegrityError.
+    """
+    table = Patient.__table__
+    now = datetime.utcnow()
+    values = dict(values, created_at=now, updated_at=now)
+    changes = {name: value for name, value in values.items() if name not in ('cedula', 'created_at')}
+    statement = (DIALECT_INSERTS[db.engine.dialect.name](table).values(values)
+                 .on_conflict_do_update(index_elements=[table.c.cedula], set_=changes)
+                 .returning(*table.c))
+    row = db.session.execute(statement).first()
+    db.session.commit()
+    return row, row.created_at == now
+
 @app.route('/api/patients', methods=['POST'])
 def create_patient():
     """Crear nuevo paciente"""
     try:
         data = request.json
         
-        # Validar datos requeridos
-        if not all(k in data for k in ['cedula', 'name', 'age', 'email']):
-            return jsonify({'error': 'Datos incompletos: cedula, name, age, email requeridos'}), 400
-        
-        # Validar que los campos no estén vacíos
-        if not data['cedula'] or not str(data['cedula']).strip():
-            return jsonify({'error': 'La cédula no puede estar vacía'}), 400
-        if not data['name'] or not str(data['name']).strip():
-            return jsonify({'error': 'El nombre no puede estar vacío'}), 400
-        if not data['email'] or not str(data['email']).strip():
-            return jsonify({'error': 'El email no puede estar vacío'}), 400
-        if not data['age'] or data['age'] < 1 or data['age'] > 120:
-            return jsonify({'error': 'La edad debe ser un número entre 1 y 120'}), 400
-        
-        # Validar cedula format
-        cedula_str = str(data['cedula']).strip()
-        
-        # Verificar si el paciente ya existe por cédula
-        existing_cedula = Patient.query.get(cedula_str)
-        if existing_cedula:
-            return jsonify({'error': 'Paciente con esta cédula ya existe'}), 400
-        
-        # Verificar si el email ya existe
-        existing_email = Patient.query.filter_by(email=data['email'].strip()).first()
-        if existing_email:
-            return jsonify({'error': 'Ya existe un paciente registrado con este email'}), 400
-        
-        patient = Patient(
-            cedula=cedula_str,
-            name=data['name'].strip(),
-            age=int(data['age']),
-            gender=data.get('gender', '').strip() if data.get('gender') else None,
-            email=data['email'].strip(),
-            phone=data.get('phone', '').strip() if data.get('phone') else None,
-            # Datos vitales
-            height=data.get('height'),
-            weight=data.get('weight'),
-            blood_pressure_systolic=data.get('blood_pressure_systolic'),
-            blood_pressure_diastolic=data.get('blood_pressure_diastolic'),
-            temperature=data.get('temperature'),
-            # Antecedentes médicos
-            previous_diseases=data.get('previous_diseases', '').strip() if data.get('previous_diseases') else None,
-            surgeries=data.get('surgeries', '').strip() if data.get('surgeries') else None,
-            allergies=data.get('allergies', '').strip() if data.get('allergies') else None,
-            medications=data.get('medications', '').strip() if data.get('medications') else None,
-            # Historia familiar
-            parents_health=data.get('parents_health', '').strip() if data.get('parents_health') else None,
-            # Estilo de vida
-            diet=data.get('diet', '').strip() if data.get('diet') else None,
-            exercise=data.get('exercise', '').strip() if data.get('exercise') else None,
-            smokes=data.get('smokes', False),
-            alcohol_consumption=data.get('alcohol_consumption', '').strip() if data.get('alcohol_consumption') else None,
-            # Otros datos
-            medical_history=data.get('medical_history', '').strip() if data.get('medical_history') else None
-        )
+        error = validate_patient(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        db.session.add(patient)
-        db.session.commit()
+        values = patient_values(data)
+        row = insert_patient(values)
+        if row is None:
+            return jsonify({'error': patient_conflict_error(values)}), 400
         
-        logger.info(f"Paciente creado: {patient.cedula}")
-        return jsonify(patient.to_dict()), 201
+        logger.info(f"Paciente creado: {row.cedula}")
+        return jsonify(Patient.to_dict(row)), 201
         
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error creando paciente: {str(e)}")
         return jsonify({'error': f'Error al crear paciente: {str(e)}'}), 500
 
+@app.route('/api/patients/<cedula>', methods=['PUT'])
+def put_patient(cedula):
+    """Crear o reemplazar el registro completo de un paciente (integraciones que reenvían registros)"""
+    try:
+        data = dict(request.json, cedula=request.json.get('cedula', cedula))
+        
+        error = validate_patient(data)
+        if error:
+            return jsonify({'error': error}), 400
+        if str(data['cedula']).strip() != cedula:
+            return jsonify({'error': 'La cédula del cuerpo no coincide con la de la URL'}), 400
+        
+        try:
+            row, created = upsert_patient(patient_values(data))
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Ya existe un paciente registrado con este email'}), 400
+        
+        logger.info(f"Paciente {'creado' if created else 'actualizado'}: {row.cedula}")
+        return jsonify(Patient.to_dict(row)), 201 if created else 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error guardando paciente: {str(e)}")
+        return jsonify({'error': f'Error al guardar paciente: {str(e)}'}), 500
+
+def delete_patients(cedulas):
+    """
+    Eliminar pacientes con todo su historial. Un DELETE sobre patients y la BD
+    borra el resto por ON DELETE CASCADE, sin importar cuántos registros
+    tenga cada paciente. Devuelve el número de pacientes eliminados.
+    """
+    if PARTITION_TABLES and db.engine.dialect.name == 'postgresql':
+        # Con diagnoses particionada no hay claves foráneas hacia ella (ver partitioning.py)
+        diagnosis_ids = select(Diagnosis.id).where(Diagnosis.patient_cedula.in_(cedulas))
+        for table in (DiagnosisFeedback.__table__, DiagnosisRescore.__table__):
+            db.session.execute(table.delete().where(table.c.diagnosis_id.in_(diagnosis_ids)))
+    result = db.session.execute(Patient.__table__.delete().where(Patient.__table__.c.cedula.in_(cedulas)))
+    db.session.commit()
+    return result.rowcount
+
+@app.route('/api/patients/<cedula>', methods=['DELETE'])
+def delete_patient(cedula):
+    """Eliminar un paciente y todo su historial (diagnósticos, pruebas, exámenes y citas)"""
+    try:
+        if not delete_patients([cedula]):
+            return jsonify({'error': 'Paciente no encontrado'}), 404
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error eliminando paciente: {str(e)}")
+        return jsonify({'error': f'Error al eliminar paciente: {str(e)}'}), 500
+    
+    logger.info(f"Paciente eliminado: {cedula}")
+    return jsonify({'message': 'Paciente eliminado', 'cedula': cedula}), 200
+
 @app.route('/api/patients/<cedula>', methods=['GET'])
 def get_patient(cedula):
     """Obtener información del paciente"""
@@ -364,27 +967,244 @@ def list_patients():
 
 # -------- Endpoints de Diagnóstico --------
 
+def predict_probabilities(symptoms):
+    """Vector de probabilidades para un texto y etapa que respondió ('forest' o 'linear')"""
+    start = time.perf_counter()
+    if cascade is None:
+        probabilities = model.predict_proba([symptoms])[0]
+        metrics.observe('inference_forest', time.perf_counter() - start)
+        return probabilities, model.classes_, 'forest'
+    
+    probabilities, escalated = cascade.predict_proba_with_stage([symptoms])
+    stage = 'forest' if escalated[0] else 'linear'
+    metrics.observe(f'inference_{stage}', time.perf_counter() - start)
+    return probabilities[0], cascade.classes_, stage
+
+def record_input_quality(input_quality):
+    """Acumular estadísticas de cobertura del vocabulario"""
+    metrics.increment('input_checked')
+    metrics.increment('input_terms', input_quality['terms'])
+    metrics.increment('input_known_terms', input_quality['known_terms'])
+    if input_quality['known_terms'] == 0:
+        metrics.increment('input_out_of_vocabulary')
+
+def insufficient_information(input_quality):
+    """Respuesta 422 si los síntomas no tienen (suficientes) términos del vocabulario; None si bastan"""
+    record_input_quality(input_quality)
+    if input_quality['known_terms'] > 0 and input_quality['coverage'] >= MIN_VOCABULARY_COVERAGE:
+        return None
+    metrics.increment('diagnose_insufficient_information')
+    return jsonify({
+        'status': 'insufficient_information',
+        'error': 'Información insuficiente: los síntomas no contienen términos reconocidos por el modelo',
+        'input_quality': input_quality
+    }), 422
+
+def predict_differential(symptoms, k, explain=False):
+    """
+    Diagnóstico diferencial top-k y explicación de la enfermedad predicha (si
+    se pide), local o vía servicio de inferencia. El servicio también devuelve
+    la cobertura del vocabulario (None en local); sin términos conocidos su
+    diferencial viene vacío.
+    """
+    if inference_client is None:
+        probabilities, classes, stage = predict_probabilities(symptoms)
+        differential = top_k_diseases(probabilities, classes, k)
+        explanation = explain_prediction(symptoms, differential[0]['disease'], stage) if explain else None
+        return differential, explanation, None
+    
+    start = time.perf_counter()
+    result = inference_client.infer([symptoms], k, explain, EXPLAIN_TOP_TERMS)
+    metrics.observe('inference_remote', time.perf_counter() - start)
+    explanation = result['explanations'][0] if explain else None
+    return result['predictions'][0], explanation, result['input_quality'][0]
+
+def explain_prediction(symptoms, disease, stage):
+    """Contribución de cada término a la enfermedad predicha, según la etapa que respondió"""
+    start = time.perf_counter()
+    if stage == 'linear':
+        explanation = explain_linear(cascade.linear_model, cascade.vectorizer, [symptoms], [disease], EXPLAIN_TOP_TERMS)[0]
+    else:
+        explainer = get_explainer()
+        if explainer is None:
+            return None
+        explanation = explainer.explain([symptoms], [disease], EXPLAIN_TOP_TERMS)[0]
+    metrics.observe('explain', time.perf_counter() - start)
+    return explanation
+
+def support_rows(diagnosis_id, patient_cedula, recommended_tests, follow_up_date):
+    """Valores de las pruebas de apoyo y de la cita de seguimiento de un diagnóstico"""
+    tests = [
+        {
+            'diagnosis_id': diagnosis_id,
+            'patient_cedula': patient_cedula,
+            'test_type': test['test_type'],
+            'description': test['description'],
+            'status': 'recommended'
+        }
+        for test in recommended_tests
+    ]
+    # Cita de seguimiento para revisar pruebas
+    appointment = {
+        'patient_cedula': patient_cedula,
+        'diagnosis_id': diagnosis_id,
+        'scheduled_date': follow_up_date,
+        'reason': 'Evaluación de pruebas de apoyo',
+        'status': 'scheduled'
+    }
+    return tests, appointment
+
+def add_support_records(diagnosis_id, patient_cedula, recommended_tests, follow_up_date):
+    """Agregar a la sesión las pruebas de apoyo y la cita de seguimiento"""
+    tests, appointment = support_rows(diagnosis_id, patient_cedula, recommended_tests, follow_up_date)
+    db.session.add_all([MedicalTest(**test) for test in tests])
+    db.session.add(Appointment(**appointment))
+
+def write_diagnosis_orm(values, recommended_tests, follow_up_date, deferred=False):
+    """
+    Diagnóstico (y pruebas de apoyo y cita si hay) mediante la unidad de
+    trabajo del ORM. Con `deferred` las pruebas y la cita no se escriben:
+    se encola su tarea en la misma transacción.
+    """
+    diagnosis = Diagnosis(**values)
+    db.session.add(diagnosis)
+    db.session.flush()  # Para obtener el ID antes de commit
+    if recommended_tests and deferred:
+        queue_support_records(db.session.connection(), diagnosis.id, values['patient_cedula'],
+                              recommended_tests, follow_up_date)
+    elif recommended_tests:
+        add_support_records(diagnosis.id, values['patient_cedula'], recommended_tests, follow_up_date)
+    db.session.commit()
+    return diagnosis.id
+
+def column_values(model, values):
+    """Atributos del modelo a columnas de su tabla; los None se omiten (NULL o default de la columna)"""
+    columns = model.__mapper__.column_attrs
+    return {columns[key].columns[0].key: value for key, value in values.items() if value is not None}
+
+def write_diagnosis_core(values, recommended_tests, follow_up_date, deferred=False):
+    """
+    Mismo resultado que write_diagnosis_orm con sentencias Core en la
+    transacción de la sesión: INSERT ... RETURNING id del diagnóstico y un
+    INSERT de varias filas para las pruebas, sin construir objetos ORM ni
+    un flush intermedio.
+    """
+    conn = db.session.connection()
+    statement = Diagnosis.__table__.insert().values(column_values(Diagnosis, values))
+    if conn.dialect.insert_returning:
+        diagnosis_id = conn.execute(statement.returning(Diagnosis.__table__.c.id)).scalar_one()
+    else:
+        diagnosis_id = conn.execute(statement).inserted_primary_key[0]
+    if recommended_tests and deferred:
+        queue_support_records(conn, diagnosis_id, values['patient_cedula'], recommended_tests, follow_up_date)
+    elif recommended_tests:
+        tests, appointment = support_rows(diagnosis_id, values['patient_cedula'], recommended_tests, follow_up_date)
+        conn.execute(MedicalTest.__table__.insert().values(tests))
+        conn.execute(Appointment.__table__.insert().values(appointment))
+    db.session.commit()
+    return diagnosis_id
+
+def support_records_key(diagnosis_id):
+    return f'support_records:{diagnosis_id}'
+
+def queue_support_records(conn, diagnosis_id, patient_cedula, recommended_tests, follow_up_date):
+    """Encolar la creación de pruebas y cita en la transacción de `conn` (la del diagnóstico)"""
+    outbox.enqueue(conn, support_records_key(diagnosis_id), 'support_records', {
+        'diagnosis_id': diagnosis_id,
+        'patient_cedula': patient_cedula,
+        'recommended_tests': recommended_tests,
+        'follow_up_date': follow_up_date.isoformat()
+    })
+
+def handle_outbox_task(kind, payload):
+    """
+    Procesar una tarea de la outbox. El recibo de la tarea se inserta con
+    ON CONFLICT DO NOTHING en la misma transacción que los registros: si un
+    intento anterior ya confirmó, el recibo existe y no se duplica nada.
+    """
+    if kind != 'support_records':
+        raise ValueError(f'Tipo de tarea desconocido: {kind}')
+    
+    with app.app_context():
+        diagnosis_id = payload['diagnosis_id']
+        if db.session.get(Diagnosis, diagnosis_id) is None:
+            logger.warning(f"Diagnóstico {diagnosis_id} no existe; tarea descartada")
+            return
+        
+        receipt = (DIALECT_INSERTS[db.engine.dialect.name](ProcessedTask.__table__)
+                   .values(key=support_records_key(diagnosis_id), processed_at=datetime.utcnow())
+                   .on_conflict_do_nothing())
+        try:
+            if db.session.execute(receipt).rowcount == 0:
+                db.session.rollback()
+                return
+            add_support_records(
+                diagnosis_id,
+                payload['patient_cedula'],
+                payload['recommended_tests'],
+                datetime.fromisoformat(payload['follow_up_date'])
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
 @app.route('/api/diagnose', methods=['POST'])
 @require_patient_cedula
 def diagnose_patient():
     """Realizar diagnóstico basado en síntomas"""
     try:
-        if model is None:
+        if model is None and inference_client is None and INFERENCE_URL:
+            # El servicio de inferencia pudo no estar listo al iniciar la API
+            try:
+                load_ml_model()
+            except Exception:
+                pass
+        if model is None and inference_client is None:
             return jsonify({'error': 'Modelo no disponible'}), 503
         
         data = request.json
         patient_cedula = data.get('patient_cedula')
         symptoms = data.get('symptoms', '')
         symptoms_detail = data.get('symptoms_detail', [])  # Síntomas detallados con tiempo e intensidad
+        top_k = data.get('top_k', 0)  # Diagnóstico diferencial opcional
+        explain = data.get('explain', request.args.get('explain', 'false').lower() == 'true')
         
         if not symptoms:
             return jsonify({'error': 'Síntomas requeridos'}), 400
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 0 <= top_k <= MAX_TOP_K:
+            return jsonify({'error': f'top_k debe ser un entero entre 0 y {MAX_TOP_K}'}), 400
+        if not isinstance(explain, bool):
+            return jsonify({'error': 'explain debe ser booleano'}), 400
         
-        # Predicción
-        predicted_disease = model.predict([symptoms])[0]
-        probabilities = model.predict_proba([symptoms])[0]
-        max_confidence = float(max(probabilities))
-        confidence_percent = round(max_confidence * 100, 2)
+        # Calidad de la entrada: sin términos del vocabulario el vector TF-IDF es cero
+        input_quality = None
+        vectorizer = model_vectorizer()
+        if vectorizer is not None:
+            input_quality = vocabulary_coverage(vectorizer, symptoms)
+            rejected = insufficient_information(input_quality)
+            if rejected is not None:
+                return rejected
+        
+        # Predicción (una sola pasada de predict_proba)
+        try:
+            differential, explanation, remote_quality = predict_differential(
+                symptoms, max(top_k, DIFFERENTIAL_TOP_K, 1), explain
+            )
+        except InferenceServiceError as e:
+            logger.error(f"Servicio de inferencia no disponible: {str(e)}")
+            return jsonify({'error': 'Servicio de inferencia no disponible'}), 503
+        
+        # Con el servicio remoto la cobertura la calcula el servicio, que no ejecuta el bosque si es nula
+        if input_quality is None and remote_quality is not None:
+            input_quality = remote_quality
+            rejected = insufficient_information(input_quality)
+            if rejected is not None:
+                return rejected
+        predicted_disease = differential[0]['disease']
+        confidence_percent = differential[0]['confidence']
         
         # Información de la enfermedad
         disease_details = disease_info.get(predicted_disease, {
@@ -395,27 +1215,15 @@ def diagnose_patient():
         
         # Determinar si se requieren pruebas de apoyo (si confianza < 84%)
         requires_support_tests = confidence_percent < 84
-        recommended_tests = []
+        recommended_tests = SUPPORT_TESTS if requires_support_tests else []
         
-        if requires_support_tests:
-            # Recomendar pruebas de apoyo estándar
-            recommended_tests = [
-                {
-                    'test_type': 'Análisis de sangre',
-                    'description': 'Hemograma completo para confirmar diagnóstico'
-                },
-                {
-                    'test_type': 'Radiografía',
-                    'description': 'Radiografía de tórax o área afectada según síntomas'
-                },
-                {
-                    'test_type': 'Ecografía',
-                    'description': 'Ecografía para evaluación detallada'
-                }
-            ]
+        # Medicamentos y pruebas se guardan como referencias al catálogo
+        sync_catalogs()
+        medications = disease_details.get('medications', [])
+        medication_set_id = medication_set_ids.get(predicted_disease)
         
         # Crear diagnóstico en BD
-        diagnosis = Diagnosis(
+        values = dict(
             patient_cedula=patient_cedula,
             symptoms=symptoms,
             symptoms_json=symptoms_detail,
@@ -423,50 +1231,40 @@ def diagnose_patient():
             confidence=confidence_percent,
             severity=disease_details.get('severity', 'Desconocida'),
             requires_exam=disease_details.get('exam_needed', False) or requires_support_tests,
-            recommended_tests=recommended_tests,
-            medications=disease_details.get('medications', [])
+            test_panel_id=support_panel_id if requires_support_tests else None,
+            medication_set_id=medication_set_id,
+            # Enfermedad sin entrada en el catálogo (p. ej. información remota nueva)
+            legacy_medications=medications if medications and medication_set_id is None else None,
+            differential=differential,
+            explanation=explanation
         )
+        follow_up_date = datetime.utcnow() + timedelta(days=7)
         
-        db.session.add(diagnosis)
-        db.session.flush()  # Para obtener el ID antes de commit
-        
-        # Crear pruebas de apoyo si confianza < 84%
-        if requires_support_tests:
-            for test in recommended_tests:
-                medical_test = MedicalTest(
-                    diagnosis_id=diagnosis.id,
-                    patient_cedula=patient_cedula,
-                    test_type=test['test_type'],
-                    description=test['description'],
-                    status='recommended'
-                )
-                db.session.add(medical_test)
-            
-            # Programar cita de seguimiento para revisar pruebas
-            follow_up_date = datetime.utcnow() + timedelta(days=7)
-            appointment = Appointment(
-                patient_cedula=patient_cedula,
-                diagnosis_id=diagnosis.id,
-                scheduled_date=follow_up_date,
-                reason='Evaluación de pruebas de apoyo',
-                status='scheduled'
-            )
-            db.session.add(appointment)
-        
-        db.session.commit()
+        # Con outbox las pruebas y la cita se encolan en la transacción del diagnóstico
+        write_diagnosis = write_diagnosis_core if DIAGNOSIS_CORE_WRITES else write_diagnosis_orm
+        diagnosis_id = write_diagnosis(values, recommended_tests, follow_up_date, deferred=outbox is not None)
         
         response = {
-            'diagnosis_id': diagnosis.id,
+            'diagnosis_id': diagnosis_id,
             'patient_cedula': patient_cedula,
             'symptoms': symptoms,
             'predicted_disease': predicted_disease,
             'confidence': confidence_percent,
-            'severity': diagnosis.severity,
-            'requires_exam': diagnosis.requires_exam,
-            'medications': diagnosis.medications,
+            'severity': values['severity'],
+            'requires_exam': values['requires_exam'],
+            'medications': medications,
             'message': 'Diagnóstico completado'
         }
         
+        if top_k:
+            response['differential'] = differential[:top_k]
+        
+        if input_quality is not None:
+            response['input_quality'] = input_quality
+        
+        if explain:
+            response['explanation'] = values['explanation']
+        
         if requires_support_tests:
             response['low_confidence'] = True
             response['confidence_message'] = f'Confiabilidad {confidence_percent}% < 84%. Se requieren pruebas de apoyo.'
@@ -558,6 +1356,97 @@ def get_patient_exams(cedula):
     exams = MedicalExam.query.filter_by(patient_cedula=cedula).all()
     return jsonify([exam.to_dict() for exam in exams]), 200
 
+# -------- Lista de trabajo del laboratorio --------
+
+def claim_statement(dialect_name, worker, limit, test_types=None, now=None):
+    """
+    UPDATE ... WHERE id IN (SELECT ... LIMIT n) RETURNING: toma en una sola
+    sentencia hasta `limit` pruebas pendientes (o con la toma vencida). En
+    PostgreSQL la subconsulta usa FOR UPDATE SKIP LOCKED y cada cliente salta
+    las filas que otro está tomando en vez de esperarlas; SQLite serializa
+    las escrituras, así que la misma sentencia ya es atómica.
+    """
+    table = MedicalTest.__table__
+    now = now or datetime.utcnow()
+    expired = now - timedelta(seconds=WORKLIST_CLAIM_TTL)
+    # La condición del índice parcial, literal, para que el planificador lo use
+    pending = select(table.c.id).where(table.c.status.in_(WORKLIST_STATUSES), or_(
+        table.c.status == 'recommended',
+        and_(table.c.status == 'claimed', table.c.claimed_at < expired)
+    ))
+    if test_types:
+        pending = pending.where(table.c.test_type.in_(test_types))
+    pending = pending.order_by(table.c.id).limit(limit)
+    if dialect_name == 'postgresql':
+        pending = pending.with_for_update(skip_locked=True)
+    return (table.update()
+            .where(table.c.id.in_(pending.scalar_subquery()))
+            .values(status='claimed', claimed_by=worker, claimed_at=now)
+            .returning(*table.c))
+
+@app.route('/api/worklist/claim', methods=['POST'])
+def claim_worklist():
+    """Tomar un lote de pruebas pendientes para un cliente del laboratorio"""
+    data = request.json or {}
+    worker = data.get('worker')
+    limit = data.get('limit', 10)
+    test_types = data.get('test_types')
+    if not isinstance(worker, str) or not worker.strip():
+        return jsonify({'error': 'worker requerido'}), 400
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= WORKLIST_MAX_BATCH:
+        return jsonify({'error': f'limit debe estar entre 1 y {WORKLIST_MAX_BATCH}'}), 400
+    if test_types is not None and not isinstance(test_types, list):
+        return jsonify({'error': 'test_types debe ser una lista'}), 400
+    
+    try:
+        rows = db.session.execute(claim_statement(db.engine.dialect.name, worker.strip(), limit, test_types)).all()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error tomando pruebas: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'worker': worker.strip(),
+        'tests': [MedicalTest.to_dict(row) for row in sorted(rows, key=lambda row: row.id)]
+    }), 200
+
+@app.route('/api/worklist/results', methods=['POST'])
+def submit_worklist_results():
+    """Registrar en bloque los resultados de pruebas tomadas por el cliente y completarlas"""
+    data = request.json or {}
+    worker = data.get('worker')
+    results = data.get('results')
+    if not isinstance(worker, str) or not worker.strip():
+        return jsonify({'error': 'worker requerido'}), 400
+    if not isinstance(results, list) or not 1 <= len(results) <= WORKLIST_MAX_BATCH:
+        return jsonify({'error': f'results debe ser una lista de 1 a {WORKLIST_MAX_BATCH} elementos'}), 400
+    if not all(isinstance(r, dict) and isinstance(r.get('id'), int) and isinstance(r.get('results'), str)
+               for r in results):
+        return jsonify({'error': 'Cada resultado requiere id (entero) y results (texto)'}), 400
+    
+    by_id = {r['id']: r['results'] for r in results}
+    table = MedicalTest.__table__
+    # Una sentencia: solo cambian las pruebas que este cliente tiene tomadas
+    statement = (table.update()
+                 .where(table.c.id.in_(list(by_id)), table.c.status == 'claimed',
+                        table.c.claimed_by == worker.strip())
+                 .values(status='completed', results=case(by_id, value=table.c.id))
+                 .returning(table.c.id))
+    try:
+        completed = sorted(row.id for row in db.session.execute(statement))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error registrando resultados: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'completed': completed,
+        # No tomadas por este cliente (otra toma, toma vencida o ya completadas)
+        'rejected': sorted(set(by_id) - set(completed))
+    }), 200
+
 # -------- Endpoints de Reportes --------
 
 @app.route('/api/diagnoses/<int:diagnosis_id>/report', methods=['GET'])
@@ -712,6 +1601,121 @@ def generate_report(diagnosis_id):
         logger.error(f"Error generando PDF: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/diagnoses/<int:diagnosis_id>/differential', methods=['GET'])
+def get_diagnosis_differential(diagnosis_id):
+    """Obtener diagnóstico diferencial guardado (sin nueva inferencia)"""
+    diagnosis = Diagnosis.query.get(diagnosis_id)
+    if not diagnosis:
+        return jsonify({'error': 'Diagnóstico no encontrado'}), 404
+    
+    differential = diagnosis.differential or []
+    k = request.args.get('k', len(differential), type=int)
+    
+    return jsonify({
+        'diagnosis_id': diagnosis.id,
+        'predicted_disease': diagnosis.predicted_disease,
+        'differential': differential[:max(k, 0)]
+    }), 200
+
+@app.route('/api/diagnoses/<int:diagnosis_id>/feedback', methods=['POST'])
+def add_diagnosis_feedback(diagnosis_id):
+    """Registrar la enfermedad confirmada por pruebas, exámenes o criterio clínico"""
+    diagnosis = db.session.get(Diagnosis, diagnosis_id)
+    if diagnosis is None:
+        return jsonify({'error': 'Diagnóstico no encontrado'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    confirmed_disease = data.get('confirmed_disease')
+    source = data.get('source', 'clinician')
+    if not isinstance(confirmed_disease, str) or not confirmed_disease.strip():
+        return jsonify({'error': 'confirmed_disease requerido'}), 400
+    confirmed_disease = confirmed_disease.strip()
+    if source not in FEEDBACK_SOURCES:
+        return jsonify({'error': f"source debe ser uno de: {', '.join(FEEDBACK_SOURCES)}"}), 400
+    # El reentrenamiento incremental no puede agregar clases nuevas al modelo
+    if disease_info and confirmed_disease not in disease_info:
+        return jsonify({'error': f'Enfermedad desconocida para el modelo: {confirmed_disease}'}), 400
+    
+    try:
+        feedback = DiagnosisFeedback(
+            diagnosis_id=diagnosis_id,
+            confirmed_disease=confirmed_disease,
+            source=source,
+            notes=data.get('notes')
+        )
+        db.session.add(feedback)
+        diagnosis.confirmed_disease = confirmed_disease
+        diagnosis.confirmed_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error registrando retroalimentación: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    metrics.increment('feedback_received')
+    if confirmed_disease != diagnosis.predicted_disease:
+        metrics.increment('feedback_disagreements')
+    
+    response = feedback.to_dict()
+    response['predicted_disease'] = diagnosis.predicted_disease
+    response['agrees'] = confirmed_disease == diagnosis.predicted_disease
+    return jsonify(response), 201
+
+def similar_cases_response(symptoms, k, exclude=None):
+    """Respuesta con los k diagnósticos históricos más similares a un texto"""
+    if not 1 <= k <= SIMILAR_MAX_K:
+        return jsonify({'error': f'k debe estar entre 1 y {SIMILAR_MAX_K}'}), 400
+    
+    if model_vectorizer() is None:
+        return jsonify({'error': 'Modelo no disponible'}), 503
+    index = get_similarity_index()
+    if index is None:
+        return jsonify({'error': 'Índice de casos similares en construcción'}), 503
+    
+    matches = index.query(symptoms, k, exclude=exclude)
+    rows = {d.id: d for d in Diagnosis.query.filter(Diagnosis.id.in_([i for i, _ in matches])).all()} if matches else {}
+    
+    return jsonify({
+        'k': k,
+        'similar': [
+            {**rows[diagnosis_id].to_dict(), 'similarity': round(score, 4)}
+            for diagnosis_id, score in matches if diagnosis_id in rows
+        ]
+    }), 200
+
+@app.route('/api/diagnoses/<int:diagnosis_id>/similar', methods=['GET'])
+def get_similar_diagnoses(diagnosis_id):
+    """Casos históricos más similares a un diagnóstico"""
+    diagnosis = Diagnosis.query.get(diagnosis_id)
+    if not diagnosis:
+        return jsonify({'error': 'Diagnóstico no encontrado'}), 404
+    
+    k = request.args.get('k', 5, type=int)
+    return similar_cases_response(diagnosis.symptoms, k, exclude=diagnosis.id)
+
+@app.route('/api/diagnoses/similar', methods=['GET'])
+def search_similar_diagnoses():
+    """Casos históricos más similares a un texto de síntomas"""
+    symptoms = request.args.get('symptoms', '')
+    if not symptoms:
+        return jsonify({'error': 'Síntomas requeridos'}), 400
+    
+    k = request.args.get('k', 5, type=int)
+    return similar_cases_response(symptoms, k)
+
+def parse_date_range(args):
+    """Parámetros `since` (inclusive) y `until` (exclusivo) en formato ISO"""
+    bounds = []
+    for name in ('since', 'until'):
+        value = args.get(name)
+        try:
+            bounds.append(datetime.fromisoformat(value) if value else None)
+        except ValueError:
+            raise ValueError(f'{name} debe ser una fecha ISO (YYYY-MM-DD)')
+    if bounds[0] and bounds[1] and bounds[0] >= bounds[1]:
+        raise ValueError('since debe ser anterior a until')
+    return tuple(bounds)
+
 @app.route('/api/patients/<cedula>/diagnoses', methods=['GET'])
 def get_patient_diagnoses(cedula):
     """Obtener historial de diagnósticos"""
@@ -719,15 +1723,125 @@ def get_patient_diagnoses(cedula):
     if not patient:
         return jsonify({'error': 'Paciente no encontrado'}), 404
     
-    diagnoses = Diagnosis.query.filter_by(patient_cedula=cedula).order_by(Diagnosis.created_at.desc()).all()
+    query = Diagnosis.query.filter_by(patient_cedula=cedula)
+    
+    # Rango de fechas: con tablas particionadas solo se recorren los meses del rango
+    try:
+        since, until = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if since is not None:
+        query = query.filter(Diagnosis.created_at >= since)
+    if until is not None:
+        query = query.filter(Diagnosis.created_at < until)
+    query = query.order_by(Diagnosis.created_at.desc())
+    
+    stream = request.args.get('stream')
+    if stream in STREAM_MIMETYPES:
+        return Response(
+            stream_with_context(stream_rows(query, stream)),
+            mimetype=STREAM_MIMETYPES[stream]
+        )
+    if stream:
+        return jsonify({'error': 'stream debe ser ndjson o json'}), 400
+    
+    diagnoses = query.all()
     return jsonify([d.to_dict() for d in diagnoses]), 200
 
+# Registros del historial: (tipo, modelo, fecha con la que se ordena y filtra)
+TIMELINE_SOURCES = (
+    ('diagnosis', Diagnosis, Diagnosis.created_at),
+    ('test', MedicalTest, MedicalTest.requested_at),
+    ('exam', MedicalExam, MedicalExam.requested_at),
+    ('appointment', Appointment, Appointment.scheduled_date),
+)
+
+def timeline_keys(cedula, since, until):
+    """(tipo, id, fecha) de todos los registros del paciente en el rango, como UNION ALL"""
+    selects = []
+    for kind, model, column in TIMELINE_SOURCES:
+        query = select(literal(kind).label('kind'), model.id.label('id'), column.label('date')).where(
+            model.patient_cedula == cedula
+        )
+        if since is not None:
+            query = query.where(column >= since)
+        if until is not None:
+            query = query.where(column < until)
+        selects.append(query)
+    return union_all(*selects).subquery()
+
+@app.route('/api/patients/<cedula>/timeline', methods=['GET'])
+def get_patient_timeline(cedula):
+    """
+    Historial completo del paciente (diagnósticos, pruebas, exámenes y citas)
+    en orden cronológico descendente y paginado. Un número fijo de consultas:
+    total y claves de la página con UNION ALL, y una carga por IN por tipo.
+    """
+    patient = Patient.query.get(cedula)
+    if not patient:
+        return jsonify({'error': 'Paciente no encontrado'}), 404
+    
+    try:
+        since, until = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    if page < 1 or not 1 <= per_page <= TIMELINE_MAX_PER_PAGE:
+        return jsonify({'error': f'page debe ser >= 1 y per_page estar entre 1 y {TIMELINE_MAX_PER_PAGE}'}), 400
+    
+    keys = timeline_keys(cedula, since, until)
+    total = db.session.execute(select(func.count()).select_from(keys)).scalar()
+    page_keys = db.session.execute(
+        select(keys.c.kind, keys.c.id, keys.c.date)
+        .order_by(keys.c.date.desc(), keys.c.kind, keys.c.id.desc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    
+    records = {}
+    for kind, model, _ in TIMELINE_SOURCES:
+        ids = [key.id for key in page_keys if key.kind == kind]
+        if ids:
+            records[kind] = {row.id: row for row in model.query.filter(model.id.in_(ids))}
+    
+    return jsonify({
+        'patient': patient.to_dict(),
+        'events': [
+            {'type': key.kind, 'date': key.date, 'record': records[key.kind][key.id].to_dict()}
+            for key in page_keys
+        ],
+        'total': total,
+        'pages': -(-total // per_page),
+        'current_page': page
+    }), 200
+
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',  # Un objeto JSON por línea
+    'json': 'application/json'  # Arreglo JSON enviado por fragmentos
+}
+
+def stream_rows(query, fmt):
+    """Serializar filas de un query a medida que llegan del cursor"""
+    if fmt == 'json':
+        yield '['
+    for i, row in enumerate(query.yield_per(STREAM_YIELD_PER)):
+        chunk = app.json.dumps(row.to_dict())
+        # Liberar la fila del identity map para mantener memoria constante
+        db.session.expunge(row)
+        if fmt == 'ndjson':
+            yield chunk + '\n'
+        else:
+            yield (',' if i else '') + chunk
+    if fmt == 'json':
+        yield ']'
+
 # ==================== INICIALIZACIÓN ====================
 
 @app.before_request
 def before_request():
     """Antes de cada request"""
-    pass
+    refresh_model()
 
 @app.teardown_appcontext
 def shutdown_session(exception=None):
@@ -744,6 +1858,53 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Error interno del servidor'}), 500
 
+# ==================== ESQUEMA ====================
+
+# Columnas agregadas a tablas existentes: create_all crea las tablas nuevas pero no altera las que ya existen
+UPGRADE_COLUMNS = [
+    Diagnosis.__table__.c.medication_set_id,
+    Diagnosis.__table__.c.test_panel_id,
+    Diagnosis.__table__.c.differential,
+    Diagnosis.__table__.c.explanation,
+    Diagnosis.__table__.c.confirmed_disease,
+    Diagnosis.__table__.c.confirmed_at,
+    MedicalTest.__table__.c.claimed_by,
+    MedicalTest.__table__.c.claimed_at,
+]
+UPGRADE_INDEXES = [
+    next(index for index in MedicalTest.__table__.indexes if index.name == 'ix_medical_tests_worklist'),
+]
+
+def upgrade_schema(engine):
+    """
+    ALTER TABLE ... ADD COLUMN para las columnas de UPGRADE_COLUMNS que aún no
+    existen y CREATE INDEX para los índices de UPGRADE_INDEXES. Idempotente:
+    consulta el inspector antes de cada cambio (y en PostgreSQL usa IF NOT
+    EXISTS por si otro proceso inicia a la vez). Devuelve lo agregado como
+    'tabla.columna' o 'tabla.índice'.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    if_not_exists = 'IF NOT EXISTS ' if engine.dialect.name == 'postgresql' else ''
+    added = []
+    with engine.begin() as conn:
+        for column in UPGRADE_COLUMNS:
+            table = column.table.name
+            if table not in tables or column.name in {c['name'] for c in inspector.get_columns(table)}:
+                continue
+            ddl = f'ALTER TABLE {table} ADD COLUMN {if_not_exists}{column.name} {column.type.compile(engine.dialect)}'
+            for fk in column.foreign_keys:
+                ddl += f' REFERENCES {fk.column.table.name}({fk.column.name})'
+            conn.execute(text(ddl))
+            added.append(f'{table}.{column.name}')
+        for index in UPGRADE_INDEXES:
+            table = index.table.name
+            if table not in tables or index.name in {i['name'] for i in inspector.get_indexes(table)}:
+                continue
+            index.create(conn, checkfirst=True)
+            added.append(f'{table}.{index.name}')
+    return added
+
 # ==================== STARTUP ====================
 
 # Intentar cargar modelo al iniciar
@@ -757,6 +1918,25 @@ def init_app():
         except Exception as e:
             logger.info(f"Tablas ya existen o error al crear: {str(e)}")
         
+        # Columnas nuevas en tablas creadas por versiones anteriores
+        try:
+            added = upgrade_schema(db.engine)
+            if added:
+                logger.info(f"Columnas agregadas: {', '.join(added)}")
+        except Exception as e:
+            logger.error(f"Error actualizando el esquema: {str(e)}")
+        
+        # Convertir a tablas particionadas y crear las particiones de los próximos meses
+        if PARTITION_TABLES:
+            try:
+                ensure_partitioned(db.engine, PARTITION_PREMAKE_MONTHS, metadata=db.metadata)
+            except Exception as e:
+                logger.error(f"Error preparando particiones: {str(e)}")
+        
+        # Escritura diferida de pruebas de apoyo y citas
+        if DIAGNOSIS_WRITE_BEHIND:
+            start_outbox_worker()
+        
         # Cargar modelo
         try:
             load_ml_model()
@@ -0,0 +1,30 @@
+"""
+Construcción del índice de casos similares fuera de la API
+Recorre el historial con el TF-IDF del modelo publicado y deja los segmentos
+en SIMILARITY_INDEX_PATH, de donde cada proceso de la API los carga con mmap
+en lugar de construirlos en segundo plano. El índice depende del vocabulario:
+conviene ejecutarlo tras publicar un modelo nuevo
+
+Uso: python build_similarity_index.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import SIMILARITY_INDEX_PATH, build_similarity_index, model_vectorizer
+
+def main():
+    vectorizer = model_vectorizer()
+    if vectorizer is None:
+        sys.exit("Modelo no disponible: entrenar el modelo o definir INFERENCE_URL")
+    start = time.perf_counter()
+    index = build_similarity_index(vectorizer)
+    if index is None:
+        sys.exit(f"Otro proceso está construyendo el índice en {SIMILARITY_INDEX_PATH}")
+    print(f"Índice de casos similares: {len(index)} diagnósticos en {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Borrado masivo de pacientes con todo su historial
+Los registros dependientes se eliminan en la BD por ON DELETE CASCADE: cada
+lote de pacientes es un único DELETE, sin cargar diagnósticos, pruebas,
+exámenes ni citas en Python. `migrate-fks` actualiza las claves foráneas de
+una BD PostgreSQL creada antes de que los modelos declararan ondelete
+
+Uso: python erase_patients.py erase --file cedulas.txt [--batch-size 1000]
+     python erase_patients.py erase 1234567890 0987654321
+     python erase_patients.py migrate-fks
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import app, db, delete_patients
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def declared_foreign_keys():
+    """(tabla, columna, tabla referida, columna referida, ondelete) según los modelos"""
+    for table in db.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if fk.ondelete:
+                yield table.name, fk.parent.name, fk.column.table.name, fk.column.name, fk.ondelete
+
+def migrate_foreign_keys(engine):
+    """
+    Recrear en PostgreSQL las claves foráneas cuya regla ON DELETE no coincide
+    con los modelos. Se agregan NOT VALID y se validan después, para no
+    bloquear la escritura mientras se recorre la tabla.
+    """
+    if engine.dialect.name != 'postgresql':
+        logger.info("Solo PostgreSQL: en SQLite las tablas nuevas ya se crean con ON DELETE")
+        return []
+    changed = []
+    with engine.begin() as conn:
+        for table, column, referred, referred_column, ondelete in declared_foreign_keys():
+            rows = conn.execute(text(
+                "SELECT tc.constraint_name, rc.delete_rule FROM information_schema.table_constraints tc "
+                "JOIN information_schema.key_column_usage kcu ON kcu.constraint_name = tc.constraint_name "
+                "JOIN information_schema.referential_constraints rc ON rc.constraint_name = tc.constraint_name "
+                "WHERE tc.table_name = :table AND tc.constraint_type = 'FOREIGN KEY' AND kcu.column_name = :column"
+            ), {'table': table, 'column': column}).all()
+            # Sin restricción: tabla particionada cuyas claves hacia diagnoses se eliminaron
+            for name, rule in rows:
+                if rule == ondelete.upper():
+                    continue
+                conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {name}'))
+                conn.execute(text(
+                    f'ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                    f'REFERENCES {referred} ({referred_column}) ON DELETE {ondelete} NOT VALID'
+                ))
+                changed.append((table, name))
+    with engine.begin() as conn:
+        for table, name in changed:
+            conn.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}'))
+    for table, name in changed:
+        logger.info(f"{table}.{name}: ON DELETE actualizado")
+    return changed
+
+def erase(cedulas, batch_size=1000):
+    """Eliminar pacientes por lotes; devuelve cuántos existían"""
+    erased = 0
+    for start in range(0, len(cedulas), batch_size):
+        erased += delete_patients(cedulas[start:start + batch_size])
+    return erased
+
+def read_cedulas(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Borrado de pacientes con todo su historial')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    erase_parser = subparsers.add_parser('erase', help='Eliminar pacientes')
+    erase_parser.add_argument('cedulas', nargs='*')
+    erase_parser.add_argument('--file', help='Archivo con una cédula por línea')
+    erase_parser.add_argument('--batch-size', type=int, default=1000)
+    subparsers.add_parser('migrate-fks', help='Agregar ON DELETE a las claves foráneas existentes')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'migrate-fks':
+            print(f"Claves foráneas actualizadas: {len(migrate_foreign_keys(db.engine))}")
+            return
+        cedulas = args.cedulas + (read_cedulas(args.file) if args.file else [])
+        if not cedulas:
+            parser.error('indicar cédulas o --file')
+        start = time.perf_counter()
+        erased = erase(cedulas, args.batch_size)
+        print(f"Pacientes eliminados: {erased} de {len(cedulas)} en {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
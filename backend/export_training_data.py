@@ -0,0 +1,293 @@
+"""
+Exportación incremental de diagnósticos a Parquet para entrenamiento
+Lee `diagnoses` por clave desde la última marca de agua, agrega los resultados
+completados de `medical_tests` y `medical_exams` y escribe archivos Parquet
+comprimidos particionados por fecha (date=YYYY-MM-DD) con un esquema estable.
+Las confirmaciones (`diagnosis_feedback`) se exportan aparte, en _labels/, con
+su propia marca de agua: una confirmación posterior a la exportación del
+diagnóstico también llega al conjunto
+
+Uso: python export_training_data.py [--output data/training_export] [--settle-hours 1]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import app, db, Diagnosis, DiagnosisFeedback, MedicalTest, MedicalExam
+from training_data import LABELS_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), 'data', 'training_export')
+WATERMARK_FILE = '_watermark.json'
+SCHEMA_VERSION = '2'
+
+# Esquema fijo: no depende de los datos de cada lote, así todos los archivos
+# del conjunto son compatibles entre sí aunque un lote no tenga resultados
+RESULT_STRUCT = pa.struct([('type', pa.string()), ('results', pa.string())])
+SCHEMA = pa.schema([
+    ('diagnosis_id', pa.int64()),
+    ('created_at', pa.timestamp('us')),
+    ('patient_cedula', pa.string()),
+    ('symptoms', pa.string()),
+    ('predicted_disease', pa.string()),
+    ('confidence', pa.float64()),
+    ('severity', pa.string()),
+    ('confirmed_disease', pa.string()),
+    ('confirmed', pa.bool_()),
+    ('test_results', pa.list_(RESULT_STRUCT)),
+    ('exam_results', pa.list_(RESULT_STRUCT)),
+], metadata={'schema_version': SCHEMA_VERSION})
+LABEL_SCHEMA = pa.schema([
+    ('feedback_id', pa.int64()),
+    ('diagnosis_id', pa.int64()),
+    ('confirmed_disease', pa.string()),
+    ('source', pa.string()),
+    ('created_at', pa.timestamp('us')),
+], metadata={'schema_version': SCHEMA_VERSION})
+
+# ---------- Marca de agua ----------
+
+def read_watermark(output_dir):
+    try:
+        with open(os.path.join(output_dir, WATERMARK_FILE)) as f:
+            watermark = json.load(f)
+    except (FileNotFoundError, ValueError):
+        watermark = {'schema_version': SCHEMA_VERSION, 'last_id': 0, 'rows': 0}
+    if watermark.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f"La exportación en {output_dir} usa otro esquema "
+                         f"({watermark.get('schema_version')}); exporte a un directorio nuevo")
+    # Exportaciones anteriores a _labels: las confirmaciones se exportan desde el principio
+    watermark.setdefault('last_feedback_id', 0)
+    watermark.setdefault('labels', 0)
+    return watermark
+
+def write_watermark(output_dir, watermark):
+    """Escritura atómica: un corte a mitad de escritura no corrompe la marca de agua"""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+# ---------- Lectura ----------
+
+def settled(rows, cutoff):
+    """
+    Cortar el lote en la primera fila más reciente que `cutoff`: la marca de
+    agua nunca salta una fila que aún no se exportó.
+    """
+    if cutoff is not None:
+        for i, row in enumerate(rows):
+            if row.created_at is not None and row.created_at > cutoff:
+                return rows[:i]
+    return rows
+
+def fetch_chunk(conn, last_id, chunk_size, cutoff=None):
+    """
+    Siguiente lote de diagnósticos con id > last_id. `confirmed_disease` es
+    el estado al exportar; las confirmaciones posteriores llegan por fetch_labels.
+    """
+    rows = conn.execute(
+        select(Diagnosis.id, Diagnosis.created_at, Diagnosis.patient_cedula, Diagnosis.symptoms,
+               Diagnosis.predicted_disease, Diagnosis.confidence, Diagnosis.severity,
+               Diagnosis.confirmed_disease)
+        .where(Diagnosis.id > last_id)
+        .order_by(Diagnosis.id)
+        .limit(chunk_size)
+    ).all()
+    return settled(rows, cutoff)
+
+def fetch_labels(conn, last_id, chunk_size, cutoff=None):
+    """
+    Siguiente lote de confirmaciones con id > last_id. `diagnosis_feedback`
+    solo recibe inserciones, así que cada cambio de confirmación es una fila nueva.
+    """
+    rows = conn.execute(
+        select(DiagnosisFeedback.id, DiagnosisFeedback.diagnosis_id, DiagnosisFeedback.confirmed_disease,
+               DiagnosisFeedback.source, DiagnosisFeedback.created_at)
+        .where(DiagnosisFeedback.id > last_id)
+        .order_by(DiagnosisFeedback.id)
+        .limit(chunk_size)
+    ).all()
+    return settled(rows, cutoff)
+
+def fetch_results(conn, ids):
+    """Resultados completados de pruebas y exámenes de los diagnósticos del lote"""
+    tests, exams = defaultdict(list), defaultdict(list)
+    queries = (
+        (tests, select(MedicalTest.diagnosis_id, MedicalTest.test_type, MedicalTest.results)
+         .where(MedicalTest.diagnosis_id.in_(ids), MedicalTest.status == 'completed')
+         .order_by(MedicalTest.id)),
+        (exams, select(MedicalExam.diagnosis_id, MedicalExam.exam_type, MedicalExam.results)
+         .where(MedicalExam.diagnosis_id.in_(ids), MedicalExam.status == 'completed')
+         .order_by(MedicalExam.id)),
+    )
+    for target, query in queries:
+        for diagnosis_id, kind, results in conn.execute(query):
+            target[diagnosis_id].append({'type': kind, 'results': results})
+    return tests, exams
+
+# ---------- Escritura ----------
+
+def partition_name(created_at):
+    return f"date={(created_at or datetime(1970, 1, 1)).strftime('%Y-%m-%d')}"
+
+def build_table(rows, tests, exams):
+    columns = {name: [] for name in SCHEMA.names}
+    for row in rows:
+        test_results, exam_results = tests.get(row.id, []), exams.get(row.id, [])
+        columns['diagnosis_id'].append(row.id)
+        columns['created_at'].append(row.created_at)
+        columns['patient_cedula'].append(row.patient_cedula)
+        columns['symptoms'].append(row.symptoms)
+        columns['predicted_disease'].append(row.predicted_disease)
+        columns['confidence'].append(row.confidence)
+        columns['severity'].append(row.severity)
+        columns['confirmed_disease'].append(row.confirmed_disease)
+        columns['confirmed'].append(bool(row.confirmed_disease or test_results or exam_results))
+        columns['test_results'].append(test_results)
+        columns['exam_results'].append(exam_results)
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+def build_label_table(rows):
+    return pa.Table.from_pydict({
+        'feedback_id': [row.id for row in rows],
+        'diagnosis_id': [row.diagnosis_id for row in rows],
+        'confirmed_disease': [row.confirmed_disease for row in rows],
+        'source': [row.source for row in rows],
+        'created_at': [row.created_at for row in rows],
+    }, schema=LABEL_SCHEMA)
+
+def write_part(directory, rows, table, compression):
+    """
+    Un archivo por lote, nombrado por su rango de ids. Se escribe a un
+    temporal y se renombra al final: un lector nunca ve un archivo a medias.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'part-{rows[0].id:012d}-{rows[-1].id:012d}.parquet')
+    tmp_path = f'{path}.tmp'
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, path)
+    return path
+
+def write_partition(output_dir, partition, rows, tests, exams, compression):
+    """Archivo de diagnósticos de una partición de fecha"""
+    return write_part(os.path.join(output_dir, partition), rows, build_table(rows, tests, exams), compression)
+
+def write_labels(output_dir, rows, compression):
+    """Archivo de confirmaciones en _labels/"""
+    return write_part(os.path.join(output_dir, LABELS_DIR), rows, build_label_table(rows), compression)
+
+def remove_uncommitted(output_dir, watermark):
+    """
+    Borrar archivos de un lote interrumpido (ids posteriores a su marca de
+    agua): el lote se vuelve a exportar completo y no quedan filas duplicadas
+    aunque sus límites cambien porque llegaron filas nuevas.
+    """
+    removed = 0
+    for directory, _, names in os.walk(output_dir):
+        last_id = watermark['last_feedback_id'] if os.path.basename(directory) == LABELS_DIR else watermark['last_id']
+        for name in names:
+            stale = name.endswith('.tmp')
+            if name.startswith('part-') and name.endswith('.parquet'):
+                stale = int(name.split('-')[1]) > last_id
+            if stale:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    if removed:
+        logger.warning(f"Eliminados {removed} archivos de una exportación interrumpida")
+
+# ---------- Job ----------
+
+def export(engine, output_dir=DEFAULT_OUTPUT, chunk_size=50000, settle_hours=0, compression='zstd'):
+    """
+    Exportar los diagnósticos posteriores a la marca de agua.
+
+    Cada lote es una consulta por rango de clave primaria más una consulta
+    IN por tabla de resultados, así el costo es proporcional a las filas
+    nuevas y no al tamaño de la tabla. La marca de agua se avanza solo
+    cuando todos los archivos del lote están escritos.
+
+    `settle_hours` deja fuera los diagnósticos más recientes que todavía
+    pueden recibir resultados (no se re-exportan cuando los reciben). Las
+    confirmaciones se exportan después, por su propia marca de agua.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    watermark = read_watermark(output_dir)
+    remove_uncommitted(output_dir, watermark)
+    cutoff = datetime.utcnow() - timedelta(hours=settle_hours) if settle_hours else None
+
+    start = time.perf_counter()
+    exported, files = 0, []
+    while True:
+        with engine.connect() as conn:
+            rows = fetch_chunk(conn, watermark['last_id'], chunk_size, cutoff)
+            if not rows:
+                break
+            tests, exams = fetch_results(conn, [row.id for row in rows])
+
+        partitions = defaultdict(list)
+        for row in rows:
+            partitions[partition_name(row.created_at)].append(row)
+        for partition, partition_rows in sorted(partitions.items()):
+            files.append(write_partition(output_dir, partition, partition_rows, tests, exams, compression))
+
+        watermark['last_id'] = rows[-1].id
+        watermark['rows'] += len(rows)
+        watermark['exported_at'] = datetime.utcnow().isoformat()
+        write_watermark(output_dir, watermark)
+        exported += len(rows)
+        if len(rows) < chunk_size:
+            break
+
+    labels = 0
+    while True:
+        with engine.connect() as conn:
+            rows = fetch_labels(conn, watermark['last_feedback_id'], chunk_size, cutoff)
+        if not rows:
+            break
+        files.append(write_labels(output_dir, rows, compression))
+
+        watermark['last_feedback_id'] = rows[-1].id
+        watermark['labels'] += len(rows)
+        watermark['exported_at'] = datetime.utcnow().isoformat()
+        write_watermark(output_dir, watermark)
+        labels += len(rows)
+        if len(rows) < chunk_size:
+            break
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Exportados {exported} diagnósticos y {labels} confirmaciones en {len(files)} archivos "
+                f"({elapsed:.1f}s), marcas de agua en {watermark['last_id']} y {watermark['last_feedback_id']}")
+    return {'rows': exported, 'labels': labels, 'files': files, 'watermark': watermark}
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar diagnósticos nuevos a Parquet')
+    parser.add_argument('--output', default=os.getenv('TRAINING_EXPORT_PATH', DEFAULT_OUTPUT),
+                        help='Directorio del conjunto Parquet')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--settle-hours', type=float, default=0,
+                        help='Horas de espera antes de exportar un diagnóstico')
+    parser.add_argument('--compression', default='zstd', choices=['zstd', 'snappy', 'gzip', 'none'])
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        export(db.engine, args.output, args.chunk_size, args.settle_hours, args.compression)
+
+if __name__ == '__main__':
+    main()
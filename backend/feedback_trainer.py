@@ -0,0 +1,297 @@
+"""
+Reentrenamiento incremental con las enfermedades confirmadas (diagnosis_feedback)
+Consume la retroalimentación en micro-lotes: agrega árboles al bosque (warm start)
+entrenados con el lote más un buffer de repetición, ajusta la etapa lineal de la
+cascada con partial_fit y publica el candidato si no empeora la exactitud de
+validación. Cada publicación reemplaza los artefactos 'latest' (pickle y, si
+skl2onnx está instalado, ONNX) sin dejar copias con fecha; si el directorio ya
+tiene un modelo ONNX y skl2onnx no está instalado, el entrenador no arranca
+para no dejar el modelo ONNX desactualizado
+
+La API y el servicio de inferencia detectan el modelo publicado por su versión;
+--reload-url solo adelanta la recarga en un proceso de la API (requiere --reload-token
+o MODEL_RELOAD_TOKEN)
+
+Uso: python feedback_trainer.py [--interval 300] [--once] [--reload-url http://localhost:5000]
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+from sqlalchemy import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import app, db, Diagnosis, DiagnosisFeedback
+from train_model import (create_dataset, create_holdout_dataset, load_model,
+                         load_linear_model, save_model)
+from onnx_export import ONNX_MODEL_FILE, export_onnx
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'ml_model', 'models')
+STATE_FILE = 'feedback_trainer.json'
+
+# Atributo con el que se marcan los árboles agregados por este proceso
+FEEDBACK_TREE_MARK = 'feedback_batch'
+
+# ---------- Estado ----------
+
+def read_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'last_feedback_id': 0, 'batches': 0, 'labels': 0, 'published': 0, 'rejected': 0}
+
+def write_state(path, state):
+    """Escritura atómica: un corte a mitad de escritura no corrompe el estado"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+# ---------- Lectura ----------
+
+def feedback_query():
+    return (
+        select(DiagnosisFeedback.id, Diagnosis.symptoms, DiagnosisFeedback.confirmed_disease)
+        .join(Diagnosis, Diagnosis.id == DiagnosisFeedback.diagnosis_id)
+    )
+
+def fetch_feedback(engine, last_id, limit):
+    """Siguiente micro-lote de retroalimentación, en orden de llegada"""
+    with engine.connect() as conn:
+        return conn.execute(
+            feedback_query().where(DiagnosisFeedback.id > last_id)
+            .order_by(DiagnosisFeedback.id).limit(limit)
+        ).all()
+
+def fetch_replay(engine, last_id, size):
+    """Buffer de repetición: la retroalimentación ya consumida más reciente"""
+    if size <= 0:
+        return []
+    with engine.connect() as conn:
+        return conn.execute(
+            feedback_query().where(DiagnosisFeedback.id <= last_id)
+            .order_by(DiagnosisFeedback.id.desc()).limit(size)
+        ).all()
+
+# ---------- Actualización ----------
+
+def grow_forest(model, X, y, n_trees, max_trees, batch_number):
+    """
+    Copia del pipeline con `n_trees` árboles nuevos entrenados sobre (X, y).
+
+    warm_start conserva los árboles existentes; `y` debe incluir todas las
+    clases del bosque porque fit vuelve a calcular `classes_`. Si se supera
+    `max_trees` se descartan primero los árboles incrementales más antiguos,
+    nunca los del entrenamiento completo.
+    """
+    candidate = copy.deepcopy(model)
+    forest = candidate.named_steps['clf']
+    classes = list(forest.classes_)
+
+    forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + n_trees)
+    forest.fit(X, y)
+    forest.set_params(warm_start=False)
+    if list(forest.classes_) != classes:
+        raise ValueError('El lote de entrenamiento no contiene todas las clases del modelo')
+
+    for tree in forest.estimators_[-n_trees:]:
+        setattr(tree, FEEDBACK_TREE_MARK, batch_number)
+    excess = len(forest.estimators_) - max_trees
+    if excess > 0:
+        incremental = [i for i, tree in enumerate(forest.estimators_) if hasattr(tree, FEEDBACK_TREE_MARK)]
+        drop = set(incremental[:excess])
+        forest.estimators_ = [tree for i, tree in enumerate(forest.estimators_) if i not in drop]
+    forest.n_estimators = len(forest.estimators_)
+    return candidate
+
+def update_linear(linear_model, X, y):
+    """Copia de la etapa lineal ajustada con un paso de partial_fit"""
+    candidate = copy.deepcopy(linear_model)
+    candidate.partial_fit(X, y)
+    return candidate
+
+def accuracy(model, texts, labels):
+    return float((model.predict(texts) == np.asarray(labels)).mean())
+
+def onnx_exporter(model_dir):
+    """
+    export_onnx si skl2onnx está instalado; None si no lo está y el directorio
+    no tiene modelo ONNX (despliegue solo sklearn). Error si lo tiene: el
+    servicio ONNX seguiría sirviendo el modelo anterior
+    """
+    try:
+        import skl2onnx  # noqa: F401
+    except ImportError:
+        if os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE)):
+            raise RuntimeError(f"{ONNX_MODEL_FILE} existe en {model_dir} pero skl2onnx no está instalado")
+        logger.warning("skl2onnx no instalado: se publica solo el modelo sklearn")
+        return None
+    return export_onnx
+
+# ---------- Entrenador ----------
+
+class FeedbackTrainer(threading.Thread):
+    """
+    Hilo que consume la retroalimentación en micro-lotes y publica modelos.
+
+    Cada paso toma hasta `batch_size` etiquetas nuevas (espera a reunir
+    `min_batch`), las mezcla con el dataset base, que garantiza todas las
+    clases, y con las `replay_size` etiquetas anteriores más recientes, para
+    que un lote sesgado no desplace lo aprendido. El candidato se publica
+    solo si su exactitud en el conjunto de validación no cae más de
+    `tolerance` respecto al modelo actual.
+    """
+
+    def __init__(self, engine, model_dir=DEFAULT_MODEL_DIR, batch_size=256, min_batch=32,
+                 replay_size=1024, trees_per_batch=10, max_trees=200, tolerance=0.02,
+                 interval=300, reload_url=None, reload_token=None):
+        super().__init__(name='feedback-trainer', daemon=True)
+        self.engine = engine
+        self.model_dir = model_dir
+        self.state_path = os.path.join(model_dir, STATE_FILE)
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.replay_size = replay_size
+        self.trees_per_batch = trees_per_batch
+        self.max_trees = max_trees
+        self.tolerance = tolerance
+        self.interval = interval
+        self.reload_url = reload_url
+        self.reload_token = reload_token
+        self.export_onnx = onnx_exporter(model_dir)
+        self.holdout = create_holdout_dataset(seed=7)
+        self._stop_event = threading.Event()
+
+    def step(self, force=False):
+        """Procesar un micro-lote; devuelve un resumen o None si no hay suficientes etiquetas"""
+        state = read_state(self.state_path)
+        batch = fetch_feedback(self.engine, state['last_feedback_id'], self.batch_size)
+        if not batch or (len(batch) < self.min_batch and not force):
+            return None
+
+        start = time.perf_counter()
+        model, disease_info = load_model(self.model_dir)
+        linear_model = load_linear_model(self.model_dir)
+        classes = set(model.named_steps['clf'].classes_)
+
+        labeled = [row for row in batch if row.confirmed_disease in classes and row.symptoms]
+        if len(labeled) < len(batch):
+            logger.warning(f"{len(batch) - len(labeled)} etiquetas con enfermedades fuera del modelo; se omiten")
+        replay = fetch_replay(self.engine, state['last_feedback_id'], self.replay_size)
+        replay = [row for row in replay if row.confirmed_disease in classes and row.symptoms]
+
+        base = create_dataset()
+        texts = list(base['symptoms']) + [row.symptoms for row in replay + labeled]
+        labels = list(base['disease']) + [row.confirmed_disease for row in replay + labeled]
+
+        summary = {'labels': len(batch), 'used': len(labeled), 'replay': len(replay), 'published': False}
+        if labeled:
+            vectorizer = model.named_steps['tfidf']
+            X = vectorizer.transform(texts)
+            batch_number = state['batches'] + 1
+            candidate = grow_forest(model, X, labels, self.trees_per_batch, self.max_trees, batch_number)
+
+            # La etapa lineal aprende en línea: solo con el lote nuevo
+            candidate_linear = linear_model
+            if linear_model is not None:
+                candidate_linear = update_linear(
+                    linear_model, vectorizer.transform([row.symptoms for row in labeled]),
+                    [row.confirmed_disease for row in labeled]
+                )
+
+            before = accuracy(model, self.holdout['symptoms'], self.holdout['disease'])
+            after = accuracy(candidate, self.holdout['symptoms'], self.holdout['disease'])
+            summary.update({'accuracy_before': before, 'accuracy_after': after,
+                            'trees': len(candidate.named_steps['clf'].estimators_)})
+            if after >= before - self.tolerance:
+                # ONNX primero: si falla no se publica nada y el lote se reintenta
+                if self.export_onnx is not None:
+                    self.export_onnx(candidate, disease_info, self.model_dir)
+                save_model(candidate, disease_info, self.model_dir, linear_model=candidate_linear, snapshot=False)
+                summary['published'] = True
+                state['published'] += 1
+            else:
+                logger.warning(f"Candidato rechazado: exactitud de validación {before:.1%} -> {after:.1%}")
+                state['rejected'] += 1
+
+        # Las etiquetas de un candidato rechazado no se pierden: siguen en el buffer de repetición
+        state['last_feedback_id'] = batch[-1].id
+        state['batches'] += 1
+        state['labels'] += len(batch)
+        write_state(self.state_path, state)
+
+        summary['seconds'] = round(time.perf_counter() - start, 3)
+        logger.info(f"Micro-lote de retroalimentación: {summary}")
+        if summary['published'] and self.reload_url:
+            self.notify_reload()
+        return summary
+
+    def notify_reload(self):
+        """Pedir a la API que cargue el modelo publicado sin esperar a su próxima comprobación"""
+        url = f"{self.reload_url.rstrip('/')}/api/model/reload"
+        headers = {'Authorization': f'Bearer {self.reload_token}'} if self.reload_token else {}
+        try:
+            urllib.request.urlopen(urllib.request.Request(url, method='POST', headers=headers), timeout=30).close()
+        except Exception as e:
+            logger.warning(f"No se pudo recargar el modelo en {url}: {str(e)}")
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                summary = self.step()
+            except Exception as e:
+                logger.error(f"Error en el entrenador incremental: {str(e)}")
+                summary = None
+            if summary is None:
+                self._stop_event.wait(self.interval)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.join(timeout)
+
+def main():
+    parser = argparse.ArgumentParser(description='Reentrenamiento incremental con retroalimentación confirmada')
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--min-batch', type=int, default=32, help='Etiquetas mínimas para entrenar')
+    parser.add_argument('--replay-size', type=int, default=1024)
+    parser.add_argument('--trees-per-batch', type=int, default=10)
+    parser.add_argument('--max-trees', type=int, default=200)
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help='Pérdida máxima de exactitud de validación para publicar')
+    parser.add_argument('--interval', type=float, default=300, help='Segundos entre consultas')
+    parser.add_argument('--reload-url', help='URL base de la API a notificar tras publicar')
+    parser.add_argument('--reload-token', default=os.getenv('MODEL_RELOAD_TOKEN'),
+                        help='Token de /api/model/reload (por defecto MODEL_RELOAD_TOKEN)')
+    parser.add_argument('--once', action='store_true', help='Procesar las etiquetas pendientes y salir')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        trainer = FeedbackTrainer(
+            db.engine, args.model_dir, args.batch_size, args.min_batch, args.replay_size,
+            args.trees_per_batch, args.max_trees, args.tolerance, args.interval, args.reload_url,
+            args.reload_token
+        )
+        if args.once:
+            while trainer.step(force=True) is not None:
+                pass
+        else:
+            trainer.run()
+
+if __name__ == '__main__':
+    main()
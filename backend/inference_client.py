@@ -0,0 +1,124 @@
+"""
+Cliente del servicio de inferencia independiente
+Pool de conexiones HTTP/1.1 keep-alive (solo biblioteca estándar) con timeouts
+"""
+
+import http.client
+import json
+import logging
+import queue
+import socket
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServiceError(Exception):
+    """El servicio de inferencia no respondió o devolvió un error"""
+
+
+class InferenceClient:
+    """
+    Cliente seguro entre hilos: cada petición toma una conexión del pool y la
+    devuelve al terminar. Una conexión keep-alive cerrada por el servidor se
+    reintenta una vez con una conexión nueva.
+    """
+
+    def __init__(self, base_url, timeout=2.0, connect_timeout=0.5, pool_size=8):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'URL de inferencia no válida: {base_url}')
+        self.base_url = base_url
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _new_connection(self):
+        conn = self._connection_class(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+        for attempt in range(2):
+            try:
+                conn, reused = self._acquire()
+            except (OSError, http.client.HTTPException) as e:
+                raise InferenceServiceError(f'No se pudo conectar a {self.base_url}: {e}') from e
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except socket.timeout as e:
+                conn.close()
+                raise InferenceServiceError(f'Timeout del servicio de inferencia ({self.timeout}s)') from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # La conexión del pool pudo haber sido cerrada por el servidor
+                if reused and attempt == 0:
+                    continue
+                raise InferenceServiceError(f'Error de conexión con el servicio de inferencia: {e}') from e
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+
+            try:
+                content = json.loads(data) if data else {}
+            except ValueError as e:
+                raise InferenceServiceError('Respuesta no válida del servicio de inferencia') from e
+            if response.status != 200:
+                raise InferenceServiceError(
+                    f"Servicio de inferencia respondió {response.status}: {content.get('error', '')}"
+                )
+            return content
+
+    def infer(self, texts, top_k=5, explain=False, top_terms=10):
+        """Respuesta completa de /predict: 'predictions', 'input_quality' y, si se pide, 'explanations'"""
+        payload = {'texts': list(texts), 'top_k': top_k}
+        if explain:
+            payload.update(explain=True, top_terms=top_terms)
+        return self._request('POST', '/predict', payload)
+
+    def predict(self, texts, top_k=5):
+        """Diagnóstico diferencial (lista de {'disease', 'confidence'}) por cada texto"""
+        return self.infer(texts, top_k)['predictions']
+
+    def disease_info(self):
+        """Información de enfermedades del modelo servido"""
+        return self._request('GET', '/disease-info')
+
+    def vectorizer_config(self):
+        """Configuración del TF-IDF del modelo servido (para PortableTfidfVectorizer)"""
+        return self._request('GET', '/vectorizer')
+
+    def health(self):
+        return self._request('GET', '/health')
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
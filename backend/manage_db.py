@@ -10,7 +10,7 @@ from sqlalchemy.pool import StaticPool
 # Agregar path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import db, app, Patient, Diagnosis, MedicalExam
+from app import db, app, Patient, Diagnosis, MedicalExam, upgrade_schema
 
 def create_database():
     """Crear base de datos y tablas"""
@@ -18,6 +18,8 @@ def create_database():
         print("Creando tablas de base de datos...")
         db.create_all()
         print("✓ Tablas creadas exitosamente")
+        for column in upgrade_schema(db.engine):
+            print(f"✓ Columna agregada: {column}")
 
 def drop_database():
     """Eliminar todas las tablas"""
@@ -34,6 +36,7 @@ def seed_database():
         # Crear pacientes de prueba
         test_patients = [
             Patient(
+                cedula='1712345678',
                 name='Juan Pérez García',
                 age=35,
                 gender='M',
@@ -41,6 +44,7 @@ def seed_database():
                 phone='+34 912345678'
             ),
             Patient(
+                cedula='0923456789',
                 name='María López Rodríguez',
                 age=28,
                 gender='F',
@@ -48,6 +52,7 @@ def seed_database():
                 phone='+34 923456789'
             ),
             Patient(
+                cedula='1103456789',
                 name='Carlos González López',
                 age=42,
                 gender='M',
@@ -56,11 +61,13 @@ def seed_database():
             )
         ]
         
+        # merge: volver a sembrar no falla por cédulas duplicadas
         for patient in test_patients:
-            db.session.add(patient)
+            db.session.merge(patient)
         
         db.session.commit()
         print("✓ Pacientes de prueba creados")
+        print("  Para datos a escala: python synthetic_data.py --patients 300000")
 
 def reset_database():
     """Resetear BD completamente"""
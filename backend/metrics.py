@@ -0,0 +1,43 @@
+"""
+Métricas en memoria del proceso de la API
+Contadores y tiempos acumulados, expuestos en /api/metrics
+"""
+
+import os
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Registro simple de contadores y duraciones, seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._values[name] += value
+
+    def observe(self, name, seconds):
+        """Registrar una duración: acumula `<name>_count` y `<name>_seconds`"""
+        with self._lock:
+            self._values[f'{name}_count'] += 1
+            self._values[f'{name}_seconds'] += seconds
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+        values['pid'] = os.getpid()
+        return values
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+metrics = Metrics()
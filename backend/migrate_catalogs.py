@@ -0,0 +1,96 @@
+"""
+Migración de medicamentos y pruebas recomendadas a catálogos versionados
+Crea las tablas de catálogo, agrega a `diagnoses` las columnas que falten
+(entre ellas las referencias medication_set_id y test_panel_id, con
+upgrade_schema) y convierte por lotes las copias JSON de cada fila en referencias, dejando la copia en NULL.
+Cada lote se confirma por separado: si se interrumpe, se retoma con las filas
+que aún tienen JSON
+
+Uso: python migrate_catalogs.py [--chunk-size 5000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from sqlalchemy import bindparam, null, or_, select
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import (app, db, Diagnosis, MedicationSet, TestPanel, SUPPORT_TEST_PANEL, SUPPORT_TESTS,
+                 catalog_entry_ids, catalog_version, upgrade_schema)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Paneles distintos del estándar (diagnósticos escritos por versiones anteriores)
+LEGACY_TEST_PANEL = 'migrado'
+
+def panel_name(tests):
+    return SUPPORT_TEST_PANEL if catalog_version(tests) == catalog_version(SUPPORT_TESTS) else LEGACY_TEST_PANEL
+
+def migrate_chunk(rows):
+    """Referencias al catálogo para un lote de (id, enfermedad, medicamentos, pruebas)"""
+    medication_ids = catalog_entry_ids(
+        MedicationSet, [(disease, medications) for _, disease, medications, _ in rows if medications]
+    )
+    panel_ids = catalog_entry_ids(
+        TestPanel, [(panel_name(tests), tests) for _, _, _, tests in rows if tests]
+    )
+    updates = []
+    for diagnosis_id, disease, medications, tests in rows:
+        updates.append({
+            'diagnosis_id': diagnosis_id,
+            'medication_set_id': medication_ids[(disease, catalog_version(medications))] if medications else None,
+            'test_panel_id': panel_ids[(panel_name(tests), catalog_version(tests))] if tests else None,
+        })
+    table = Diagnosis.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('diagnosis_id'))
+        .values(medication_set_id=bindparam('medication_set_id'), test_panel_id=bindparam('test_panel_id'),
+                medications=null(), recommended_tests=null()),
+        updates
+    )
+    db.session.commit()
+
+def migrate(chunk_size=5000):
+    """Convertir todas las filas con JSON; devuelve el número de filas migradas"""
+    db.create_all()
+    added = upgrade_schema(db.engine)
+    if added:
+        logger.info(f"Columnas agregadas: {', '.join(added)}")
+
+    table = Diagnosis.__table__
+    pending = or_(table.c.medications.isnot(None), table.c.recommended_tests.isnot(None))
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.predicted_disease, table.c.medications, table.c.recommended_tests)
+            .where(table.c.id > last_id, pending)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        migrate_chunk(rows)
+        migrated += len(rows)
+        last_id = rows[-1].id
+        logger.info(f"{migrated} diagnósticos migrados (hasta id {last_id})")
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrar medicamentos y pruebas de diagnoses a catálogos')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        migrated = migrate(args.chunk_size)
+        print(f"Diagnósticos migrados: {migrated}")
+        if db.engine.dialect.name == 'postgresql':
+            print("El espacio de las copias JSON se recupera con VACUUM (FULL) diagnoses")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Bandeja de salida (outbox) transaccional para escrituras diferidas
+Las tareas son filas de una tabla de la misma BD que los datos: quien escribe
+encola la tarea en su propia transacción (o se confirman ambas o ninguna) y
+un hilo trabajador las procesa con reintentos
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import Column, Float, Index, Integer, String, Table, Text, delete, func, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+OutboxItem = namedtuple('OutboxItem', ['id', 'key', 'kind', 'payload', 'attempts'])
+
+# INSERT con ON CONFLICT según el dialecto
+DIALECT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def outbox_table(metadata, name='outbox'):
+    """Tabla de tareas en los metadatos de la aplicación (la crea create_all)"""
+    pending = text("status = 'pending'")
+    return Table(
+        name, metadata,
+        Column('id', Integer, primary_key=True),
+        Column('key', String(255), nullable=False, unique=True),
+        Column('kind', String(50), nullable=False),
+        Column('payload', Text, nullable=False),
+        Column('status', String(20), nullable=False, default='pending'),
+        Column('attempts', Integer, nullable=False, default=0),
+        Column('available_at', Float, nullable=False),
+        Column('last_error', Text),
+        Column('created_at', Float, nullable=False),
+        Index(f'ix_{name}_pending', 'available_at', postgresql_where=pending, sqlite_where=pending),
+    )
+
+
+class Outbox:
+    """Cola durable con entrega al menos una vez y claves de idempotencia"""
+
+    def __init__(self, engine, table, max_attempts=5, lease_seconds=60, backoff_seconds=1.0):
+        self.engine = engine
+        self.table = table
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.backoff_seconds = backoff_seconds
+
+    def enqueue(self, conn, key, kind, payload):
+        """
+        Encolar una tarea en la transacción de `conn` (se confirma o se
+        revierte con ella); devuelve False si la clave ya existía (idempotente)
+        """
+        now = time.time()
+        statement = (DIALECT_INSERTS[conn.dialect.name](self.table)
+                     .values(key=key, kind=kind, payload=json.dumps(payload), status='pending',
+                             attempts=0, available_at=now, created_at=now)
+                     .on_conflict_do_nothing(index_elements=['key']))
+        return conn.execute(statement).rowcount == 1
+
+    def claim(self, limit=10):
+        """
+        Reservar hasta `limit` tareas pendientes.
+
+        La reserva es un arrendamiento: si el proceso muere sin confirmar, la
+        tarea vuelve a estar disponible al expirar `lease_seconds`. Cada fila
+        se reserva con un UPDATE condicional sobre su `available_at`, así dos
+        trabajadores nunca toman la misma tarea.
+        """
+        t = self.table
+        now = time.time()
+        claimed = []
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.key, t.c.kind, t.c.payload, t.c.attempts, t.c.available_at)
+                .where(t.c.status == 'pending', t.c.available_at <= now)
+                .order_by(t.c.available_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            ).all()
+            for row in rows:
+                result = conn.execute(
+                    update(t).where(t.c.id == row.id, t.c.available_at == row.available_at)
+                    .values(available_at=now + self.lease_seconds)
+                )
+                if result.rowcount == 1:
+                    claimed.append(OutboxItem(row.id, row.key, row.kind, json.loads(row.payload), row.attempts))
+        return claimed
+
+    def complete(self, item_id):
+        """Marcar una tarea como procesada"""
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == item_id)
+                         .values(status='done', last_error=None))
+
+    def fail(self, item_id, error):
+        """Registrar un fallo: reintento con espera exponencial o descarte definitivo"""
+        t = self.table
+        with self.engine.begin() as conn:
+            attempts = conn.execute(
+                select(t.c.attempts).where(t.c.id == item_id).with_for_update()
+            ).scalar()
+            if attempts is None:
+                return
+            attempts += 1
+            status = 'dead' if attempts >= self.max_attempts else 'pending'
+            delay = self.backoff_seconds * (2 ** (attempts - 1))
+            conn.execute(
+                update(t).where(t.c.id == item_id)
+                .values(status=status, attempts=attempts, available_at=time.time() + delay,
+                        last_error=str(error)[:1000])
+            )
+        if status == 'dead':
+            logger.error(f"Tarea de outbox {item_id} descartada tras {attempts} intentos: {error}")
+
+    def counts(self):
+        """Número de tareas por estado"""
+        t = self.table
+        with self.engine.connect() as conn:
+            return dict(conn.execute(select(t.c.status, func.count()).group_by(t.c.status)).all())
+
+    def purge(self, older_than_seconds=7 * 24 * 3600):
+        """Eliminar tareas completadas antiguas"""
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.status == 'done', t.c.created_at < time.time() - older_than_seconds))
+
+    def process(self, handler, limit=10):
+        """Procesar un lote de tareas con `handler(kind, payload)`; devuelve cuántas se reservaron"""
+        items = self.claim(limit)
+        for item in items:
+            try:
+                handler(item.kind, item.payload)
+            except Exception as e:
+                logger.warning(f"Fallo procesando tarea de outbox {item.key}: {str(e)}")
+                self.fail(item.id, e)
+            else:
+                self.complete(item.id)
+        return len(items)
+
+
+class OutboxWorker(threading.Thread):
+    """Hilo que vacía la outbox en segundo plano"""
+
+    def __init__(self, outbox, handler, poll_interval=0.5, batch_size=10):
+        super().__init__(name='outbox-worker', daemon=True)
+        self.outbox = outbox
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                processed = self.outbox.process(self.handler, self.batch_size)
+            except Exception as e:
+                logger.error(f"Error en el trabajador de outbox: {str(e)}")
+                processed = 0
+            if not processed:
+                self._stop_event.wait(self.poll_interval)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.join(timeout)
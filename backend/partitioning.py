@@ -0,0 +1,287 @@
+"""
+Particionamiento declarativo por mes en PostgreSQL
+`diagnoses`, `medical_tests` y `appointments` se convierten en tablas
+particionadas por rango de fecha (una partición por mes, más una DEFAULT de
+respaldo). El mantenimiento crea las particiones futuras y separa (y
+opcionalmente archiva) las antiguas. Los modelos ORM no cambian: mapean la
+tabla padre con `id` como clave y PostgreSQL enruta cada fila a su partición
+
+Uso: python partitioning.py maintain [--premake 3] [--retain-months 24] [--archive-dir data/archive]
+     python partitioning.py explain --cedula 1234567890 [--since 2025-01-01]
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import re
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PartitionSpec = namedtuple('PartitionSpec', ['table', 'column'])
+
+# Orden de conversión: diagnoses primero (al eliminar la tabla anterior caen
+# las claves foráneas que la referencian desde las demás)
+PARTITIONED_TABLES = (
+    PartitionSpec('diagnoses', 'created_at'),
+    PartitionSpec('medical_tests', 'requested_at'),
+    PartitionSpec('appointments', 'created_at'),
+)
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# Clave para pg_advisory_xact_lock: varios procesos pueden iniciar a la vez
+ADVISORY_LOCK_KEY = 730044
+
+# ---------- Meses y DDL ----------
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def add_months(month, n):
+    years, index = divmod(month.month - 1 + n, 12)
+    return datetime(month.year + years, index + 1, 1)
+
+def month_range(first, last):
+    """Meses desde `first` hasta `last` inclusive"""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+def partition_name(table, month):
+    return f'{table}_{month:%Y_%m}'
+
+def bounds_sql(month):
+    return f"FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+
+def parse_bounds(expression):
+    """Límites (desde, hasta) de una partición de rango; None para DEFAULT"""
+    match = BOUND_PATTERN.search(expression or '')
+    if not match:
+        return None
+    return tuple(datetime.fromisoformat(value[:19]) for value in match.groups())
+
+def conversion_statements(spec, months, foreign_keys):
+    """
+    DDL para convertir una tabla existente en particionada sin perder filas.
+
+    PostgreSQL exige que la clave primaria incluya la columna de partición,
+    así que pasa a ser (id, columna); la secuencia de `id` se conserva. Las
+    claves foráneas de otras tablas hacia esta no pueden apuntar solo a `id`
+    y se eliminan junto con la tabla anterior (la integridad de esas
+    relaciones queda a cargo de la aplicación).
+    """
+    table, column = spec
+    legacy = f'{table}_legacy'
+    statements = [
+        f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE',
+        f"UPDATE {table} SET {column} = now() AT TIME ZONE 'utc' WHERE {column} IS NULL",
+        f'ALTER TABLE {table} RENAME TO {legacy}',
+        f'ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey',
+        f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})',
+        f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL',
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT (now() AT TIME ZONE 'utc')",
+        f'ALTER TABLE {table} ADD PRIMARY KEY (id, {column})',
+        f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id',
+        # Historial por paciente y fecha: el patrón de consulta dominante
+        f'CREATE INDEX ix_{table}_patient_{column} ON {table} (patient_cedula, {column} DESC)',
+    ]
+    statements += [f'ALTER TABLE {table} ADD {definition}' for definition in foreign_keys]
+    statements += [
+        f'CREATE TABLE {partition_name(table, month)} PARTITION OF {table} FOR VALUES {bounds_sql(month)}'
+        for month in months
+    ]
+    statements += [
+        f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT',
+        f'INSERT INTO {table} SELECT * FROM {legacy}',
+        f'DROP TABLE {legacy} CASCADE',
+    ]
+    return statements
+
+def add_partition_statements(spec, month):
+    """
+    DDL para agregar el mes a una tabla ya particionada. Las filas de ese mes
+    que hayan caído en la partición DEFAULT se mueven antes de adjuntarla
+    (PostgreSQL rechaza el ATTACH si la DEFAULT tiene filas del rango).
+    """
+    table, column = spec
+    name = partition_name(table, month)
+    return [
+        f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)',
+        f"WITH moved AS (DELETE FROM {table}_default WHERE {column} >= '{month:%Y-%m-%d}' "
+        f"AND {column} < '{add_months(month, 1):%Y-%m-%d}' RETURNING *) "
+        f'INSERT INTO {name} SELECT * FROM moved',
+        f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds_sql(month)}',
+    ]
+
+# ---------- Catálogo ----------
+
+def is_partitioned(conn, table):
+    relkind = conn.exec_driver_sql(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%(table)s)", {'table': table}
+    ).scalar()
+    return relkind == 'p'
+
+def list_partitions(conn, table):
+    """{nombre: (desde, hasta) o None para DEFAULT}"""
+    rows = conn.exec_driver_sql(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%(table)s)",
+        {'table': table}
+    ).all()
+    return {name: parse_bounds(expression) for name, expression in rows}
+
+def own_foreign_keys(conn, table):
+    """Claves foráneas de la tabla hacia tablas no particionadas (se recrean tras convertir)"""
+    return [row[0] for row in conn.exec_driver_sql(
+        "SELECT pg_get_constraintdef(con.oid) FROM pg_constraint con "
+        "JOIN pg_class ref ON ref.oid = con.confrelid "
+        "WHERE con.conrelid = to_regclass(%(table)s) AND con.contype = 'f' AND ref.relkind <> 'p'",
+        {'table': table}
+    )]
+
+def referencing_constraints(conn, table):
+    return [f'{row[0]}.{row[1]}' for row in conn.exec_driver_sql(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE confrelid = to_regclass(%(table)s) AND contype = 'f'",
+        {'table': table}
+    )]
+
+# ---------- Operaciones ----------
+
+def ensure_partitioned(engine, premake=3, now=None, metadata=None):
+    """
+    Convertir las tablas que aún no están particionadas y crear las
+    particiones de los próximos `premake` meses. Idempotente y seguro con
+    varios procesos (bloqueo consultivo de transacción). Con `metadata` se
+    recrean los índices no únicos declarados en los modelos (la tabla nueva
+    solo copia columnas y defaults).
+    """
+    if engine.dialect.name != 'postgresql':
+        logger.info("Particionamiento disponible solo en PostgreSQL; se omite")
+        return {'converted': [], 'created': []}
+
+    current = month_start(now or datetime.utcnow())
+    converted = []
+    with engine.begin() as conn:
+        conn.exec_driver_sql('SELECT pg_advisory_xact_lock(%(key)s)', {'key': ADVISORY_LOCK_KEY})
+        for spec in PARTITIONED_TABLES:
+            if is_partitioned(conn, spec.table):
+                continue
+            oldest = conn.exec_driver_sql(f'SELECT min({spec.column}) FROM {spec.table}').scalar()
+            months = list(month_range(min(oldest or current, current), add_months(current, premake)))
+            dropped = referencing_constraints(conn, spec.table)
+            if dropped:
+                logger.warning(f"Claves foráneas hacia {spec.table} que se eliminan: {', '.join(dropped)}")
+            for statement in conversion_statements(spec, months, own_foreign_keys(conn, spec.table)):
+                conn.exec_driver_sql(statement)
+            if metadata is not None:
+                for index in metadata.tables[spec.table].indexes:
+                    if not index.unique:
+                        index.create(conn, checkfirst=True)
+            converted.append(spec.table)
+            logger.info(f"{spec.table} particionada por {spec.column} ({len(months)} meses)")
+
+    summary = maintain(engine, premake, now=now)
+    summary['converted'] = converted
+    return summary
+
+def maintain(engine, premake=3, retain_months=None, archive_dir=None, now=None):
+    """
+    Crear las particiones faltantes hasta `premake` meses adelante y, con
+    `retain_months`, separar las que terminan antes de ese número de meses
+    atrás. Una partición separada queda como tabla independiente; con
+    `archive_dir` se exporta a CSV comprimido y se elimina.
+    """
+    if engine.dialect.name != 'postgresql':
+        return {'created': [], 'detached': [], 'archived': []}
+
+    current = month_start(now or datetime.utcnow())
+    cutoff = add_months(current, -retain_months) if retain_months else None
+    created, detached = [], []
+    with engine.begin() as conn:
+        conn.exec_driver_sql('SELECT pg_advisory_xact_lock(%(key)s)', {'key': ADVISORY_LOCK_KEY})
+        for spec in PARTITIONED_TABLES:
+            if not is_partitioned(conn, spec.table):
+                continue
+            partitions = list_partitions(conn, spec.table)
+            for month in month_range(current, add_months(current, premake)):
+                if partition_name(spec.table, month) not in partitions:
+                    for statement in add_partition_statements(spec, month):
+                        conn.exec_driver_sql(statement)
+                    created.append(partition_name(spec.table, month))
+            if cutoff is None:
+                continue
+            for name, bounds in sorted(partitions.items()):
+                if bounds is not None and bounds[1] <= cutoff:
+                    conn.exec_driver_sql(f'ALTER TABLE {spec.table} DETACH PARTITION {name}')
+                    detached.append(name)
+
+    archived = []
+    if archive_dir and detached:
+        os.makedirs(archive_dir, exist_ok=True)
+        for name in detached:
+            archive_partition(engine, name, archive_dir)
+            archived.append(name)
+
+    if created or detached:
+        logger.info(f"Particiones creadas: {created}; separadas: {detached}; archivadas: {archived}")
+    return {'created': created, 'detached': detached, 'archived': archived}
+
+def archive_partition(engine, name, archive_dir):
+    """COPY de una partición separada a CSV gzip y DROP de la tabla"""
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor, gzip.open(path, 'wt', encoding='utf-8') as f:
+            cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', f)
+            cursor.execute(f'DROP TABLE {name}')
+        raw.commit()
+    finally:
+        raw.close()
+    return path
+
+def explain(engine, statement):
+    """Plan de una consulta y particiones que recorre (las demás fueron podadas)"""
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        plan = '\n'.join(row[0] for row in conn.exec_driver_sql(f'EXPLAIN (COSTS OFF) {sql}'))
+    scanned = sorted(set(re.findall(r'\b(\w+_(?:\d{4}_\d{2}|default))\b', plan)))
+    return {'plan': plan, 'partitions': scanned}
+
+def main():
+    sys.path.insert(0, os.path.dirname(__file__))
+    from sqlalchemy import select
+    from app import app, db, Diagnosis
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Particionamiento mensual de tablas de historial')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    maintain_parser = subparsers.add_parser('maintain', help='Convertir tablas y crear/separar particiones')
+    maintain_parser.add_argument('--premake', type=int, default=3, help='Meses futuros a crear')
+    maintain_parser.add_argument('--retain-months', type=int, help='Separar particiones más antiguas')
+    maintain_parser.add_argument('--archive-dir', help='Exportar y eliminar las particiones separadas')
+    explain_parser = subparsers.add_parser('explain', help='Plan del historial de un paciente')
+    explain_parser.add_argument('--cedula', required=True)
+    explain_parser.add_argument('--since', type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if args.command == 'maintain':
+            print(ensure_partitioned(db.engine, args.premake, metadata=db.metadata))
+            print(maintain(db.engine, args.premake, args.retain_months, args.archive_dir))
+        else:
+            query = select(Diagnosis).where(Diagnosis.patient_cedula == args.cedula)
+            if args.since:
+                query = query.where(Diagnosis.created_at >= args.since)
+            result = explain(db.engine, query.order_by(Diagnosis.created_at.desc()))
+            print(result['plan'])
+            print(f"\nParticiones recorridas ({len(result['partitions'])}): {', '.join(result['partitions'])}")
+
+if __name__ == '__main__':
+    main()
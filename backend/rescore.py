@@ -0,0 +1,253 @@
+"""
+Re-evaluación masiva del historial de diagnósticos con un modelo candidato
+Lee `diagnoses` por lotes con un cursor del lado del servidor, predice en paralelo
+(un proceso por núcleo), guarda en `diagnosis_rescores` y reporta desacuerdos
+
+Uso: python rescore.py --model ../ml_model/models/disease_model_latest.pkl [--workers 4]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from sqlalchemy import case, func, select
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import app, db, Diagnosis, DiagnosisRescore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.path.join(os.path.dirname(__file__), '..', 'ml_model', 'models', 'disease_model_latest.pkl')
+
+# ---------- Procesos de predicción ----------
+
+_worker_model = None
+
+def _init_worker(model_path):
+    global _worker_model
+    import joblib
+    _worker_model = joblib.load(model_path)
+
+def score_texts(texts):
+    """Clase y confianza (%) del modelo candidato para un lote de textos"""
+    probabilities = _worker_model.predict_proba(texts)
+    best = probabilities.argmax(axis=1)
+    return (
+        [str(label) for label in _worker_model.classes_[best]],
+        [round(float(p) * 100, 2) for p in probabilities.max(axis=1)]
+    )
+
+# ---------- Checkpoint ----------
+
+def model_run_id(model_path):
+    """Identificador de la corrida: hash del artefacto del modelo"""
+    digest = hashlib.sha1()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+def read_checkpoint(path, run_id):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'run_id': run_id, 'last_id': 0, 'processed': 0}
+    if checkpoint.get('run_id') != run_id:
+        raise ValueError(f"El checkpoint {path} pertenece a otra corrida ({checkpoint.get('run_id')})")
+    return checkpoint
+
+def write_checkpoint(path, checkpoint):
+    """Escritura atómica: un corte a mitad de escritura no corrompe el checkpoint"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+# ---------- Escritura ----------
+
+def insert_ignore(engine):
+    """INSERT ... ON CONFLICT DO NOTHING del dialecto (reanudar no duplica filas)"""
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f'Dialecto no soportado: {engine.dialect.name}')
+    return insert(DiagnosisRescore.__table__).on_conflict_do_nothing()
+
+def write_results(engine, run_id, ids, labels, confidences):
+    with engine.begin() as conn:
+        conn.execute(insert_ignore(engine), [
+            {'run_id': run_id, 'diagnosis_id': i, 'predicted_disease': label, 'confidence': confidence}
+            for i, label, confidence in zip(ids, labels, confidences)
+        ])
+
+# ---------- Job ----------
+
+def iter_chunks(engine, last_id, chunk_size):
+    """
+    Lotes (ids, textos) en orden de id. En PostgreSQL se usa un cursor con
+    nombre (stream_results); en SQLite un cursor abierto bloquearía las
+    escrituras del mismo archivo, así que se pagina por clave.
+    """
+    query = select(Diagnosis.id, Diagnosis.symptoms).order_by(Diagnosis.id)
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                query.where(Diagnosis.id > last_id)
+            )
+            for rows in result.partitions():
+                yield [row.id for row in rows], [row.symptoms or '' for row in rows]
+        return
+
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(query.where(Diagnosis.id > last_id).limit(chunk_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [row.id for row in rows], [row.symptoms or '' for row in rows]
+
+def rescore(engine, model_path, run_id=None, checkpoint_path=None, chunk_size=5000, workers=1):
+    """
+    Re-evaluar todos los diagnósticos posteriores al checkpoint.
+
+    Los lotes se envían a un pool de procesos con una ventana acotada de
+    tareas en vuelo (la memoria no crece con el tamaño de la tabla) y se
+    confirman en orden, de modo que el checkpoint siempre es un prefijo
+    completamente escrito del historial.
+    """
+    run_id = run_id or model_run_id(model_path)
+    checkpoint_path = checkpoint_path or os.path.join(
+        os.path.dirname(__file__), 'data', f'rescore_{run_id}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    checkpoint = read_checkpoint(checkpoint_path, run_id)
+    if checkpoint['last_id']:
+        logger.info(f"Reanudando corrida {run_id} desde el diagnóstico {checkpoint['last_id']}")
+
+    def commit(ids, labels, confidences):
+        write_results(engine, run_id, ids, labels, confidences)
+        checkpoint['last_id'] = ids[-1]
+        checkpoint['processed'] += len(ids)
+        write_checkpoint(checkpoint_path, checkpoint)
+
+    start = time.perf_counter()
+    chunks = iter_chunks(engine, checkpoint['last_id'], chunk_size)
+
+    if workers <= 1:
+        _init_worker(model_path)
+        for ids, texts in chunks:
+            commit(ids, *score_texts(texts))
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+            in_flight = deque()
+            for ids, texts in chunks:
+                in_flight.append((ids, pool.apply_async(score_texts, (texts,))))
+                if len(in_flight) >= workers * 2:
+                    ids_done, pending = in_flight.popleft()
+                    commit(ids_done, *pending.get())
+            while in_flight:
+                ids_done, pending = in_flight.popleft()
+                commit(ids_done, *pending.get())
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Corrida {run_id}: {checkpoint['processed']} diagnósticos ({elapsed:.1f}s)")
+    return run_id, checkpoint
+
+def disagreement_report(engine, run_id):
+    """Desacuerdos entre el diagnóstico guardado y el modelo candidato, por enfermedad y severidad"""
+    disagree = case((DiagnosisRescore.predicted_disease != Diagnosis.predicted_disease, 1), else_=0)
+    query = (
+        select(
+            Diagnosis.predicted_disease,
+            Diagnosis.severity,
+            func.count().label('total'),
+            func.sum(disagree).label('disagreements')
+        )
+        .join(DiagnosisRescore, DiagnosisRescore.diagnosis_id == Diagnosis.id)
+        .where(DiagnosisRescore.run_id == run_id)
+        .group_by(Diagnosis.predicted_disease, Diagnosis.severity)
+        .order_by(func.sum(disagree).desc(), Diagnosis.predicted_disease)
+    )
+    transitions = (
+        select(
+            Diagnosis.predicted_disease.label('stored'),
+            DiagnosisRescore.predicted_disease.label('candidate'),
+            func.count().label('count')
+        )
+        .join(DiagnosisRescore, DiagnosisRescore.diagnosis_id == Diagnosis.id)
+        .where(DiagnosisRescore.run_id == run_id,
+               DiagnosisRescore.predicted_disease != Diagnosis.predicted_disease)
+        .group_by(Diagnosis.predicted_disease, DiagnosisRescore.predicted_disease)
+        .order_by(func.count().desc())
+        .limit(20)
+    )
+    with engine.connect() as conn:
+        groups = [
+            {
+                'disease': row.predicted_disease,
+                'severity': row.severity,
+                'total': row.total,
+                'disagreements': int(row.disagreements or 0),
+                'disagreement_rate': round((row.disagreements or 0) / row.total, 4)
+            }
+            for row in conn.execute(query)
+        ]
+        top_changes = [dict(row._mapping) for row in conn.execute(transitions)]
+
+    total = sum(group['total'] for group in groups)
+    disagreements = sum(group['disagreements'] for group in groups)
+    return {
+        'run_id': run_id,
+        'total': total,
+        'disagreements': disagreements,
+        'disagreement_rate': round(disagreements / total, 4) if total else None,
+        'by_disease_severity': groups,
+        'top_changes': top_changes
+    }
+
+def print_report(report):
+    print(f"\nCorrida {report['run_id']}: {report['disagreements']}/{report['total']} desacuerdos "
+          f"({(report['disagreement_rate'] or 0) * 100:.2f}%)")
+    print(f"{'enfermedad':<28} {'severidad':<10} {'total':>8} {'desac.':>8} {'tasa':>7}")
+    for group in report['by_disease_severity']:
+        print(f"{group['disease']:<28} {str(group['severity']):<10} {group['total']:>8} "
+              f"{group['disagreements']:>8} {group['disagreement_rate'] * 100:6.2f}%")
+    if report['top_changes']:
+        print("\nCambios más frecuentes:")
+        for change in report['top_changes']:
+            print(f"  {change['stored']} -> {change['candidate']}: {change['count']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-evaluar el historial con un modelo candidato')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Pipeline candidato (.pkl)')
+    parser.add_argument('--run-id', help='Identificador de la corrida (por defecto, hash del modelo)')
+    parser.add_argument('--checkpoint', help='Archivo de checkpoint')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--report', help='Guardar el reporte de desacuerdos en JSON')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        run_id, _ = rescore(db.engine, args.model, args.run_id, args.checkpoint,
+                            args.chunk_size, args.workers)
+        report = disagreement_report(db.engine, run_id)
+
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Esquemas de serialización para los modelos de la API
+Cada esquema se compila una sola vez por clase y se usa como método to_dict
+"""
+
+from operator import attrgetter
+
+
+def compile_schema(*fields):
+    """
+    Compilar un esquema de serialización a una función obj -> dict.
+
+    Cada campo puede ser:
+      - 'atributo': se copia con el mismo nombre
+      - ('clave', 'atributo'): se copia el atributo con otro nombre
+      - ('clave', funcion): valor calculado con funcion(obj)
+
+    Los atributos simples se leen con un único attrgetter (una llamada en C por
+    fila). Las fechas se dejan como datetime para que el proveedor JSON las
+    serialice de forma nativa.
+    """
+    keys = []
+    attributes = []
+    computed = []
+
+    for position, field in enumerate(fields):
+        key, source = (field, field) if isinstance(field, str) else field
+        keys.append(key)
+        if callable(source):
+            computed.append((position, source))
+        else:
+            attributes.append(source)
+
+    keys = tuple(keys)
+    getter = attrgetter(*attributes) if attributes else None
+
+    if not computed:
+        if len(attributes) == 1:
+            def serialize(obj):
+                return {keys[0]: getter(obj)}
+        else:
+            def serialize(obj):
+                return dict(zip(keys, getter(obj)))
+        return serialize
+
+    def serialize(obj):
+        values = list(getter(obj)) if len(attributes) > 1 else ([getter(obj)] if getter else [])
+        for position, function in computed:
+            values.insert(position, function(obj))
+        return dict(zip(keys, values))
+
+    return serialize
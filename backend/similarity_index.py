@@ -0,0 +1,317 @@
+"""
+Índice invertido de casos similares sobre el espacio TF-IDF del modelo
+Segmentos persistentes inmutables (listas de postings en .npy, cargadas con
+mmap) más un segmento delta en memoria con los diagnósticos nuevos. Al
+vaciarse, el delta se escribe como un segmento nuevo y los segmentos más
+recientes se fusionan en bloque cuando igualan al anterior (fusión
+logarítmica): cada diagnóstico se reescribe O(log n) veces, no en cada vaciado
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+LOCK_FILE = 'build.lock'
+ARRAYS = ('indptr', 'doc_ids', 'weights', 'diagnosis_ids')
+
+# Segmentos sin referencia en meta.json (de otros procesos) que se borran tras este plazo
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def vectorizer_fingerprint(vectorizer):
+    """Huella del vocabulario e idf: el índice solo es válido para el mismo vectorizador"""
+    digest = hashlib.sha1()
+    vocabulary = sorted((term, int(index)) for term, index in vectorizer.vocabulary_.items())
+    digest.update(json.dumps(vocabulary, ensure_ascii=False).encode('utf-8'))
+    digest.update(np.asarray(vectorizer.idf_, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def build_lock(path):
+    """Bloqueo no bloqueante entre procesos para construir el índice; produce False si otro lo tiene"""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), 'w') as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _segment(diagnosis_ids, matrix):
+    """Segmento (arreglos CSC planos) a partir de una matriz documentos x términos"""
+    matrix = sp.csc_matrix(matrix, dtype=np.float32)
+    matrix.sort_indices()
+    return {
+        'indptr': matrix.indptr.astype(np.int64),
+        'doc_ids': matrix.indices.astype(np.int32),
+        'weights': matrix.data.astype(np.float32),
+        'diagnosis_ids': np.asarray(diagnosis_ids, dtype=np.int64)
+    }
+
+
+def _segment_matrix(segment, n_terms):
+    return sp.csc_matrix(
+        (segment['weights'], segment['doc_ids'], segment['indptr']),
+        shape=(len(segment['diagnosis_ids']), n_terms)
+    )
+
+
+class SimilarityIndex:
+    """
+    Vecinos más cercanos por similitud coseno (los vectores TF-IDF ya están
+    normalizados L2, así que el producto punto es el coseno).
+
+    Cada segmento es una matriz CSC documentos x términos guardada como
+    arreglos planos: para cada término, los documentos que lo contienen y su
+    peso. Una consulta solo recorre los postings de sus propios términos.
+
+    La marca de agua es el id hasta el que no pueden aparecer diagnósticos
+    nuevos; los indexados por encima de ella se recuerdan para no repetirlos.
+    """
+
+    def __init__(self, vectorizer, path=None, flush_threshold=10000):
+        self.vectorizer = vectorizer
+        self.fingerprint = vectorizer_fingerprint(vectorizer)
+        self.n_terms = len(vectorizer.vocabulary_)
+        self.path = path
+        self.flush_threshold = flush_threshold
+        self.watermark = 0
+        self._recent = set()
+        self._lock = threading.Lock()
+        # Del más antiguo (y grande) al más reciente
+        self._segments = []
+        self._delta_ids = []
+        self._delta_rows = []
+        self._delta = (np.zeros(0, dtype=np.int64), sp.csr_matrix((0, self.n_terms), dtype=np.float32))
+
+    def __len__(self):
+        return sum(len(s['diagnosis_ids']) for s in self._segments) + len(self._delta[0])
+
+    def _vectorize(self, texts):
+        return sp.csr_matrix(self.vectorizer.transform(list(texts)), dtype=np.float32)
+
+    def _is_new(self, diagnosis_id):
+        return diagnosis_id > self.watermark and diagnosis_id not in self._recent
+
+    # ---------- Escritura ----------
+
+    def add(self, diagnosis_ids, texts):
+        """
+        Agregar diagnósticos al segmento delta. Se ignoran los ids que no
+        superan la marca de agua o que ya se agregaron. Devuelve cuántos se agregaron.
+        """
+        pairs = [(int(i), t or '') for i, t in zip(diagnosis_ids, texts) if self._is_new(int(i))]
+        if not pairs:
+            return 0
+        ids = np.array([i for i, _ in pairs], dtype=np.int64)
+        rows = self._vectorize(t for _, t in pairs)
+
+        with self._lock:
+            # Otro hilo pudo haber indexado los mismos ids mientras se vectorizaba
+            fresh = np.array([self._is_new(int(i)) for i in ids])
+            if not fresh.any():
+                return 0
+            ids, rows = ids[fresh], rows[fresh]
+            self._delta_ids.append(ids)
+            self._delta_rows.append(rows)
+            self._delta = (np.concatenate(self._delta_ids), sp.vstack(self._delta_rows, format='csr'))
+            self._recent.update(ids.tolist())
+            pending = len(self._delta[0])
+
+        if pending >= self.flush_threshold:
+            self.flush()
+        return len(ids)
+
+    def settle(self, watermark):
+        """
+        Avanzar la marca de agua: a partir de aquí no pueden aparecer
+        diagnósticos con id menor o igual (sus transacciones ya terminaron)
+        """
+        with self._lock:
+            if watermark > self.watermark:
+                self.watermark = watermark
+                self._recent = {i for i in self._recent if i > watermark}
+
+    def flush(self):
+        """
+        Escribir el delta como segmento nuevo, fusionar en bloque los segmentos
+        recientes que sumen al menos el tamaño del anterior y persistir (si hay ruta)
+        """
+        with self._lock:
+            delta_ids, delta_rows = self._delta
+            segments = list(self._segments)
+            if len(delta_ids):
+                segments.append(_segment(delta_ids, delta_rows))
+                sizes = [len(s['diagnosis_ids']) for s in segments]
+                start = len(segments) - 1
+                total = sizes[start]
+                while start > 0 and total >= sizes[start - 1]:
+                    start -= 1
+                    total += sizes[start]
+                if start < len(segments) - 1:
+                    group = segments[start:]
+                    segments[start:] = [_segment(
+                        np.concatenate([s['diagnosis_ids'] for s in group]),
+                        sp.vstack([_segment_matrix(s, self.n_terms) for s in group])
+                    )]
+            if self.path:
+                self._save(segments)
+            self._segments = segments
+            self._delta_ids, self._delta_rows = [], []
+            self._delta = (np.zeros(0, dtype=np.int64), sp.csr_matrix((0, self.n_terms), dtype=np.float32))
+
+    def _save(self, segments):
+        """
+        Escribir los segmentos nuevos y publicar la lista reemplazando meta.json.
+        Los segmentos que otro proceso ya borró se reescriben desde memoria (los
+        arreglos mapeados siguen siendo legibles tras el borrado)
+        """
+        os.makedirs(self.path, exist_ok=True)
+        previous = {s['id'] for s in self._segments if 'id' in s}
+        for number, segment in enumerate(segments):
+            if 'id' in segment and os.path.exists(self._array_path('diagnosis_ids', segment['id'])):
+                continue
+            segment_id = segment.get('id') or f'{time.time_ns()}-{os.getpid()}-{number}'
+            for name in ARRAYS:
+                np.save(self._array_path(name, segment_id), np.asarray(segment[name]))
+            segment['id'] = segment_id
+
+        current = {s['id'] for s in segments}
+        meta = {
+            'fingerprint': self.fingerprint,
+            'n_terms': self.n_terms,
+            'segments': [{'id': s['id'], 'n_docs': int(len(s['diagnosis_ids']))} for s in segments],
+            'watermark': self.watermark,
+            'recent': sorted(self._recent)
+        }
+        tmp_path = os.path.join(self.path, f'{META_FILE}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+        # Los procesos que tengan mapeado un segmento borrado lo conservan hasta cerrarlo
+        expired = time.time() - ORPHAN_GRACE_SECONDS
+        for filename in os.listdir(self.path):
+            if not filename.endswith('.npy'):
+                continue
+            segment_id = filename.split('.')[1]
+            if segment_id in current:
+                continue
+            file_path = os.path.join(self.path, filename)
+            try:
+                if segment_id in previous or os.path.getmtime(file_path) < expired:
+                    os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def _array_path(self, name, segment_id):
+        return os.path.join(self.path, f'{name}.{segment_id}.npy')
+
+    @classmethod
+    def load(cls, path, vectorizer, flush_threshold=10000):
+        """Cargar los segmentos con mmap; None si no existen o son de otro vectorizador"""
+        meta = _read_meta(path)
+        index = cls(vectorizer, path, flush_threshold)
+        if meta is None or meta.get('fingerprint') != index.fingerprint or 'segments' not in meta:
+            return None
+        try:
+            index._segments = [
+                dict({name: np.load(index._array_path(name, s['id']), mmap_mode='r') for name in ARRAYS}, id=s['id'])
+                for s in meta['segments']
+            ]
+        except FileNotFoundError:
+            return None
+        index.watermark = meta['watermark']
+        index._recent = set(meta['recent'])
+        return index
+
+    # ---------- Consulta ----------
+
+    def query(self, text, k=5, exclude=None):
+        """Los k diagnósticos más similares: lista de (diagnosis_id, similitud)"""
+        vector = self._vectorize([text])
+        if vector.nnz == 0 or k <= 0:
+            return []
+        with self._lock:
+            segments = self._segments
+            delta_ids, delta_rows = self._delta
+
+        candidate_ids = []
+        candidate_scores = []
+
+        # Segmentos persistentes: acumular solo los postings de los términos de la consulta
+        terms = vector.indices
+        for segment in segments:
+            starts, ends = segment['indptr'][terms], segment['indptr'][terms + 1]
+            if not (ends > starts).any():
+                continue
+            docs = np.concatenate([segment['doc_ids'][s:e] for s, e in zip(starts, ends)])
+            contributions = np.concatenate([
+                segment['weights'][s:e] * w for s, e, w in zip(starts, ends, vector.data)
+            ])
+            n_docs = len(segment['diagnosis_ids'])
+            if len(docs) * 8 < n_docs:
+                positions, inverse = np.unique(docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=contributions)
+            else:
+                # Postings densos: top-k directo sobre el acumulador (k + 1 por la exclusión)
+                scores = np.bincount(docs, weights=contributions, minlength=n_docs)
+                take = min(k + 1, n_docs)
+                positions = np.argpartition(-scores, take - 1)[:take]
+                positions = positions[scores[positions] > 0]
+                scores = scores[positions]
+            candidate_ids.append(np.asarray(segment['diagnosis_ids'][positions]))
+            candidate_scores.append(scores)
+
+        # Segmento delta: producto disperso directo
+        if len(delta_ids):
+            scores = (delta_rows @ vector.T).toarray().ravel()
+            positions = np.flatnonzero(scores)
+            candidate_ids.append(delta_ids[positions])
+            candidate_scores.append(scores[positions])
+
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        if exclude is not None:
+            keep = ids != exclude
+            ids, scores = ids[keep], scores[keep]
+
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.lexsort((ids, -scores))
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
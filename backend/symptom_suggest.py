@@ -0,0 +1,77 @@
+"""
+Autocompletado de síntomas a partir del vocabulario del modelo
+Arreglo ordenado de términos normalizados (sin tildes) con búsqueda binaria por prefijo
+"""
+
+import heapq
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+
+def normalize_term(text):
+    """Minúsculas y sin tildes: 'Respiración' -> 'respiracion'"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class SymptomSuggester:
+    """
+    Sugerencias de términos del vocabulario ordenadas por frecuencia histórica.
+
+    Los prefijos cortos (hasta `precomputed_length` caracteres) abarcan rangos
+    grandes del arreglo, así que su resultado se precalcula al construir.
+    """
+
+    def __init__(self, vocabulary, frequencies=None, limit=10, precomputed_length=2):
+        frequencies = frequencies or {}
+        entries = sorted(
+            (normalize_term(term), -frequencies.get(term, 0), term)
+            for term in vocabulary
+        )
+        self.keys = [key for key, _, _ in entries]
+        self.terms = [term for _, _, term in entries]
+        self.frequencies = [-negative for _, negative, _ in entries]
+        self.limit = limit
+        self.vectorizer = None
+        self.precomputed_length = precomputed_length
+        self._precomputed = {}
+        for key in set(self.keys):
+            for n in range(1, precomputed_length + 1):
+                prefix = key[:n]
+                if prefix not in self._precomputed:
+                    self._precomputed[prefix] = self._search(prefix, limit)
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, texts=(), **kwargs):
+        """Vocabulario de un TfidfVectorizer y frecuencias contadas con su mismo analizador"""
+        analyze = vectorizer.build_analyzer()
+        vocabulary = vectorizer.vocabulary_
+        frequencies = Counter()
+        for text in texts:
+            frequencies.update(term for term in analyze(text or '') if term in vocabulary)
+        suggester = cls(vocabulary.keys(), frequencies, **kwargs)
+        suggester.vectorizer = vectorizer
+        return suggester
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _search(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        matches = heapq.nsmallest(
+            limit, range(start, end),
+            key=lambda i: (-self.frequencies[i], len(self.keys[i]), self.keys[i])
+        )
+        return [{'term': self.terms[i], 'frequency': self.frequencies[i]} for i in matches]
+
+    def suggest(self, prefix, limit=None):
+        """Hasta `limit` términos que empiezan por `prefix` (sin distinguir tildes)"""
+        limit = limit or self.limit
+        key = normalize_term(prefix.strip())
+        if not key:
+            return []
+        if len(key) <= self.precomputed_length and limit <= self.limit:
+            return self._precomputed.get(key, [])[:limit]
+        return self._search(key, limit)
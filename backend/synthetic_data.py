@@ -0,0 +1,384 @@
+"""
+Generador de datos sintéticos a escala: pacientes, diagnósticos, pruebas y citas
+Los síntomas se muestrean de una distribución de términos por enfermedad (los
+términos de SYMPTOM_DISEASE_DATA más ruido de otras enfermedades y modificadores),
+por lotes vectorizados con numpy. Con la misma semilla y tamaño de lote la salida
+es idéntica. Los diagnósticos referencian las entradas de los catálogos de
+medicamentos y pruebas, como en /api/diagnose. Se escribe directo a la BD (COPY
+en PostgreSQL, inserción por lotes en otros motores) o a archivos CSV/Parquet
+por tabla
+
+Uso: python synthetic_data.py --patients 300000 [--diagnoses-per-patient 3] [--seed 42]
+     python synthetic_data.py --patients 300000 --output-dir data/synthetic --format parquet
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app import (app, db, catalog_version, Patient, Diagnosis, MedicalTest, Appointment, MedicationSet, TestPanel,
+                 SUPPORT_TEST_PANEL, SUPPORT_TESTS)
+from train_model import SYMPTOM_DISEASE_DATA, MEDICATIONS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DISEASES = SYMPTOM_DISEASE_DATA['disease']
+SEVERITY = dict(zip(DISEASES, SYMPTOM_DISEASE_DATA['severity']))
+EXAM_NEEDED = dict(zip(DISEASES, SYMPTOM_DISEASE_DATA['exam_needed']))
+
+# Prevalencia relativa (consultas de atención primaria)
+PREVALENCE = {
+    'Resfriado Común': 18, 'Gripe/Influenza': 12, 'Faringitis': 10, 'Infección Viral': 9,
+    'Gastroenteritis': 9, 'Hipertensión': 8, 'Dermatitis/Alergia': 7, 'Bronquitis': 6,
+    'Artritis': 5, 'Otitis': 4, 'Conjuntivitis': 4, 'Asma': 3, 'Mareos/Vértigo': 2,
+    'Hipotensión': 2, 'Neumonía': 1,
+}
+
+# Términos fuera del vocabulario del modelo, como los que escriben los pacientes
+MODIFIERS = ['intenso', 'leve', 'persistente', 'agudo', 'cronico', 'nocturno', 'repentino', 'constante']
+
+TEST_RESULTS = ['Dentro de parámetros normales', 'Leucocitos elevados', 'Proteína C reactiva elevada',
+                'Sin hallazgos patológicos', 'Infiltrado compatible con proceso infeccioso']
+
+FIRST_NAMES = {
+    'M': ['Juan', 'Carlos', 'Luis', 'José', 'Miguel', 'Andrés', 'Diego', 'Jorge', 'Pedro', 'Santiago'],
+    'F': ['María', 'Ana', 'Lucía', 'Sofía', 'Carmen', 'Valentina', 'Daniela', 'Isabel', 'Paula', 'Gabriela'],
+}
+SURNAMES = ['García', 'Rodríguez', 'López', 'Martínez', 'González', 'Pérez', 'Sánchez', 'Ramírez',
+            'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Vargas', 'Castro', 'Morales']
+EXERCISE = ['sedentario', 'moderado', 'activo']
+ALCOHOL = ['nunca', 'ocasional', 'frecuente']
+
+# ---------- Distribución de síntomas ----------
+
+class SymptomSampler:
+    """
+    Matriz de probabilidades (enfermedad x término). Cada enfermedad reparte
+    1 - `noise` entre sus propios términos y `noise` entre los del resto.
+    El muestreo sin reemplazo de k términos por fila usa el truco de
+    Gumbel-top-k, vectorizado para todo el lote.
+    """
+
+    def __init__(self, noise=0.1, min_terms=2, max_terms=6):
+        self.tokens = np.array(sorted({t for s in SYMPTOM_DISEASE_DATA['symptoms'] for t in s.split()}))
+        index = {token: i for i, token in enumerate(self.tokens)}
+        self.min_terms = min_terms
+        self.max_terms = max_terms
+        self.log_probabilities = np.full((len(DISEASES), len(self.tokens)), -np.inf)
+        for d, symptoms in enumerate(SYMPTOM_DISEASE_DATA['symptoms']):
+            own = [index[t] for t in set(symptoms.split())]
+            weights = np.full(len(self.tokens), noise / (len(self.tokens) - len(own)))
+            weights[own] = (1 - noise) / len(own)
+            self.log_probabilities[d] = np.log(weights)
+
+    def sample(self, rng, disease_codes):
+        n = len(disease_codes)
+        keys = self.log_probabilities[disease_codes] + rng.gumbel(size=(n, len(self.tokens)))
+        top = np.argsort(-keys, axis=1)[:, :self.max_terms]
+        counts = rng.integers(self.min_terms, self.max_terms + 1, size=n)
+        modifiers = np.where(rng.random(n) < 0.2, rng.integers(0, len(MODIFIERS), size=n), -1)
+        texts = []
+        for row, count, modifier in zip(self.tokens[top], counts, modifiers):
+            terms = list(row[:count])
+            if modifier >= 0:
+                terms.append(MODIFIERS[modifier])
+            texts.append(' '.join(terms))
+        return texts
+
+# ---------- Generación por lotes ----------
+
+def to_datetimes(values):
+    return values.astype('datetime64[us]').tolist()
+
+def catalog_entries():
+    """Entradas (tabla, [(nombre, contenido)]) que referencian los diagnósticos, como en la API"""
+    medications = [(disease, MEDICATIONS[disease]) for disease in DISEASES if MEDICATIONS.get(disease)]
+    return [
+        (MedicationSet.__table__, medications),
+        (TestPanel.__table__, [(SUPPORT_TEST_PANEL, SUPPORT_TESTS)]),
+    ]
+
+def generate_batch(rng, sampler, first_patient, n_patients, first_diagnosis_id, args, catalogs):
+    """
+    Columnas por tabla para un lote de pacientes y sus diagnósticos; `catalogs`
+    son los ids de entrada por tabla de catálogo y nombre (ver Writer.catalog)
+    """
+    start = np.datetime64(args.start_date, 's')
+    span = args.days * 86400
+
+    # Pacientes
+    numbers = np.arange(first_patient, first_patient + n_patients)
+    cedulas = [f'{args.cedula_offset + i:010d}' for i in numbers]
+    genders = rng.choice(['M', 'F'], size=n_patients)
+    first = rng.integers(0, 10, size=n_patients)
+    last = rng.integers(0, len(SURNAMES), size=(n_patients, 2))
+    names = [f'{FIRST_NAMES[g][f]} {SURNAMES[a]} {SURNAMES[b]}' for g, f, (a, b) in zip(genders, first, last)]
+    height = np.where(genders == 'M', rng.normal(172, 8, n_patients), rng.normal(160, 7, n_patients))
+    systolic = np.clip(rng.normal(122, 15, n_patients), 85, 200).astype(int)
+    patients = {
+        'cedula': cedulas,
+        'name': names,
+        'age': np.clip(rng.gamma(4.0, 10.0, n_patients), 1, 100).astype(int).tolist(),
+        'gender': genders.tolist(),
+        'email': [f'paciente.{c}@example.com' for c in cedulas],
+        'phone': [f'+593 9{n:08d}' for n in rng.integers(0, 10 ** 8, n_patients)],
+        'height': np.round(height, 1).tolist(),
+        'weight': np.round(np.clip(rng.normal(height - 100, 12), 35, 180), 1).tolist(),
+        'blood_pressure_systolic': systolic.tolist(),
+        'blood_pressure_diastolic': (systolic * rng.uniform(0.6, 0.7, n_patients)).astype(int).tolist(),
+        'temperature': np.round(rng.normal(36.7, 0.4, n_patients), 1).tolist(),
+        'exercise': rng.choice(EXERCISE, n_patients).tolist(),
+        'smokes': (rng.random(n_patients) < 0.15).tolist(),
+        'alcohol_consumption': rng.choice(ALCOHOL, n_patients, p=[0.4, 0.45, 0.15]).tolist(),
+        'created_at': to_datetimes(start - rng.integers(0, 365 * 86400, n_patients)),
+    }
+
+    # Diagnósticos: Poisson por paciente, enfermedad por prevalencia
+    per_patient = rng.poisson(args.diagnoses_per_patient, n_patients)
+    owners = np.repeat(np.arange(n_patients), per_patient)
+    n = len(owners)
+    prevalence = np.array([PREVALENCE[d] for d in DISEASES], dtype=float)
+    true_codes = rng.choice(len(DISEASES), size=n, p=prevalence / prevalence.sum())
+    correct = rng.random(n) < args.model_accuracy
+    predicted = np.where(correct, true_codes, rng.choice(len(DISEASES), size=n, p=prevalence / prevalence.sum()))
+    confidence = np.where(correct, 55 + 45 * rng.beta(5, 2, n), 25 + 55 * rng.beta(2, 3, n)).round(2)
+    low_confidence = confidence < 84
+    created = start + rng.integers(0, span, n)
+    diagnosis_ids = np.arange(first_diagnosis_id, first_diagnosis_id + n)
+    diseases = [DISEASES[c] for c in predicted]
+    medication_sets = catalogs['medication_sets']
+    support_panel_id = catalogs['test_panels'][SUPPORT_TEST_PANEL]
+    diagnoses = {
+        'id': diagnosis_ids.tolist(),
+        'patient_cedula': [cedulas[o] for o in owners],
+        'symptoms': sampler.sample(rng, true_codes),
+        'predicted_disease': diseases,
+        'confidence': confidence.tolist(),
+        'severity': [SEVERITY[d] for d in diseases],
+        'requires_exam': (low_confidence | np.array([EXAM_NEEDED[d] for d in diseases], dtype=bool)).tolist(),
+        'medication_set_id': [medication_sets.get(d) for d in diseases],
+        'test_panel_id': [support_panel_id if low else None for low in low_confidence],
+        'report_generated': False,
+        'created_at': to_datetimes(created),
+    }
+
+    # Pruebas de apoyo y cita de seguimiento para confianza < 84%, como en /api/diagnose
+    low = np.flatnonzero(low_confidence)
+    test_rows = np.repeat(low, len(SUPPORT_TESTS))
+    test_kinds = np.tile(np.arange(len(SUPPORT_TESTS)), len(low))
+    completed = rng.random(len(test_rows)) < args.completed_rate
+    results = rng.integers(0, len(TEST_RESULTS), len(test_rows))
+    medical_tests = {
+        'diagnosis_id': diagnosis_ids[test_rows].tolist(),
+        'patient_cedula': [diagnoses['patient_cedula'][i] for i in test_rows],
+        'test_type': [SUPPORT_TESTS[k]['test_type'] for k in test_kinds],
+        'description': [SUPPORT_TESTS[k]['description'] for k in test_kinds],
+        'status': np.where(completed, 'completed', 'recommended').tolist(),
+        'results': [TEST_RESULTS[r] if c else None for r, c in zip(results, completed)],
+        'requested_at': to_datetimes(created[test_rows]),
+    }
+    follow_up = created[low] + np.timedelta64(7, 'D')
+    appointments = {
+        'patient_cedula': [diagnoses['patient_cedula'][i] for i in low],
+        'diagnosis_id': diagnosis_ids[low].tolist(),
+        'scheduled_date': to_datetimes(follow_up),
+        'reason': 'Evaluación de pruebas de apoyo',
+        'status': np.where(rng.random(len(low)) < args.completed_rate, 'completed', 'scheduled').tolist(),
+        'created_at': to_datetimes(created[low]),
+    }
+
+    return [
+        (Patient.__table__, patients, n_patients),
+        (Diagnosis.__table__, diagnoses, n),
+        (MedicalTest.__table__, medical_tests, len(test_rows)),
+        (Appointment.__table__, appointments, len(low)),
+    ]
+
+def expand(columns, n):
+    """Columnas constantes (escalares) a listas de longitud n"""
+    return {name: values if isinstance(values, list) else [values] * n for name, values in columns.items()}
+
+def is_json(table, name):
+    return isinstance(table.c[name].type, db.JSON)
+
+# ---------- Escritores ----------
+
+class DatabaseWriter:
+    """COPY FROM STDIN en PostgreSQL; inserción por lotes (executemany) en otros motores"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def catalog(self, table, entries):
+        """Ids por nombre de las entradas del catálogo, creando las que falten (como catalog_entry_ids)"""
+        wanted = {(name, catalog_version(items)): items for name, items in entries}
+        if not wanted:
+            return {}
+
+        def existing(conn):
+            rows = conn.execute(select(table.c.name, table.c.version, table.c.id)
+                                .where(table.c.version.in_({version for _, version in wanted})))
+            return {name: entry_id for name, version, entry_id in rows if (name, version) in wanted}
+
+        with self.engine.begin() as conn:
+            ids = existing(conn)
+            missing = [{'name': name, 'version': version, 'items': items, 'created_at': datetime.utcnow()}
+                       for (name, version), items in wanted.items() if name not in ids]
+            if missing:
+                conn.execute(table.insert(), missing)
+                ids = existing(conn)
+        return ids
+
+    def write(self, table, columns, n):
+        if not n:
+            return
+        columns = expand(columns, n)
+        names = list(columns)
+        if self.engine.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            encoded = [
+                [json.dumps(v, ensure_ascii=False) for v in columns[name]] if is_json(table, name) else columns[name]
+                for name in names
+            ]
+            writer.writerows(zip(*encoded))
+            buffer.seek(0)
+            raw = self.engine.raw_connection()
+            try:
+                with raw.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)", buffer
+                    )
+                raw.commit()
+            finally:
+                raw.close()
+        else:
+            with self.engine.begin() as conn:
+                conn.execute(table.insert(), [dict(zip(names, row)) for row in zip(*columns.values())])
+
+    def close(self):
+        if self.engine.dialect.name == 'postgresql':
+            # Los ids explícitos de diagnósticos no avanzan la secuencia
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('diagnoses', 'id'), "
+                    "(SELECT COALESCE(MAX(id), 1) FROM diagnoses))"
+                ))
+
+class FileWriter:
+    """Un archivo por tabla (CSV con encabezado o Parquet con un row group por lote)"""
+
+    def __init__(self, output_dir, fmt='csv'):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.files = {}
+
+    def catalog(self, table, entries):
+        """Escribir las entradas del catálogo con ids consecutivos; devuelve los ids por nombre"""
+        ids = {name: entry_id for entry_id, (name, _) in enumerate(entries, start=1)}
+        self.write(table, {
+            'id': list(ids.values()),
+            'name': [name for name, _ in entries],
+            'version': [catalog_version(items) for _, items in entries],
+            'items': [items for _, items in entries],
+        }, len(entries))
+        return ids
+
+    def write(self, table, columns, n):
+        if not n:
+            return
+        columns = expand(columns, n)
+        for name in columns:
+            if is_json(table, name):
+                columns[name] = [json.dumps(v, ensure_ascii=False) for v in columns[name]]
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            batch = pa.Table.from_pydict(columns)
+            if table.name not in self.files:
+                path = os.path.join(self.output_dir, f'{table.name}.parquet')
+                self.files[table.name] = pq.ParquetWriter(path, batch.schema, compression='zstd')
+            self.files[table.name].write_table(batch)
+        else:
+            if table.name not in self.files:
+                f = open(os.path.join(self.output_dir, f'{table.name}.csv'), 'w', newline='', encoding='utf-8')
+                csv.writer(f).writerow(columns)
+                self.files[table.name] = f
+            csv.writer(self.files[table.name]).writerows(zip(*columns.values()))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+# ---------- Job ----------
+
+def generate(writer, args, first_diagnosis_id=1):
+    """Generar `args.patients` pacientes en lotes de `args.batch_size`; devuelve filas por tabla"""
+    sampler = SymptomSampler(args.noise)
+    catalogs = {table.name: writer.catalog(table, entries) for table, entries in catalog_entries()}
+    totals = {}
+    start = time.perf_counter()
+    for batch_number, first in enumerate(range(0, args.patients, args.batch_size)):
+        rng = np.random.default_rng([args.seed, batch_number])
+        n_patients = min(args.batch_size, args.patients - first)
+        tables = generate_batch(rng, sampler, first, n_patients, first_diagnosis_id, args, catalogs)
+        for table, columns, n in tables:
+            writer.write(table, columns, n)
+            totals[table.name] = totals.get(table.name, 0) + n
+        first_diagnosis_id += tables[1][2]
+        rows = sum(totals.values())
+        logger.info(f"{first + n_patients}/{args.patients} pacientes, {rows} filas "
+                    f"({rows / (time.perf_counter() - start):.0f} filas/s)")
+    writer.close()
+    return totals
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Generar datos sintéticos reproducibles')
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--diagnoses-per-patient', type=float, default=3.0, help='Media (Poisson)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=10000, help='Pacientes por lote')
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--days', type=int, default=730, help='Días cubiertos por los diagnósticos')
+    parser.add_argument('--model-accuracy', type=float, default=0.85,
+                        help='Fracción de diagnósticos con la enfermedad verdadera')
+    parser.add_argument('--completed-rate', type=float, default=0.6,
+                        help='Fracción de pruebas y citas completadas')
+    parser.add_argument('--noise', type=float, default=0.1,
+                        help='Probabilidad de términos de otras enfermedades')
+    parser.add_argument('--cedula-offset', type=int, default=2000000000,
+                        help='Primera cédula generada (evita colisiones con datos reales)')
+    parser.add_argument('--output-dir', help='Escribir archivos en lugar de la BD')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    start = time.perf_counter()
+    if args.output_dir:
+        totals = generate(FileWriter(args.output_dir, args.format), args)
+    else:
+        with app.app_context():
+            db.create_all()
+            first_id = (db.session.execute(select(func.max(Diagnosis.id))).scalar() or 0) + 1
+            totals = generate(DatabaseWriter(db.engine), args, first_id)
+    elapsed = time.perf_counter() - start
+    print(f"Generadas {sum(totals.values())} filas en {elapsed:.1f}s: "
+          + ', '.join(f'{name}={count}' for name, count in totals.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark de diagnósticos con copias JSON frente a referencias al catálogo
+Escribe N diagnósticos sintéticos (distribución de enfermedades y confianza
+de synthetic_data.py) con cada esquema y mide el tamaño de la tabla y la
+latencia de escritura de un diagnóstico (add + commit, como /api/diagnose)
+
+Uso: python benchmarks/bench_catalogs.py [n_diagnosticos ...] [--database-url postgresql://...]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session
+
+from app import db, Patient, Diagnosis, MedicationSet, TestPanel, SUPPORT_TEST_PANEL, SUPPORT_TESTS, catalog_version
+from train_model import MEDICATIONS
+from synthetic_data import DISEASES, PREVALENCE, SEVERITY
+
+LATENCY_SAMPLES = 2000
+
+
+def synthetic_rows(n, seed=42):
+    rng = np.random.default_rng(seed)
+    prevalence = np.array([PREVALENCE[d] for d in DISEASES], dtype=float)
+    diseases = rng.choice(DISEASES, size=n, p=prevalence / prevalence.sum())
+    confidence = (25 + 75 * rng.beta(5, 2, n)).round(2)
+    return [
+        {'patient_cedula': '1234567890', 'symptoms': 'fiebre tos dolor de cabeza', 'predicted_disease': d,
+         'confidence': float(c), 'severity': SEVERITY[d], 'requires_exam': bool(c < 84)}
+        for d, c in zip(diseases, confidence)
+    ]
+
+
+def prepare(engine):
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), {'cedula': '1234567890', 'name': 'Ana', 'age': 40,
+                                                  'email': 'ana@example.com'})
+        conn.execute(MedicationSet.__table__.insert(), [
+            {'name': disease, 'version': catalog_version(items), 'items': items} for disease, items in MEDICATIONS.items()
+        ])
+        conn.execute(TestPanel.__table__.insert(), {'name': SUPPORT_TEST_PANEL, 'version': catalog_version(SUPPORT_TESTS),
+                                                    'items': SUPPORT_TESTS})
+        medication_ids = dict(conn.execute(select(MedicationSet.name, MedicationSet.id)).all())
+        panel_id = conn.execute(select(TestPanel.id)).scalar()
+    return medication_ids, panel_id
+
+
+def payload(row, mode, medication_ids, panel_id):
+    low = row['confidence'] < 84
+    if mode == 'json':
+        return dict(row, legacy_medications=MEDICATIONS.get(row['predicted_disease'], []),
+                    legacy_recommended_tests=SUPPORT_TESTS if low else [])
+    return dict(row, medication_set_id=medication_ids.get(row['predicted_disease']),
+                test_panel_id=panel_id if low else None)
+
+
+def table_bytes(engine):
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('VACUUM ANALYZE diagnoses'))
+            return conn.execute(text("SELECT pg_total_relation_size('diagnoses')")).scalar()
+        return conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = 'diagnoses'")).scalar()
+
+
+def run(engine, n, mode):
+    medication_ids, panel_id = prepare(engine)
+    rows = synthetic_rows(n)
+
+    timings = []
+    with Session(engine) as session:
+        for row in rows[:LATENCY_SAMPLES]:
+            start = time.perf_counter()
+            session.add(Diagnosis(**payload(row, mode, medication_ids, panel_id)))
+            session.commit()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    table = Diagnosis.__table__
+    columns = {prop.key: prop.columns[0].name for prop in Diagnosis.__mapper__.column_attrs}
+    with engine.begin() as conn:
+        chunk = 50_000
+        for i in range(LATENCY_SAMPLES, n, chunk):
+            conn.execute(table.insert(), [
+                {columns[key]: value for key, value in payload(row, mode, medication_ids, panel_id).items()}
+                for row in rows[i:i + chunk]
+            ])
+        count = conn.execute(select(func.count()).select_from(table)).scalar()
+    size = table_bytes(engine)
+    return count, size, np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--database-url', help='Base de datos de pruebas (se recrean sus tablas)')
+    args = parser.parse_args()
+
+    print(f"{'diagnósticos':>12} {'esquema':>9} {'MB':>8} {'bytes/fila':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for n in args.sizes:
+            for mode in ('json', 'catalogo'):
+                url = args.database_url or f"sqlite:///{os.path.join(directory, f'{mode}_{n}.db')}"
+                engine = create_engine(url)
+                count, size, p50, p95 = run(engine, n, mode)
+                print(f"{count:>12} {mode:>9} {size / 2 ** 20:8.1f} {size / count:11.0f} {p50:8.2f} {p95:8.2f}")
+                engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark de la transacción de escritura de un diagnóstico: ORM frente a Core
+Escribe N diagnósticos con cada camino (la mitad con pruebas de apoyo y cita,
+como un diagnóstico de confianza < 84%) y mide diagnósticos por segundo y
+latencia por transacción
+
+Uso: python benchmarks/bench_diagnosis_writes.py [n_diagnosticos] [--database-url postgresql://...]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+parser = argparse.ArgumentParser()
+parser.add_argument('n', nargs='?', type=int, default=5000)
+parser.add_argument('--database-url', help='Base de datos de pruebas (se recrean sus tablas)')
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from app import (app, db, Patient, Diagnosis, SUPPORT_TESTS,
+                 write_diagnosis_orm, write_diagnosis_core)
+
+
+def values(i):
+    low = i % 2 == 0
+    return dict(
+        patient_cedula='1234567890', symptoms='fiebre tos dolor de cabeza', symptoms_json=[],
+        predicted_disease='Gripe/Influenza', confidence=70.0 if low else 92.0, severity='Moderada',
+        requires_exam=low, test_panel_id=None, medication_set_id=None, legacy_medications=None,
+        differential=[{'disease': 'Gripe/Influenza', 'confidence': 70.0}], explanation=None
+    ), (SUPPORT_TESTS if low else [])
+
+
+def run(write, n):
+    follow_up = datetime.utcnow() + timedelta(days=7)
+    timings = []
+    start = time.perf_counter()
+    for i in range(n):
+        row, tests = values(i)
+        t0 = time.perf_counter()
+        write(row, tests, follow_up)
+        timings.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    return n / elapsed, np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Patient(cedula='1234567890', name='Ana Torres', age=45, email='ana@example.com'))
+        db.session.commit()
+
+        print(f"{args.n} diagnósticos por camino ({db.engine.dialect.name})")
+        print(f"{'camino':>8} {'diag/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        # Calentamiento: compilación de sentencias y caché de mappers
+        for write in (write_diagnosis_orm, write_diagnosis_core):
+            run(write, 50)
+        for name, write in (('orm', write_diagnosis_orm), ('core', write_diagnosis_core)):
+            rate, p50, p95 = run(write, args.n)
+            print(f"{name:>8} {rate:9.0f} {p50:8.3f} {p95:8.3f}")
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
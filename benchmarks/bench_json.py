@@ -0,0 +1,101 @@
+"""
+Benchmark de serialización JSON de respuestas de la API
+Compara to_dict escrito a mano + jsonify estándar contra esquemas compilados + orjson
+
+Uso: python benchmarks/bench_json.py [filas] [repeticiones]
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask.json.provider import DefaultJSONProvider
+
+from backend.app import app, Diagnosis
+from train_model import SYMPTOM_DISEASE_DATA, MEDICATIONS
+
+
+def legacy_to_dict(d):
+    """to_dict original de Diagnosis (isoformat por fila)"""
+    return {
+        'diagnosis_id': d.id,
+        'id': d.id,
+        'patient_cedula': d.patient_cedula,
+        'symptoms': d.symptoms,
+        'symptoms_detail': d.symptoms_json,
+        'predicted_disease': d.predicted_disease,
+        'confidence': d.confidence,
+        'severity': d.severity,
+        'requires_exam': d.requires_exam,
+        'recommended_tests': d.recommended_tests,
+        'medications': d.medications,
+        'differential': d.differential,
+        'recommendations': d.recommendations,
+        'report_generated': d.report_generated,
+        'created_at': d.created_at.isoformat()
+    }
+
+
+def build_rows(n, seed=42):
+    """Crear diagnósticos en memoria con cargas JSON realistas (copias JSON, sin consultar el catálogo)"""
+    rng = random.Random(seed)
+    samples = list(zip(SYMPTOM_DISEASE_DATA['symptoms'], SYMPTOM_DISEASE_DATA['disease'],
+                       SYMPTOM_DISEASE_DATA['severity']))
+    rows = []
+    for i in range(n):
+        symptoms, disease, severity = rng.choice(samples)
+        confidence = round(rng.uniform(40, 99), 2)
+        rows.append(Diagnosis(
+            id=i,
+            patient_cedula='1234567890',
+            symptoms=symptoms,
+            symptoms_json=[{'symptom': s, 'intensity': rng.choice(['Leve', 'Moderada', 'Alta']),
+                            'duration': f'{rng.randint(1, 14)} días'} for s in symptoms.split()[:2]],
+            predicted_disease=disease,
+            confidence=confidence,
+            severity=severity,
+            requires_exam=True,
+            legacy_recommended_tests=[
+                {'test_type': 'Análisis de sangre', 'description': 'Hemograma completo para confirmar diagnóstico'},
+                {'test_type': 'Radiografía', 'description': 'Radiografía de tórax o área afectada según síntomas'},
+                {'test_type': 'Ecografía', 'description': 'Ecografía para evaluación detallada'}
+            ],
+            legacy_medications=MEDICATIONS.get(disease, []),
+            differential=[{'disease': disease, 'confidence': confidence},
+                          {'disease': 'Infección Viral', 'confidence': round(100 - confidence, 2)}],
+            report_generated=False,
+            created_at=datetime(2024, 1, 1 + i % 28, rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+        ))
+    return rows
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    data = build_rows(rows)
+    standard = DefaultJSONProvider(app)
+
+    with app.app_context():
+        cases = {
+            'to_dict manual + json estándar': lambda: standard.dumps([legacy_to_dict(d) for d in data]),
+            'esquema compilado + json estándar': lambda: standard.dumps([d.to_dict() for d in data], default=app.json.default),
+            'esquema compilado + orjson': lambda: app.json.dumps([d.to_dict() for d in data]),
+            'jsonify manual (respuesta completa)': lambda: standard.response([legacy_to_dict(d) for d in data]),
+            'jsonify rápido (respuesta completa)': lambda: app.json.response([d.to_dict() for d in data]),
+        }
+
+        print(f"Serialización de {rows} diagnósticos ({repeat} repeticiones)")
+        baseline = None
+        for name, case in cases.items():
+            elapsed = min(timeit.repeat(case, number=repeat, repeat=3)) / repeat
+            baseline = baseline or elapsed
+            print(f"  {name:<40} {elapsed * 1000:8.2f} ms  ({baseline / elapsed:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Medición de transferencia y latencia a través de Nginx
+Compara respuestas con y sin gzip y el efecto de la micro-caché (X-Cache-Status)
+
+Uso:
+  python benchmarks/bench_nginx.py http://localhost/api/patients/<cedula>/diagnoses [peticiones]
+  python benchmarks/bench_nginx.py --offline [filas]   # estima la compresión sin servidor
+"""
+
+import gzip
+import os
+import statistics
+import sys
+import time
+import urllib.request
+from collections import Counter
+
+
+def fetch(url, accept_encoding=None):
+    """Hacer una petición GET y devolver (bytes transferidos, segundos, estado de caché)"""
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    request = urllib.request.Request(url, headers=headers)
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        body = response.read()
+        cache_status = response.headers.get('X-Cache-Status', '-')
+    return len(body), time.perf_counter() - start, cache_status
+
+
+def measure(url, requests):
+    for label, encoding in [('identity', None), ('gzip', 'gzip')]:
+        sizes, latencies, cache = [], [], Counter()
+        for _ in range(requests):
+            size, elapsed, cache_status = fetch(url, encoding)
+            sizes.append(size)
+            latencies.append(elapsed)
+            cache[cache_status] += 1
+        latencies.sort()
+        print(f"{label:<9} bytes={sizes[-1]:>9}  p50={statistics.median(latencies) * 1000:7.2f} ms  "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f} ms  caché={dict(cache)}")
+
+
+def offline(rows):
+    """Estimar el ahorro de gzip (nivel 5, como gzip_comp_level) sobre un historial sintético"""
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    sys.path.insert(0, os.path.dirname(__file__))
+    from bench_json import build_rows
+    from backend.app import app
+
+    with app.app_context():
+        body = app.json.dumps([d.to_dict() for d in build_rows(rows)]).encode()
+    compressed = gzip.compress(body, compresslevel=5)
+    print(f"Historial de {rows} diagnósticos: {len(body)} bytes -> {len(compressed)} bytes gzip "
+          f"({100 * (1 - len(compressed) / len(body)):.1f}% menos)")
+    for mbps in (1, 5):
+        seconds = lambda size: size * 8 / (mbps * 1_000_000)
+        print(f"  enlace {mbps} Mbps: {seconds(len(body)) * 1000:.0f} ms -> {seconds(len(compressed)) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--offline':
+        offline(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    elif len(sys.argv) > 1:
+        measure(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    else:
+        print(__doc__)
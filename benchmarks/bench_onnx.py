@@ -0,0 +1,61 @@
+"""
+Benchmark de inferencia: pipeline sklearn vs onnxruntime (CPU)
+Mide latencia por petición individual y rendimiento en lotes
+
+Uso: python benchmarks/bench_onnx.py [hilos_intra_op ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+
+from train_model import train_model, create_holdout_dataset
+from onnx_export import export_onnx, load_onnx_model
+
+
+def latency_ms(predict, texts):
+    """Latencia por petición (un texto por llamada): p50 y p95 en ms"""
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        predict([text])
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def throughput(predict, texts, batch_size=256, rounds=5):
+    """Predicciones por segundo en lotes"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for batch in batches:
+            predict(batch)
+    return rounds * len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    threads = [int(t) for t in sys.argv[1:]] or [1, os.cpu_count() or 1]
+    model, disease_info = train_model()
+    texts = list(create_holdout_dataset(samples_per_disease=70)['symptoms'])
+
+    with tempfile.TemporaryDirectory() as directory:
+        export_onnx(model, disease_info, directory)
+        backends = {'sklearn': model.predict_proba}
+        for n in threads:
+            backends[f'onnx ({n} hilos)'] = load_onnx_model(directory, intra_op_threads=n)[0].predict_proba
+
+        print(f"{len(texts)} textos de validación")
+        print(f"{'backend':<18} {'p50 ms':>8} {'p95 ms':>8} {'pred/s lote':>12}")
+        for name, predict in backends.items():
+            predict(texts[:10])  # calentamiento
+            p50, p95 = latency_ms(predict, texts[:300])
+            print(f"{name:<18} {p50:8.3f} {p95:8.3f} {throughput(predict, texts):12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark del borrado de un paciente: cascada del ORM frente a ON DELETE CASCADE
+La cascada del ORM ('all, delete-orphan' sin passive_deletes) carga cada
+diagnóstico, prueba, examen y cita y los elimina fila por fila; delete_patients
+emite un único DELETE y la BD borra el resto. Mide tiempo y sentencias SQL
+
+Uso: python benchmarks/bench_patient_delete.py [diagnosticos_por_paciente ...] [--database-url postgresql://...]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+parser = argparse.ArgumentParser()
+parser.add_argument('sizes', nargs='*', type=int, default=[1000, 10000])
+parser.add_argument('--database-url', help='Base de datos de pruebas (se recrean sus tablas)')
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import event
+from sqlalchemy.exc import SAWarning
+
+from app import app, db, Patient, Diagnosis, MedicalTest, MedicalExam, Appointment, delete_patients
+
+
+def populate(cedula, n):
+    """Paciente con n diagnósticos; la mitad con 3 pruebas y cita, un examen cada 4"""
+    with db.engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), {'cedula': cedula, 'name': 'Ana', 'age': 40,
+                                                  'email': f'{cedula}@example.com'})
+        first = conn.execute(db.text('SELECT COALESCE(MAX(id), 0) + 1 FROM diagnoses')).scalar()
+        ids = range(first, first + n)
+        conn.execute(Diagnosis.__table__.insert(), [
+            {'id': i, 'patient_cedula': cedula, 'symptoms': 'fiebre tos', 'predicted_disease': 'Gripe/Influenza'}
+            for i in ids
+        ])
+        low = [i for i in ids if i % 2 == 0]
+        conn.execute(MedicalTest.__table__.insert(), [
+            {'diagnosis_id': i, 'patient_cedula': cedula, 'test_type': kind}
+            for i in low for kind in ('Análisis de sangre', 'Radiografía', 'Ecografía')
+        ])
+        conn.execute(Appointment.__table__.insert(), [
+            {'diagnosis_id': i, 'patient_cedula': cedula, 'scheduled_date': datetime(2024, 5, 1)} for i in low
+        ])
+        conn.execute(MedicalExam.__table__.insert(), [
+            {'diagnosis_id': i, 'patient_cedula': cedula, 'exam_type': 'Hemograma'} for i in ids if i % 4 == 0
+        ])
+    return n + len(low) * 4 + len([i for i in ids if i % 4 == 0])
+
+
+def orm_cascade_delete(cedula):
+    """
+    Lo que hacía session.delete(patient) con la cascada del ORM. Con las
+    claves ON DELETE CASCADE el DELETE del paciente puede llegar primero y los
+    de las filas hijas no encuentran nada (SAWarning); la carga, que es el
+    costo dominante, es la misma.
+    """
+    patient = db.session.get(Patient, cedula)
+    for diagnosis in patient.diagnoses:
+        for test in diagnosis.medical_tests:
+            db.session.delete(test)
+        db.session.delete(diagnosis)
+    for record in patient.exams + patient.appointments:
+        db.session.delete(record)
+    db.session.delete(patient)
+    db.session.commit()
+
+
+def measure(delete, cedula):
+    statements = []
+    listener = lambda *a: statements.append(a[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    start = time.perf_counter()
+    try:
+        delete(cedula)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return time.perf_counter() - start, len(statements)
+
+
+def main():
+    warnings.filterwarnings('ignore', category=SAWarning)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{'diagnósticos':>12} {'filas':>7} {'camino':>8} {'segundos':>9} {'sentencias':>11}")
+        for n in args.sizes:
+            for name, delete in (('orm', orm_cascade_delete), ('cascade', lambda c: delete_patients([c]))):
+                cedula = f'{name}{n}'
+                rows = populate(cedula, n)
+                seconds, statements = measure(delete, cedula)
+                assert db.session.query(Diagnosis).filter_by(patient_cedula=cedula).count() == 0
+                print(f"{n:>12} {rows:>7} {name:>8} {seconds:9.3f} {statements:>11}")
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark del índice de casos similares
+Construye el índice con N diagnósticos sintéticos, lo persiste, lo carga con mmap
+y mide la latencia de consulta frente a la búsqueda exhaustiva (matriz completa)
+
+Uso: python benchmarks/bench_similarity.py [n_diagnosticos ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from train_model import train_model, create_holdout_dataset
+from similarity_index import SimilarityIndex
+
+
+def synthetic_texts(vectorizer, n, seed=42):
+    """Textos de 3 a 8 términos del vocabulario, con frecuencia tipo Zipf"""
+    rng = np.random.default_rng(seed)
+    terms = np.array(sorted(t for t in vectorizer.vocabulary_ if ' ' not in t))
+    weights = 1.0 / np.arange(1, len(terms) + 1)
+    weights /= weights.sum()
+    lengths = rng.integers(3, 9, size=n)
+    words = rng.choice(terms, size=lengths.sum(), p=weights)
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    return [' '.join(words[bounds[i]:bounds[i + 1]]) for i in range(n)]
+
+
+def latency_ms(query, texts):
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        query(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [100_000, 1_000_000]
+    model, _ = train_model()
+    vectorizer = model.named_steps['tfidf']
+    queries = list(create_holdout_dataset(samples_per_disease=10)['symptoms'])
+
+    print(f"{'diagnósticos':>12} {'build s':>8} {'load ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'exhaustivo p50':>15}")
+    for n in sizes:
+        texts = synthetic_texts(vectorizer, n)
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            index = SimilarityIndex(vectorizer, directory, flush_threshold=n + 1)
+            chunk = 50_000
+            for i in range(0, n, chunk):
+                index.add(range(i + 1, min(i + chunk, n) + 1), texts[i:i + chunk])
+            index.flush()
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = SimilarityIndex.load(directory, vectorizer)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            p50, p95 = latency_ms(lambda t: loaded.query(t, k=10), queries)
+
+            X = vectorizer.transform(texts)
+            brute_p50, _ = latency_ms(
+                lambda t: np.argpartition(-(X @ vectorizer.transform([t]).T).toarray().ravel(), 10)[:10],
+                queries[:20]
+            )
+            print(f"{n:>12} {build:8.1f} {load_ms:8.2f} {p50:8.2f} {p95:8.2f} {brute_p50:15.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Compresión del RandomForest después del entrenamiento
+Selecciona el menor subconjunto de árboles que mantiene la exactitud de validación
+dentro de una tolerancia y, opcionalmente, colapsa hojas hermanas redundantes
+"""
+
+import copy
+import io
+import time
+
+import joblib
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.tree._tree import Tree, TREE_LEAF
+
+
+def _accuracy(probabilities, y_codes):
+    """Exactitud de un arreglo de probabilidades (..., n_muestras, n_clases)"""
+    return (probabilities.argmax(axis=-1) == y_codes).mean(axis=-1)
+
+
+def select_trees(per_tree_proba, y_codes, tolerance=0.01):
+    """
+    Selección voraz hacia adelante de árboles.
+
+    En cada paso se agrega el árbol que maximiza la exactitud del promedio
+    (desempate por log-verosimilitud de la clase correcta) y se detiene al
+    alcanzar la exactitud del bosque completo menos `tolerance`.
+    """
+    n_trees = per_tree_proba.shape[0]
+    target = _accuracy(per_tree_proba.mean(axis=0), y_codes) - tolerance
+    rows = np.arange(len(y_codes))
+
+    selected = []
+    remaining = list(range(n_trees))
+    running = np.zeros(per_tree_proba.shape[1:])
+
+    while remaining:
+        candidates = (running + per_tree_proba[remaining]) / (len(selected) + 1)
+        accuracy = _accuracy(candidates, y_codes)
+        likelihood = np.log(candidates[:, rows, y_codes] + 1e-9).mean(axis=1)
+        best = int(np.lexsort((-likelihood, -accuracy))[0])
+
+        tree = remaining.pop(best)
+        selected.append(tree)
+        running += per_tree_proba[tree]
+        if accuracy[best] >= target:
+            break
+
+    return selected
+
+
+def _normalized(values):
+    totals = values.sum(axis=-1, keepdims=True)
+    return np.divide(values, totals, out=np.zeros_like(values), where=totals > 0)
+
+
+def collapse_redundant_leaves(estimator, same_class=True, atol=1e-9):
+    """
+    Colapsar pares de hojas hermanas redundantes.
+
+    Con `same_class=True` son redundantes si predicen la misma clase (la
+    etiqueta del árbol no cambia; sus probabilidades sí pueden cambiar). Con
+    `same_class=False` solo si tienen la misma distribución de clases, y
+    entonces las predicciones no cambian en absoluto. El padre pasa a ser
+    hoja (su valor ya combina ambas) y el árbol se reconstruye sin los nodos
+    inalcanzables. Devuelve el número de nodos eliminados.
+    """
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    nodes = state['nodes'].copy()
+    values = state['values']
+    distribution = _normalized(values)
+    left, right = nodes['left_child'], nodes['right_child']
+
+    changed = True
+    while changed:
+        changed = False
+        for node in range(len(nodes)):
+            l, r = left[node], right[node]
+            if l == TREE_LEAF or left[l] != TREE_LEAF or left[r] != TREE_LEAF:
+                continue
+            if same_class:
+                redundant = distribution[l].argmax() == distribution[r].argmax()
+            else:
+                redundant = np.allclose(distribution[l], distribution[r], atol=atol)
+            if redundant:
+                left[node] = right[node] = TREE_LEAF
+                changed = True
+
+    # Renumerar los nodos alcanzables en preorden (raíz = 0)
+    order = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if left[node] != TREE_LEAF:
+            stack.extend([right[node], left[node]])
+    mapping = {old: new for new, old in enumerate(order)}
+
+    new_nodes = nodes[order]
+    for field in ('left_child', 'right_child'):
+        new_nodes[field] = [mapping.get(child, TREE_LEAF) for child in new_nodes[field]]
+
+    removed = tree.node_count - len(order)
+    if removed:
+        new_tree = Tree(tree.n_features, np.atleast_1d(tree.n_classes).astype(np.intp), tree.n_outputs)
+        new_tree.__setstate__({
+            'max_depth': state['max_depth'],
+            'node_count': len(order),
+            'nodes': new_nodes,
+            'values': values[order]
+        })
+        estimator.tree_ = new_tree
+    return removed
+
+
+def artifact_size(obj):
+    """Tamaño en bytes del objeto serializado con joblib"""
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell()
+
+
+def prediction_latency_ms(model, texts, repeat=200):
+    """Latencia media de una predicción individual"""
+    texts = list(texts)[:repeat]
+    start = time.perf_counter()
+    for text in texts:
+        model.predict_proba([text])
+    return (time.perf_counter() - start) / len(texts) * 1000
+
+
+def compress_model(model, validation_texts, validation_labels, tolerance=0.01, collapse_leaves=False):
+    """
+    Comprimir el bosque del pipeline.
+
+    Devuelve un nuevo Pipeline (el original no se modifica) y un reporte con
+    número de árboles, nodos y exactitud de validación antes y después.
+    """
+    vectorizer = model.named_steps['tfidf']
+    forest = model.named_steps['clf']
+
+    X = vectorizer.transform(list(validation_texts))
+    class_index = {label: i for i, label in enumerate(forest.classes_)}
+    y_codes = np.array([class_index[label] for label in validation_labels])
+    per_tree_proba = np.stack([tree.predict_proba(X) for tree in forest.estimators_])
+
+    selected = select_trees(per_tree_proba, y_codes, tolerance)
+    accuracy_before = float(_accuracy(forest.predict_proba(X), y_codes))
+
+    compressed_forest = copy.deepcopy(forest)
+    compressed_forest.estimators_ = [compressed_forest.estimators_[i] for i in selected]
+    compressed_forest.n_estimators = len(selected)
+
+    removed_nodes = 0
+    if collapse_leaves:
+        # Se aplica solo si la exactitud sigue dentro del presupuesto
+        collapsed_forest = copy.deepcopy(compressed_forest)
+        removed_nodes = sum(collapse_redundant_leaves(tree) for tree in collapsed_forest.estimators_)
+        if _accuracy(collapsed_forest.predict_proba(X), y_codes) >= accuracy_before - tolerance:
+            compressed_forest = collapsed_forest
+        else:
+            removed_nodes = 0
+
+    compressed = Pipeline([('tfidf', vectorizer), ('clf', compressed_forest)])
+
+    report = {
+        'trees_before': len(forest.estimators_),
+        'trees_after': len(selected),
+        'nodes_before': int(sum(tree.tree_.node_count for tree in forest.estimators_)),
+        'nodes_after': int(sum(tree.tree_.node_count for tree in compressed_forest.estimators_)),
+        'collapsed_nodes': int(removed_nodes),
+        'accuracy_before': accuracy_before,
+        'accuracy_after': float(_accuracy(compressed_forest.predict_proba(X), y_codes)),
+        'tolerance': tolerance
+    }
+    return compressed, report
+
+
+def compression_report(full_model, compressed_model, test_texts, test_labels):
+    """Comparar tamaño, latencia y exactitud (conjunto de prueba independiente)"""
+    test_texts = list(test_texts)
+    test_labels = np.asarray(test_labels)
+    return {
+        'size_before': artifact_size(full_model),
+        'size_after': artifact_size(compressed_model),
+        'latency_before_ms': prediction_latency_ms(full_model, test_texts),
+        'latency_after_ms': prediction_latency_ms(compressed_model, test_texts),
+        'test_accuracy_before': float((full_model.predict(test_texts) == test_labels).mean()),
+        'test_accuracy_after': float((compressed_model.predict(test_texts) == test_labels).mean())
+    }
@@ -0,0 +1,145 @@
+"""
+Utilidades de inferencia para el modelo de predicción de enfermedades
+Funciones compartidas por la API para post-procesar las probabilidades del modelo
+"""
+
+import os
+
+import numpy as np
+
+# Máximo de enfermedades por diagnóstico diferencial (API y servicio de inferencia)
+MAX_TOP_K = 50
+
+# Artefacto principal de cada backend: se publica de forma atómica y al final
+MODEL_ARTIFACTS = {'sklearn': 'disease_model_latest.pkl', 'onnx': 'disease_forest_latest.onnx'}
+
+
+def artifact_version(model_path, backend='sklearn'):
+    """
+    Versión del modelo publicado en `model_path` (fecha de modificación y
+    tamaño del artefacto principal); None si no hay modelo.
+    """
+    try:
+        stat = os.stat(os.path.join(model_path, MODEL_ARTIFACTS[backend]))
+    except FileNotFoundError:
+        return None
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def top_k_diseases(probabilities, classes, k):
+    """
+    Obtener las k enfermedades más probables de un vector de probabilidades.
+
+    Usa selección parcial (argpartition, O(n)) y ordena solo los k elegidos,
+    en lugar de ordenar el vector completo.
+    """
+    probabilities = np.asarray(probabilities, dtype=float)
+    k = max(0, min(int(k), probabilities.shape[0]))
+    if k == 0:
+        return []
+
+    if k < probabilities.shape[0]:
+        candidates = np.argpartition(-probabilities, k - 1)[:k]
+    else:
+        candidates = np.arange(probabilities.shape[0])
+    # Orden descendente por probabilidad; empate resuelto por índice de clase
+    order = candidates[np.lexsort((candidates, -probabilities[candidates]))]
+
+    return [
+        {
+            'disease': str(classes[i]),
+            'confidence': round(float(probabilities[i]) * 100, 2)
+        }
+        for i in order
+    ]
+
+
+def vocabulary_coverage(vectorizer, text, max_unknown=20):
+    """
+    Cobertura del vocabulario para un texto, con el mismo analizador del modelo.
+
+    Si `known_terms` es 0 el vector TF-IDF es todo ceros y cualquier
+    predicción carece de sentido.
+    """
+    terms = vectorizer.build_analyzer()(text)
+    vocabulary = vectorizer.vocabulary_
+    known = sum(1 for term in terms if term in vocabulary)
+    unknown = sorted({term for term in terms if term not in vocabulary})
+    return {
+        'terms': len(terms),
+        'known_terms': known,
+        'coverage': round(known / len(terms), 4) if terms else 0.0,
+        'unknown_terms': unknown[:max_unknown]
+    }
+
+
+class CascadeClassifier:
+    """
+    Cascada de inferencia: un clasificador lineal responde primero y solo las
+    muestras con confianza menor a `margin` se envían al RandomForest.
+
+    Ambas etapas comparten la misma transformación TF-IDF (se calcula una vez).
+    """
+
+    def __init__(self, model, linear_model, margin=0.8):
+        self.vectorizer = model.named_steps['tfidf']
+        self.forest = model.named_steps['clf']
+        self.linear_model = linear_model
+        self.margin = margin
+
+        if list(linear_model.classes_) != list(self.forest.classes_):
+            raise ValueError('La etapa lineal y el bosque deben tener las mismas clases')
+        self.classes_ = self.forest.classes_
+
+    def predict_proba_with_stage(self, texts):
+        """Probabilidades y máscara de muestras escaladas al bosque"""
+        X = self.vectorizer.transform(texts)
+        probabilities = self.linear_model.predict_proba(X)
+        escalated = probabilities.max(axis=1) < self.margin
+        if escalated.any():
+            probabilities[escalated] = self.forest.predict_proba(X[escalated])
+        return probabilities, escalated
+
+    def predict_proba(self, texts):
+        return self.predict_proba_with_stage(texts)[0]
+
+    def predict(self, texts):
+        return self.classes_[self.predict_proba(texts).argmax(axis=1)]
+
+
+def evaluate_cascade(model, linear_model, margin, texts, labels):
+    """
+    Comparar la cascada contra el bosque solo, petición por petición.
+
+    Devuelve tasa de escalado, acuerdo con el bosque, exactitud de ambos
+    caminos y latencia media por predicción (ms).
+    """
+    import time
+
+    texts = list(texts)
+    labels = np.asarray(labels)
+    cascade = CascadeClassifier(model, linear_model, margin)
+
+    start = time.perf_counter()
+    forest_predictions = np.array([model.predict_proba([text])[0].argmax() for text in texts])
+    forest_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [cascade.predict_proba_with_stage([text]) for text in texts]
+    cascade_seconds = time.perf_counter() - start
+
+    cascade_predictions = np.array([probabilities[0].argmax() for probabilities, _ in results])
+    escalated = np.array([mask[0] for _, mask in results])
+    classes = cascade.classes_
+
+    return {
+        'margin': margin,
+        'samples': len(texts),
+        'escalation_rate': float(escalated.mean()),
+        'agreement': float((cascade_predictions == forest_predictions).mean()),
+        'forest_accuracy': float((classes[forest_predictions] == labels).mean()),
+        'cascade_accuracy': float((classes[cascade_predictions] == labels).mean()),
+        'forest_ms': forest_seconds / len(texts) * 1000,
+        'cascade_ms': cascade_seconds / len(texts) * 1000,
+        'latency_saved': 1 - cascade_seconds / forest_seconds
+    }
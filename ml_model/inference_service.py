@@ -0,0 +1,270 @@
+"""
+Servicio de inferencia independiente de la API CRUD
+Aplicación WSGI mínima (sin Flask) que expone el modelo con soporte de lotes
+
+Protocolo (JSON sobre HTTP/1.1):
+  GET  /health        -> {"status": "healthy", "model_loaded": true, "model_version": "..."}
+  GET  /disease-info  -> {enfermedad: {"exam_needed", "severity", "medications"}}
+  GET  /vectorizer    -> configuración del TF-IDF (formato de PortableTfidfVectorizer)
+  POST /predict       {"texts": [...], "top_k": 5, "explain": false, "top_terms": 10}
+                      -> {"predictions": [[{"disease", "confidence"}, ...], ...],
+                          "input_quality": [{"terms", "known_terms", "coverage", "unknown_terms"}, ...],
+                          "explanations": [{"method", "class", "bias", "contributions"}, ...]}
+                      Un texto sin términos del vocabulario no pasa por el modelo: predicción []
+                      "explanations" solo con "explain": true (null con el backend ONNX)
+
+Cada proceso comprueba cada MODEL_CHECK_INTERVAL segundos la versión del
+modelo publicado en MODEL_PATH y lo recarga si cambió.
+
+Producción: gunicorn --workers 4 --bind 0.0.0.0:5001 inference_service:application
+Desarrollo: python inference_service.py
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from explain import ForestExplainer, explain_linear
+from inference import MAX_TOP_K, CascadeClassifier, artifact_version, top_k_diseases, vocabulary_coverage
+from onnx_export import PortableTfidfVectorizer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(os.path.dirname(__file__), 'models'))
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'sklearn').lower()
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', 1))
+INFERENCE_CASCADE = os.getenv('INFERENCE_CASCADE', 'false').lower() == 'true'
+CASCADE_MARGIN = float(os.getenv('CASCADE_MARGIN', 0.8))
+MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH', 256))
+MAX_TOP_TERMS = 100
+MODEL_CHECK_INTERVAL = float(os.getenv('MODEL_CHECK_INTERVAL', 30))
+
+
+def current_model_version(model_path=MODEL_PATH):
+    """Versión del modelo publicado para el backend configurado"""
+    return artifact_version(model_path, INFERENCE_BACKEND)
+
+
+class InferenceService:
+    """Modelo cargado en memoria y operaciones del protocolo"""
+
+    def __init__(self, model, disease_info, cascade=None, version=None):
+        self.model = model
+        self.disease_info = disease_info
+        self.cascade = cascade
+        self.version = version
+        self._vectorizer_config = None
+        self._explainer = None
+
+    @classmethod
+    def from_artifacts(cls, model_path=MODEL_PATH):
+        """Cargar el modelo según INFERENCE_BACKEND (y la cascada si está activa)"""
+        # Versión leída antes de cargar: una publicación durante la carga se detecta en la próxima comprobación
+        version = current_model_version(model_path)
+        cascade = None
+        if INFERENCE_BACKEND == 'onnx':
+            from onnx_export import load_onnx_model
+            model, disease_info = load_onnx_model(model_path, ONNX_INTRA_OP_THREADS)
+        else:
+            from train_model import load_model, load_linear_model
+            model, disease_info = load_model(model_path)
+            linear_model = load_linear_model(model_path) if INFERENCE_CASCADE else None
+            if linear_model is not None:
+                cascade = CascadeClassifier(model, linear_model, CASCADE_MARGIN)
+        logger.info(f"Modelo cargado desde {model_path} (backend {INFERENCE_BACKEND}, versión {version})")
+        return cls(model, disease_info, cascade, version)
+
+    @property
+    def vectorizer(self):
+        """TF-IDF del modelo servido (pipeline sklearn o tokenizador portable de ONNX)"""
+        if hasattr(self.model, 'named_steps'):
+            return self.model.named_steps['tfidf']
+        return self.model.vectorizer
+
+    def vectorizer_config(self):
+        """
+        TF-IDF exportado como tokenizador portable: la API lo usa para la
+        cobertura del vocabulario, el autocompletado y los casos similares
+        sin cargar el modelo
+        """
+        if self._vectorizer_config is None:
+            vectorizer = self.vectorizer
+            if not isinstance(vectorizer, PortableTfidfVectorizer):
+                vectorizer = PortableTfidfVectorizer.from_sklearn(vectorizer)
+            self._vectorizer_config = vectorizer.config
+        return self._vectorizer_config
+
+    def predict(self, texts, top_k, explain=False, top_terms=10):
+        """
+        Top-k, cobertura del vocabulario y (si se pide) explicación por texto,
+        con una sola pasada de predict_proba sobre los textos que tienen algún
+        término conocido
+        """
+        input_quality = [vocabulary_coverage(self.vectorizer, text) for text in texts]
+        known = [i for i, quality in enumerate(input_quality) if quality['known_terms'] > 0]
+        predictions = [[] for _ in texts]
+        explanations = [None] * len(texts) if explain else None
+        if known:
+            subset = [texts[i] for i in known]
+            if self.cascade is None:
+                probabilities, escalated = self.model.predict_proba(subset), np.ones(len(known), dtype=bool)
+            else:
+                probabilities, escalated = self.cascade.predict_proba_with_stage(subset)
+            for i, row in zip(known, probabilities):
+                predictions[i] = top_k_diseases(row, self.model.classes_, top_k)
+            if explain:
+                diseases = [predictions[i][0]['disease'] for i in known]
+                for i, explanation in zip(known, self.explain(subset, diseases, escalated, top_terms)):
+                    explanations[i] = explanation
+        return predictions, input_quality, explanations
+
+    def explain(self, texts, diseases, escalated, top_terms):
+        """
+        Explicación de cada enfermedad con la etapa que la predijo (lineal o
+        bosque); None para el bosque ONNX, sin acceso a los árboles
+        """
+        explanations = [None] * len(texts)
+        stages = [(np.flatnonzero(~escalated), self._explain_linear), (np.flatnonzero(escalated), self._explain_forest)]
+        for rows, explain_stage in stages:
+            if len(rows):
+                results = explain_stage([texts[i] for i in rows], [diseases[i] for i in rows], top_terms)
+                for i, explanation in zip(rows, results):
+                    explanations[i] = explanation
+        return explanations
+
+    def _explain_linear(self, texts, diseases, top_terms):
+        return explain_linear(self.cascade.linear_model, self.cascade.vectorizer, texts, diseases, top_terms)
+
+    def _explain_forest(self, texts, diseases, top_terms):
+        if not hasattr(self.model, 'named_steps'):
+            return [None] * len(texts)
+        # Estadísticas por nodo: se calculan una vez por modelo cargado
+        if self._explainer is None:
+            self._explainer = ForestExplainer(self.model)
+        return self._explainer.explain(texts, diseases, top_terms)
+
+
+def _json_response(start_response, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body)))
+    ])
+    return [body]
+
+
+def _read_json(environ):
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    return json.loads(environ['wsgi.input'].read(length) or b'{}')
+
+
+def create_application(service_factory=InferenceService.from_artifacts, model_version=None,
+                       check_interval=MODEL_CHECK_INTERVAL):
+    """
+    Construir la aplicación WSGI; el modelo se carga en la primera petición.
+    Con `model_version` el servicio se recarga cuando la versión publicada
+    difiere de la cargada (comprobada cada `check_interval` segundos).
+    """
+    state = {'service': None, 'next_check': 0.0}
+    lock = threading.Lock()
+
+    def get_service():
+        if state['service'] is None:
+            with lock:
+                if state['service'] is None:
+                    state['service'] = service_factory()
+                    state['next_check'] = time.monotonic() + check_interval
+        elif model_version is not None and time.monotonic() >= state['next_check'] and lock.acquire(blocking=False):
+            # Un solo hilo comprueba y recarga; los demás siguen con el modelo actual
+            try:
+                state['next_check'] = time.monotonic() + check_interval
+                if model_version() != state['service'].version:
+                    state['service'] = service_factory()
+            except Exception as e:
+                logger.error(f"No se pudo recargar el modelo publicado: {str(e)}")
+            finally:
+                lock.release()
+        return state['service']
+
+    def application(environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '')
+
+        try:
+            if path == '/health' and method == 'GET':
+                service = get_service()
+                return _json_response(start_response, '200 OK', {
+                    'status': 'healthy',
+                    'model_loaded': service is not None,
+                    'model_version': service.version
+                })
+
+            if path == '/disease-info' and method == 'GET':
+                return _json_response(start_response, '200 OK', get_service().disease_info)
+
+            if path == '/vectorizer' and method == 'GET':
+                return _json_response(start_response, '200 OK', get_service().vectorizer_config())
+
+            if path == '/predict' and method == 'POST':
+                data = _read_json(environ)
+                texts = data.get('texts')
+                top_k = data.get('top_k', 5)
+                explain = data.get('explain', False)
+                top_terms = data.get('top_terms', 10)
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    return _json_response(start_response, '400 Bad Request',
+                                          {'error': 'texts debe ser una lista de textos'})
+                if len(texts) > MAX_BATCH_SIZE:
+                    return _json_response(start_response, '413 Payload Too Large',
+                                          {'error': f'Máximo {MAX_BATCH_SIZE} textos por lote'})
+                if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+                    return _json_response(start_response, '400 Bad Request',
+                                          {'error': f'top_k debe estar entre 1 y {MAX_TOP_K}'})
+                if not isinstance(explain, bool) or not isinstance(top_terms, int) or not 1 <= top_terms <= MAX_TOP_TERMS:
+                    return _json_response(start_response, '400 Bad Request',
+                                          {'error': f'explain debe ser booleano y top_terms estar entre 1 y {MAX_TOP_TERMS}'})
+
+                start = time.perf_counter()
+                predictions, input_quality, explanations = (
+                    get_service().predict(texts, top_k, explain, top_terms) if texts else ([], [], [])
+                )
+                response = {'predictions': predictions, 'input_quality': input_quality}
+                if explain:
+                    response['explanations'] = explanations
+                response['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+                return _json_response(start_response, '200 OK', response)
+
+            return _json_response(start_response, '404 Not Found', {'error': 'Ruta no encontrada'})
+
+        except json.JSONDecodeError:
+            return _json_response(start_response, '400 Bad Request', {'error': 'JSON inválido'})
+        except FileNotFoundError as e:
+            logger.error(f"Modelo no disponible: {str(e)}")
+            return _json_response(start_response, '503 Service Unavailable', {'error': 'Modelo no disponible'})
+        except Exception as e:
+            logger.error(f"Error en inferencia: {str(e)}")
+            return _json_response(start_response, '500 Internal Server Error', {'error': str(e)})
+
+    return application
+
+
+application = create_application(InferenceService.from_artifacts, current_model_version)
+
+if __name__ == '__main__':
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    port = int(os.getenv('INFERENCE_PORT', 5001))
+    logger.info(f"Servicio de inferencia escuchando en el puerto {port}")
+    make_server('0.0.0.0', port, application, server_class=ThreadingWSGIServer).serve_forever()
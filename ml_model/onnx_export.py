@@ -0,0 +1,208 @@
+"""
+Exportación del modelo a ONNX y backend de inferencia con onnxruntime
+El RandomForest se exporta a ONNX y el TF-IDF a un tokenizador portable (JSON + numpy),
+de modo que servir el modelo no requiere scikit-learn ni joblib
+"""
+
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+ONNX_MODEL_FILE = 'disease_forest_latest.onnx'
+TOKENIZER_FILE = 'tokenizer_latest.json'
+DISEASE_INFO_FILE = 'disease_info_latest.json'
+
+
+def _strip_accents_unicode(text):
+    """Igual que sklearn.feature_extraction.text.strip_accents_unicode"""
+    try:
+        text.encode('ASCII', errors='strict')
+        return text
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize('NFKD', text)
+        return ''.join(c for c in normalized if not unicodedata.combining(c))
+
+
+def _strip_accents_ascii(text):
+    """Igual que sklearn.feature_extraction.text.strip_accents_ascii"""
+    return unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+
+
+class PortableTfidfVectorizer:
+    """
+    Reimplementación mínima de TfidfVectorizer (analizador de palabras) a partir
+    de su configuración exportada. Produce matrices densas float32.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.vocabulary_ = config['vocabulary']
+        self.idf_ = np.asarray(config['idf'], dtype=np.float64)
+        self.lowercase = config['lowercase']
+        self.strip_accents = config['strip_accents']
+        self.ngram_range = tuple(config['ngram_range'])
+        self.norm = config['norm']
+        self.sublinear_tf = config['sublinear_tf']
+        self._token_pattern = re.compile(config['token_pattern'])
+
+    @classmethod
+    def from_sklearn(cls, vectorizer):
+        """Extraer la configuración de un TfidfVectorizer entrenado"""
+        unsupported = [
+            name for name, value in [
+                ('analyzer', vectorizer.analyzer != 'word'),
+                ('tokenizer', vectorizer.tokenizer is not None),
+                ('preprocessor', vectorizer.preprocessor is not None),
+                ('stop_words', vectorizer.stop_words is not None),
+                ('binary', vectorizer.binary),
+                ('use_idf', not vectorizer.use_idf)
+            ] if value
+        ]
+        if unsupported or callable(vectorizer.strip_accents):
+            raise ValueError(f'Configuración de TfidfVectorizer no exportable: {unsupported}')
+
+        return cls({
+            'vocabulary': {term: int(index) for term, index in vectorizer.vocabulary_.items()},
+            'idf': vectorizer.idf_.tolist(),
+            'lowercase': vectorizer.lowercase,
+            'strip_accents': vectorizer.strip_accents,
+            'token_pattern': vectorizer.token_pattern,
+            'ngram_range': list(vectorizer.ngram_range),
+            'norm': vectorizer.norm,
+            'sublinear_tf': vectorizer.sublinear_tf
+        })
+
+    def build_analyzer(self):
+        """Función texto -> lista de términos (n-gramas de palabras)"""
+        min_n, max_n = self.ngram_range
+
+        def analyze(text):
+            if self.lowercase:
+                text = text.lower()
+            if self.strip_accents == 'unicode':
+                text = _strip_accents_unicode(text)
+            elif self.strip_accents == 'ascii':
+                text = _strip_accents_ascii(text)
+            tokens = self._token_pattern.findall(text)
+            if max_n == 1:
+                return tokens
+            terms = tokens[:] if min_n == 1 else []
+            for n in range(max(min_n, 2), max_n + 1):
+                terms.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+            return terms
+
+        return analyze
+
+    def transform(self, texts):
+        analyze = self.build_analyzer()
+        matrix = np.zeros((len(texts), len(self.idf_)), dtype=np.float64)
+        for row, text in enumerate(texts):
+            for term in analyze(text):
+                index = self.vocabulary_.get(term)
+                if index is not None:
+                    matrix[row, index] += 1
+
+        if self.sublinear_tf:
+            # 1 + log(tf) en cada término presente; tf = 1 da 1, no 0
+            present = matrix > 0
+            np.log(matrix, where=present, out=matrix)
+            matrix[present] += 1
+        matrix *= self.idf_
+
+        if self.norm == 'l2':
+            norms = np.sqrt((matrix ** 2).sum(axis=1, keepdims=True))
+        elif self.norm == 'l1':
+            norms = np.abs(matrix).sum(axis=1, keepdims=True)
+        else:
+            norms = None
+        if norms is not None:
+            np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+        return matrix.astype(np.float32)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+def export_onnx(model, disease_info, save_path='models', target_opset=15):
+    """
+    Exportar el pipeline entrenado a ONNX (bosque) + JSON (tokenizador e info).
+    Requiere skl2onnx.
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    os.makedirs(save_path, exist_ok=True)
+    vectorizer = model.named_steps['tfidf']
+    forest = model.named_steps['clf']
+
+    tokenizer = PortableTfidfVectorizer.from_sklearn(vectorizer)
+    onnx_model = convert_sklearn(
+        forest,
+        initial_types=[('input', FloatTensorType([None, len(tokenizer.idf_)]))],
+        options={id(forest): {'zipmap': False}},
+        target_opset=target_opset
+    )
+    classes = onnx_model.metadata_props.add()
+    classes.key = 'classes'
+    classes.value = json.dumps([str(label) for label in forest.classes_], ensure_ascii=False)
+
+    tokenizer.save(os.path.join(save_path, TOKENIZER_FILE))
+    with open(os.path.join(save_path, DISEASE_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(disease_info, f, ensure_ascii=False)
+    # El bosque al final y de forma atómica: su fecha de modificación es la versión publicada
+    onnx_path = os.path.join(save_path, ONNX_MODEL_FILE)
+    with open(f'{onnx_path}.tmp', 'wb') as f:
+        f.write(onnx_model.SerializeToString())
+    os.replace(f'{onnx_path}.tmp', onnx_path)
+
+    print(f"Modelo ONNX guardado en: {onnx_path}")
+    return onnx_path
+
+
+class OnnxDiseaseModel:
+    """Modelo servido con onnxruntime (CPU); misma interfaz que el pipeline"""
+
+    def __init__(self, onnx_path, tokenizer, intra_op_threads=1):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.vectorizer = tokenizer
+        self._input_name = self.session.get_inputs()[0].name
+
+        # Las clases del bosque se guardan en los metadatos del modelo al exportar
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.classes_ = np.array(json.loads(metadata['classes']), dtype=object)
+
+    def predict_proba(self, texts):
+        X = self.vectorizer.transform(list(texts))
+        return self.session.run(['probabilities'], {self._input_name: X})[0]
+
+    def predict(self, texts):
+        return self.classes_[self.predict_proba(texts).argmax(axis=1)]
+
+
+def load_onnx_model(save_path='models', intra_op_threads=1):
+    """Cargar modelo ONNX, tokenizador portable e info de enfermedades (sin sklearn)"""
+    onnx_path = os.path.join(save_path, ONNX_MODEL_FILE)
+    if not os.path.exists(onnx_path):
+        raise FileNotFoundError(f"Modelo ONNX no encontrado en {onnx_path}")
+
+    tokenizer = PortableTfidfVectorizer.load(os.path.join(save_path, TOKENIZER_FILE))
+    with open(os.path.join(save_path, DISEASE_INFO_FILE), encoding='utf-8') as f:
+        disease_info = json.load(f)
+
+    return OnnxDiseaseModel(onnx_path, tokenizer, intra_op_threads), disease_info
@@ -7,10 +7,12 @@ import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import os
+import random
 from datetime import datetime
 
 # Dataset de síntomas y enfermedades
@@ -143,21 +145,70 @@ def create_dataset():
     df = pd.DataFrame(SYMPTOM_DISEASE_DATA)
     return df
 
-def train_model():
-    """Entrenar el modelo de predicción"""
+def create_holdout_dataset(samples_per_disease=30, seed=42):
+    """
+    Crear un conjunto de validación perturbando los síntomas de entrenamiento.
+
+    Cada muestra toma un subconjunto desordenado de los síntomas de la
+    enfermedad y, a veces, agrega un síntoma de otra enfermedad como ruido.
+    """
     df = create_dataset()
+    rng = random.Random(seed)
+    all_tokens = [token for text in df['symptoms'] for token in text.split()]
     
-    # Pipeline con vectorización y clasificador
+    rows = []
+    for text, disease in zip(df['symptoms'], df['disease']):
+        tokens = text.split()
+        for _ in range(samples_per_disease):
+            sample = rng.sample(tokens, rng.randint(2, len(tokens)))
+            if rng.random() < 0.3:
+                sample.append(rng.choice(all_tokens))
+            rng.shuffle(sample)
+            rows.append({'symptoms': ' '.join(sample), 'disease': disease})
+    
+    return pd.DataFrame(rows)
+
+def build_pipeline(params=None, memory=None):
+    """
+    Pipeline TF-IDF + RandomForest con los parámetros por defecto.
+
+    `params` usa la notación de scikit-learn (p. ej. {'clf__max_depth': 20},
+    ver tune.py); `memory` cachea en disco el vectorizador ajustado.
+    """
     model = Pipeline([
         ('tfidf', TfidfVectorizer(max_features=100, lowercase=True)),
         ('clf', RandomForestClassifier(n_estimators=100, random_state=42, max_depth=10))
-    ])
+    ], memory=memory)
+    if params:
+        params = dict(params)
+        if isinstance(params.get('tfidf__ngram_range'), list):
+            params['tfidf__ngram_range'] = tuple(params['tfidf__ngram_range'])  # leído de JSON
+        model.set_params(**params)
+    return model
+
+def training_frame(df, extra_data=None):
+    """Ejemplos (symptoms, disease) del dataset base más `extra_data`"""
+    data = df[['symptoms', 'disease']]
+    if extra_data is not None and len(extra_data):
+        data = pd.concat([data, extra_data[['symptoms', 'disease']]], ignore_index=True)
+    return data
+
+def train_model(extra_data=None, params=None):
+    """
+    Entrenar el modelo de predicción.
+
+    `extra_data` (symptoms, disease), p. ej. el historial exportado, se suma
+    a los ejemplos de entrenamiento; los metadatos de cada enfermedad siguen
+    saliendo del dataset base. `params` reemplaza hiperparámetros del pipeline.
+    """
+    df = create_dataset()
     
-    X = df['symptoms']
-    y = df['disease']
+    # Pipeline con vectorización y clasificador
+    model = build_pipeline(params)
     
     # Entrenar modelo
-    model.fit(X, y)
+    data = training_frame(df, extra_data)
+    model.fit(data['symptoms'], data['disease'])
     
     # Crear diccionarios para mapeos
     disease_info = {}
@@ -171,20 +222,53 @@ def train_model():
     
     return model, disease_info
 
-def save_model(model, disease_info, save_path='models'):
-    """Guardar modelo entrenado"""
+def train_linear_stage(model, df=None):
+    """
+    Entrenar el clasificador lineal de la cascada sobre las mismas
+    características TF-IDF del pipeline (el vectorizador no se reentrena).
+    """
+    if df is None:
+        df = create_dataset()
+    
+    X = model.named_steps['tfidf'].transform(df['symptoms'])
+    linear_model = SGDClassifier(loss='log_loss', alpha=1e-4, max_iter=1000, random_state=42)
+    linear_model.fit(X, df['disease'])
+    
+    return linear_model
+
+def dump_atomic(obj, path):
+    """joblib.dump a un temporal y os.replace: quien carga nunca lee un archivo a medio escribir"""
+    tmp_path = f'{path}.tmp'
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+def save_model(model, disease_info, save_path='models', linear_model=None, snapshot=True):
+    """
+    Guardar modelo entrenado. Con snapshot=False solo se reemplazan las
+    versiones 'latest' (sin copias con fecha, para publicaciones frecuentes)
+    """
     os.makedirs(save_path, exist_ok=True)
     
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    model_path = os.path.join(save_path, f'disease_model_{timestamp}.pkl')
-    info_path = os.path.join(save_path, f'disease_info_{timestamp}.pkl')
+    if snapshot:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        model_path = os.path.join(save_path, f'disease_model_{timestamp}.pkl')
+        info_path = os.path.join(save_path, f'disease_info_{timestamp}.pkl')
+        joblib.dump(model, model_path)
+        joblib.dump(disease_info, info_path)
+    else:
+        model_path = os.path.join(save_path, 'disease_model_latest.pkl')
+        info_path = os.path.join(save_path, 'disease_info_latest.pkl')
     
-    joblib.dump(model, model_path)
-    joblib.dump(disease_info, info_path)
+    # Etapa lineal de la cascada (opcional)
+    if linear_model is not None:
+        if snapshot:
+            joblib.dump(linear_model, os.path.join(save_path, f'linear_model_{timestamp}.pkl'))
+        dump_atomic(linear_model, os.path.join(save_path, 'linear_model_latest.pkl'))
     
-    # Guardar también versión 'latest'
-    joblib.dump(model, os.path.join(save_path, 'disease_model_latest.pkl'))
-    joblib.dump(disease_info, os.path.join(save_path, 'disease_info_latest.pkl'))
+    # Guardar también versión 'latest'; el modelo al final, porque su fecha de
+    # modificación es la versión que vigilan la API y el servicio de inferencia
+    dump_atomic(disease_info, os.path.join(save_path, 'disease_info_latest.pkl'))
+    dump_atomic(model, os.path.join(save_path, 'disease_model_latest.pkl'))
     
     print(f"Modelo guardado en: {model_path}")
     print(f"Info guardada en: {info_path}")
@@ -204,8 +288,72 @@ def load_model(save_path='models'):
     
     return model, disease_info
 
+def load_linear_model(save_path='models'):
+    """Cargar la etapa lineal de la cascada (None si no fue entrenada)"""
+    linear_path = os.path.join(save_path, 'linear_model_latest.pkl')
+    if not os.path.exists(linear_path):
+        return None
+    return joblib.load(linear_path)
+
 if __name__ == '__main__':
+    import argparse
+    import json
+    from inference import evaluate_cascade
+    from compress import compress_model, compression_report
+    
+    parser = argparse.ArgumentParser(description='Entrenar modelo de predicción de enfermedades')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help='Pérdida máxima de exactitud de validación al comprimir el bosque')
+    parser.add_argument('--collapse-leaves', action='store_true',
+                        help='Colapsar hojas hermanas redundantes tras podar árboles')
+    parser.add_argument('--no-compress', action='store_true', help='Publicar el bosque completo')
+    parser.add_argument('--exported', help='Directorio Parquet exportado del historial de diagnósticos')
+    parser.add_argument('--exported-since', help='Usar solo particiones desde esta fecha (YYYY-MM-DD)')
+    parser.add_argument('--params', type=json.loads,
+                        help='Hiperparámetros en JSON (p. ej. la fila elegida del leaderboard de tune.py)')
+    args = parser.parse_args()
+    
+    extra_data = None
+    if args.exported:
+        from training_data import load_training_frame
+        extra_data = load_training_frame(args.exported, args.exported_since)
+        print(f"Historial exportado: {len(extra_data)} diagnósticos")
+    
     print("Entrenando modelo de predicción de enfermedades...")
-    model, disease_info = train_model()
-    save_model(model, disease_info)
+    full_model, disease_info = train_model(extra_data, args.params)
+    model = full_model
+    
+    if not args.no_compress:
+        # Validación y prueba independientes para no sobreajustar la selección
+        validation = create_holdout_dataset(seed=7)
+        test = create_holdout_dataset(seed=42)
+        model, report = compress_model(full_model, validation['symptoms'], validation['disease'],
+                                       args.tolerance, args.collapse_leaves)
+        report.update(compression_report(full_model, model, test['symptoms'], test['disease']))
+        print(f"Compresión: {report['trees_before']} -> {report['trees_after']} árboles, "
+              f"{report['nodes_before']} -> {report['nodes_after']} nodos, "
+              f"{report['size_before'] / 1024:.0f} KB -> {report['size_after'] / 1024:.0f} KB, "
+              f"{report['latency_before_ms']:.2f} ms -> {report['latency_after_ms']:.2f} ms por predicción")
+        print(f"Exactitud de prueba: {report['test_accuracy_before']:.1%} -> {report['test_accuracy_after']:.1%}")
+        os.makedirs('models', exist_ok=True)
+        joblib.dump(full_model, os.path.join('models', 'disease_model_full_latest.pkl'))
+    
+    # La etapa lineal con los mismos ejemplos que el bosque (mismas clases)
+    linear_model = train_linear_stage(model, training_frame(create_dataset(), extra_data))
+    save_model(model, disease_info, linear_model=linear_model)
     print("¡Modelo entrenado exitosamente!")
+    
+    try:
+        from onnx_export import export_onnx
+        export_onnx(model, disease_info)
+    except ImportError:
+        print("skl2onnx no instalado: se omite la exportación ONNX")
+    
+    holdout = create_holdout_dataset()
+    print("\nEvaluación de la cascada lineal -> RandomForest (conjunto de validación):")
+    for margin in (0.5, 0.7, 0.8, 0.9):
+        report = evaluate_cascade(model, linear_model, margin, holdout['symptoms'], holdout['disease'])
+        print(f"  margen {margin:.2f}: escalado {report['escalation_rate']:.1%}, "
+              f"acuerdo con bosque {report['agreement']:.1%}, "
+              f"latencia {report['cascade_ms']:.2f} ms vs {report['forest_ms']:.2f} ms "
+              f"(ahorro {report['latency_saved']:.1%})")
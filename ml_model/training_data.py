@@ -0,0 +1,71 @@
+"""
+Lectura del historial exportado a Parquet (backend/export_training_data.py)
+El conjunto se recorre por lotes de columnas: solo se leen del disco las
+columnas pedidas y nunca se materializa la tabla completa
+"""
+
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+TRAINING_COLUMNS = ['symptoms', 'predicted_disease', 'confirmed_disease']
+# Confirmaciones exportadas aparte (el prefijo '_' las excluye del conjunto de diagnósticos)
+LABELS_DIR = '_labels'
+
+def open_export(path):
+    """Conjunto Parquet particionado por fecha (date=YYYY-MM-DD)"""
+    return ds.dataset(path, format='parquet', partitioning='hive',
+                      exclude_invalid_files=True, ignore_prefixes=['.', '_'])
+
+def iter_training_batches(path, columns=None, batch_size=65536, confirmed_only=False, since=None):
+    """
+    Lotes (pyarrow.RecordBatch) del historial exportado.
+
+    `confirmed_only` se queda con los diagnósticos que tienen resultados de
+    pruebas o exámenes completados; `since` (YYYY-MM-DD) filtra por partición
+    y descarta directorios enteros sin abrir sus archivos.
+    """
+    dataset = open_export(path)
+    conditions = []
+    if confirmed_only:
+        conditions.append(ds.field('confirmed'))
+    if since is not None:
+        conditions.append(ds.field('date') >= since)
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    yield from dataset.to_batches(columns=columns or TRAINING_COLUMNS, filter=condition,
+                                  batch_size=batch_size)
+
+def latest_labels(path):
+    """Última enfermedad confirmada de cada diagnóstico según las confirmaciones exportadas"""
+    labels_path = os.path.join(path, LABELS_DIR)
+    if not os.path.isdir(labels_path):
+        return pd.Series(dtype=object)
+    frame = (ds.dataset(labels_path, format='parquet', exclude_invalid_files=True, ignore_prefixes=['.', '_'])
+             .to_table(columns=['feedback_id', 'diagnosis_id', 'confirmed_disease'])
+             .to_pandas())
+    frame = frame.sort_values('feedback_id').drop_duplicates('diagnosis_id', keep='last')
+    return frame.set_index('diagnosis_id')['confirmed_disease']
+
+def load_training_frame(path, since=None, batch_size=65536):
+    """
+    DataFrame (symptoms, disease) listo para concatenar con create_dataset().
+    La etiqueta es solo la enfermedad confirmada: la última confirmación
+    exportada o, sin ella, la que tenía el diagnóstico al exportarse. Los
+    diagnósticos sin confirmar se descartan (la predicción no es una etiqueta).
+    """
+    labels = latest_labels(path)
+    frames = []
+    for batch in iter_training_batches(path, ['diagnosis_id', 'symptoms', 'confirmed_disease'], batch_size,
+                                       since=since):
+        frame = batch.to_pandas()
+        frame = pd.DataFrame({
+            'symptoms': frame['symptoms'],
+            'disease': frame['diagnosis_id'].map(labels).fillna(frame['confirmed_disease'])
+        })
+        frames.append(frame.dropna())
+    if not frames:
+        return pd.DataFrame({'symptoms': pd.Series(dtype=str), 'disease': pd.Series(dtype=str)})
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,181 @@
+"""
+Búsqueda de hiperparámetros con validación cruzada en paralelo
+Evalúa combinaciones del vectorizador TF-IDF y del RandomForest en todos los
+núcleos; la transformación TF-IDF de cada pliegue se cachea en disco, así las
+configuraciones que comparten vectorizador no vuelven a tokenizar el corpus.
+Genera un leaderboard con exactitud, latencia por predicción y tamaño del artefacto
+
+Uso: python tune.py [--folds 5] [--jobs -1] [--exported ../backend/data/training_export]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Memory, Parallel, delayed
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+from compress import artifact_size, prediction_latency_ms
+from train_model import build_pipeline, create_dataset, create_holdout_dataset
+
+DEFAULT_CACHE = os.path.join(os.path.dirname(__file__), '.cache', 'tune')
+
+PARAM_GRID = {
+    'tfidf__max_features': [50, 100, 200],
+    'tfidf__ngram_range': [(1, 1), (1, 2)],
+    'clf__n_estimators': [25, 50, 100, 200],
+    'clf__max_depth': [5, 10, None],
+}
+
+def create_tuning_dataset(extra_data=None, samples_per_disease=20, seed=3):
+    """
+    Corpus para validación cruzada: el dataset base (una fila por enfermedad)
+    no alcanza para estratificar, así que se amplía con muestras perturbadas
+    (semilla distinta de la validación y la prueba de train_model.py).
+    """
+    frames = [create_dataset()[['symptoms', 'disease']],
+              create_holdout_dataset(samples_per_disease, seed)]
+    if extra_data is not None and len(extra_data):
+        frames.append(extra_data[['symptoms', 'disease']])
+    return pd.concat(frames, ignore_index=True)
+
+def cross_validate_grid(df, param_grid=None, folds=5, n_jobs=-1, cache_dir=DEFAULT_CACHE):
+    """
+    Validación cruzada estratificada de toda la grilla.
+
+    El pipeline usa `memory=Memory(cache_dir)`: el TF-IDF ajustado de cada
+    (parámetros del vectorizador, pliegue) se guarda en disco y lo reutilizan
+    todas las configuraciones del bosque, también entre ejecuciones.
+    """
+    memory = Memory(cache_dir, verbose=0) if cache_dir else None
+    search = GridSearchCV(
+        build_pipeline(memory=memory),
+        param_grid or PARAM_GRID,
+        scoring='accuracy',
+        cv=StratifiedKFold(folds, shuffle=True, random_state=42),
+        n_jobs=n_jobs,
+        refit=False,
+        return_train_score=False
+    )
+    search.fit(df['symptoms'], df['disease'])
+    results = search.cv_results_
+    return [
+        {
+            'params': params,
+            'cv_accuracy': float(results['mean_test_score'][i]),
+            'cv_std': float(results['std_test_score'][i]),
+            'fit_seconds': float(results['mean_fit_time'][i])
+        }
+        for i, params in enumerate(results['params'])
+    ]
+
+def _fit_and_measure_size(params, texts, labels):
+    model = build_pipeline(params)
+    model.fit(texts, labels)
+    return model, artifact_size(model)
+
+def serving_metrics(rows, df, test, n_jobs=-1, latency_samples=100):
+    """
+    Reentrenar cada configuración con todo el corpus y medir lo que importa
+    al servir: exactitud en un conjunto de prueba independiente, tamaño del
+    artefacto y latencia media de una predicción individual. Los ajustes van
+    en paralelo; la latencia se mide en serie para no competir por núcleos.
+    """
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_and_measure_size)(row['params'], df['symptoms'], df['disease']) for row in rows
+    )
+    test_texts = list(test['symptoms'])
+    test_labels = np.asarray(test['disease'])
+    for row, (model, size) in zip(rows, fitted):
+        row['test_accuracy'] = float((model.predict(test_texts) == test_labels).mean())
+        row['size_kb'] = round(size / 1024, 1)
+        row['latency_ms'] = round(prediction_latency_ms(model, test_texts, latency_samples), 3)
+    return rows
+
+def mark_pareto(rows):
+    """Marcar las configuraciones no dominadas en (exactitud, latencia, tamaño)"""
+    for row in rows:
+        row['pareto'] = not any(
+            other['cv_accuracy'] >= row['cv_accuracy']
+            and other['latency_ms'] <= row['latency_ms']
+            and other['size_kb'] <= row['size_kb']
+            and (other['cv_accuracy'], -other['latency_ms'], -other['size_kb'])
+            != (row['cv_accuracy'], -row['latency_ms'], -row['size_kb'])
+            for other in rows
+        )
+    return rows
+
+def tune(df=None, test=None, param_grid=None, folds=5, n_jobs=-1, cache_dir=DEFAULT_CACHE,
+         top=None, latency_samples=100):
+    """Leaderboard ordenado por exactitud de validación cruzada (y latencia en empates)"""
+    df = create_tuning_dataset() if df is None else df
+    test = create_holdout_dataset(seed=42) if test is None else test
+
+    start = time.perf_counter()
+    rows = cross_validate_grid(df, param_grid, folds, n_jobs, cache_dir)
+    cv_seconds = time.perf_counter() - start
+
+    rows.sort(key=lambda row: -row['cv_accuracy'])
+    rows = rows[:top] if top else rows
+    serving_metrics(rows, df, test, n_jobs, latency_samples)
+    mark_pareto(rows)
+    rows.sort(key=lambda row: (-row['cv_accuracy'], row['latency_ms']))
+    for rank, row in enumerate(rows, 1):
+        row['rank'] = rank
+    return rows, cv_seconds
+
+def format_params(params):
+    return ', '.join(f"{key.split('__')[1]}={value}" for key, value in sorted(params.items()))
+
+def print_leaderboard(rows):
+    print(f"{'#':>3} {'cv acc':>7} {'± std':>6} {'test':>6} {'ms/pred':>8} {'KB':>8}  pareto  parámetros")
+    for row in rows:
+        print(f"{row['rank']:>3} {row['cv_accuracy']:7.1%} {row['cv_std']:6.1%} {row['test_accuracy']:6.1%} "
+              f"{row['latency_ms']:8.2f} {row['size_kb']:8.0f}  {'  *   ' if row['pareto'] else '      '}  "
+              f"{format_params(row['params'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Búsqueda de hiperparámetros con validación cruzada')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=-1, help='Procesos en paralelo (-1 = todos los núcleos)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE, help='Caché en disco del TF-IDF por pliegue')
+    parser.add_argument('--clear-cache', action='store_true')
+    parser.add_argument('--top', type=int, help='Medir latencia y tamaño solo de las N mejores')
+    parser.add_argument('--grid', type=json.loads, help='Grilla en JSON (reemplaza PARAM_GRID)')
+    parser.add_argument('--exported', help='Directorio Parquet exportado del historial de diagnósticos')
+    parser.add_argument('--output', default=os.path.join('models', 'tuning_leaderboard.json'))
+    args = parser.parse_args()
+
+    if args.clear_cache:
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+
+    extra_data = None
+    if args.exported:
+        from training_data import load_training_frame
+        extra_data = load_training_frame(args.exported)
+
+    grid = args.grid
+    if grid and 'tfidf__ngram_range' in grid:
+        grid['tfidf__ngram_range'] = [tuple(value) for value in grid['tfidf__ngram_range']]
+
+    df = create_tuning_dataset(extra_data)
+    n_configs = len(list(itertools.product(*(grid or PARAM_GRID).values())))
+    print(f"Validación cruzada: {n_configs} configuraciones x {args.folds} pliegues, {len(df)} muestras")
+    rows, cv_seconds = tune(df, param_grid=grid, folds=args.folds, n_jobs=args.jobs,
+                            cache_dir=args.cache_dir, top=args.top)
+    print(f"Validación cruzada completada en {cv_seconds:.1f}s\n")
+    print_leaderboard(rows)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"\nLeaderboard guardado en {args.output}. Para entrenar una configuración: "
+          f"python train_model.py --params '<params>'")
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 # Agregar rutas
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
+import backend.app as api
 from backend.app import app, db, Patient, Diagnosis, MedicalExam
 
 @pytest.fixture
@@ -39,6 +40,52 @@ def sample_patient(client):
         db.session.commit()
         return patient
 
+@pytest.fixture
+def registered_patient(client):
+    """Fixture para paciente registrado con cédula"""
+    patient = Patient(
+        cedula='1234567890',
+        name='Ana Torres',
+        age=45,
+        gender='F',
+        email='ana@example.com'
+    )
+    db.session.add(patient)
+    db.session.commit()
+    return patient.cedula
+
+@pytest.fixture
+def trained_model(monkeypatch):
+    """Fixture que carga un modelo recién entrenado en la API"""
+    from train_model import train_model
+    model, disease_info = train_model()
+    monkeypatch.setattr(api, 'model', model)
+    monkeypatch.setattr(api, 'disease_info', disease_info)
+    return model, disease_info
+
+@pytest.fixture
+def remote_inference(client, trained_model, monkeypatch):
+    """API sin modelo local, delegando en el servicio de inferencia real en un puerto libre"""
+    import threading
+    from wsgiref.simple_server import WSGIRequestHandler, make_server
+    from inference_service import InferenceService, create_application
+    
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+    
+    service = InferenceService(*trained_model)
+    server = make_server('127.0.0.1', 0, create_application(lambda: service), handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(api, 'INFERENCE_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(api, 'model', None)
+    monkeypatch.setattr(api, 'inference_client', None)
+    api.load_ml_model()
+    yield service
+    api.inference_client.close()
+    server.shutdown()
+    server.server_close()
+
 def test_health_check(client):
     """Test de verificación de salud"""
     response = client.get('/health')
@@ -155,3 +202,801 @@ def test_invalid_patient_id(client):
     """Test con ID de paciente inválido"""
     response = client.get('/api/patients/999')
     assert response.status_code == 404
+
+def test_diagnose_top_k_differential(client, registered_patient, trained_model):
+    """Test de diagnóstico diferencial top-k en una sola pasada"""
+    model, _ = trained_model
+    symptoms = 'fiebre dolor cabeza cuerpo'
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': symptoms,
+        'top_k': 3
+    })
+    
+    assert response.status_code == 200
+    data = response.get_json()
+    differential = data['differential']
+    assert len(differential) == 3
+    assert differential[0]['disease'] == data['predicted_disease']
+    assert differential[0]['confidence'] == data['confidence']
+    confidences = [d['confidence'] for d in differential]
+    assert confidences == sorted(confidences, reverse=True)
+    
+    expected = sorted(model.predict_proba([symptoms])[0], reverse=True)[:3]
+    assert confidences == [round(p * 100, 2) for p in expected]
+
+def test_diagnosis_differential_is_persisted(client, registered_patient, trained_model, monkeypatch):
+    """Test de consulta del diferencial guardado sin nueva inferencia"""
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'tos seca fiebre respiracion'
+    })
+    data = response.get_json()
+    assert 'differential' not in data
+    
+    monkeypatch.setattr(api, 'model', None)
+    response = client.get(f"/api/diagnoses/{data['diagnosis_id']}/differential?k=2")
+    assert response.status_code == 200
+    stored = response.get_json()
+    assert len(stored['differential']) == 2
+    assert stored['differential'][0]['disease'] == data['predicted_disease']
+
+def test_diagnose_invalid_top_k(client, registered_patient, trained_model):
+    """Test de top_k inválido"""
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre',
+        'top_k': -1
+    })
+    assert response.status_code == 400
+    
+    # Límite compartido con el servicio de inferencia: 400 antes de la llamada remota
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre',
+        'top_k': api.MAX_TOP_K + 1
+    })
+    assert response.status_code == 400
+
+def test_patient_diagnoses_streaming(client, registered_patient, trained_model):
+    """Test de historial en modo streaming (NDJSON y arreglo JSON)"""
+    import json
+    for symptoms in ['fiebre dolor cabeza', 'tos seca fiebre', 'mareo vertigo']:
+        client.post('/api/diagnose', json={
+            'patient_cedula': registered_patient,
+            'symptoms': symptoms
+        })
+    
+    expected = client.get(f'/api/patients/{registered_patient}/diagnoses').get_json()
+    assert len(expected) == 3
+    
+    response = client.get(f'/api/patients/{registered_patient}/diagnoses?stream=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert rows == expected
+    
+    response = client.get(f'/api/patients/{registered_patient}/diagnoses?stream=json')
+    assert response.get_json() == expected
+    
+    response = client.get(f'/api/patients/{registered_patient}/diagnoses?stream=xml')
+    assert response.status_code == 400
+
+def test_patient_diagnoses_date_range(client, registered_patient):
+    """Test de historial filtrado por rango de fechas (poda de particiones)"""
+    for day in (1, 15, 28):
+        db.session.add(Diagnosis(
+            patient_cedula=registered_patient, symptoms='fiebre', predicted_disease='Gripe',
+            confidence=80.0, created_at=datetime(2024, 2, day, 9, 0)
+        ))
+    db.session.commit()
+    
+    url = f'/api/patients/{registered_patient}/diagnoses'
+    data = client.get(f'{url}?since=2024-02-10&until=2024-02-28').get_json()
+    assert [row['created_at'][:10] for row in data] == ['2024-02-15']
+    assert len(client.get(f'{url}?since=2024-02-15').get_json()) == 2
+    
+    assert client.get(f'{url}?since=febrero').status_code == 400
+    assert client.get(f'{url}?since=2024-03-01&until=2024-02-01').status_code == 400
+
+def test_create_patient_constraint_errors(client, registered_patient):
+    """Test de duplicados detectados por las restricciones de la tabla"""
+    base = {'cedula': '7770001', 'name': 'Rosa Vera', 'age': 33, 'email': 'rosa@example.com'}
+    assert client.post('/api/patients', json=base).status_code == 201
+    
+    response = client.post('/api/patients', json=dict(base, email='otra@example.com'))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Paciente con esta cédula ya existe'
+    
+    response = client.post('/api/patients', json=dict(base, cedula='7770002', email=' ana@example.com '))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Ya existe un paciente registrado con este email'
+    assert Patient.query.count() == 2
+
+def test_put_patient_upsert(client, registered_patient):
+    """Test de PUT: crea el registro completo o lo reemplaza conservando created_at"""
+    record = {'name': 'Rosa Vera', 'age': 33, 'email': 'rosa@example.com', 'allergies': 'Penicilina '}
+    response = client.put('/api/patients/7770001', json=record)
+    assert response.status_code == 201
+    created = response.get_json()
+    assert created['cedula'] == '7770001' and created['allergies'] == 'Penicilina'
+    
+    response = client.put('/api/patients/7770001', json=dict(record, age=34, allergies=None, phone='0999'))
+    assert response.status_code == 200
+    updated = response.get_json()
+    assert (updated['age'], updated['allergies'], updated['phone']) == (34, None, '0999')
+    assert updated['created_at'] == created['created_at']
+    assert Patient.query.count() == 2
+    
+    response = client.put('/api/patients/7770001', json=dict(record, email='ana@example.com'))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Ya existe un paciente registrado con este email'
+    assert client.put('/api/patients/7770001', json=dict(record, cedula='123')).status_code == 400
+    assert client.put('/api/patients/7770001', json=dict(record, age=0)).status_code == 400
+
+def test_patient_timeline(client, registered_patient):
+    """Test del historial completo: orden cronológico, paginación, rango y consultas fijas"""
+    from sqlalchemy import event
+    from backend.app import MedicalTest, Appointment
+    
+    def add_history(day):
+        diagnosis = Diagnosis(patient_cedula=registered_patient, symptoms='fiebre', predicted_disease='Gripe',
+                              confidence=70.0, created_at=datetime(2024, 3, day, 8, 0))
+        db.session.add(diagnosis)
+        db.session.flush()
+        db.session.add_all([
+            MedicalTest(diagnosis_id=diagnosis.id, patient_cedula=registered_patient, test_type='Radiografía',
+                        requested_at=datetime(2024, 3, day, 9, 0)),
+            MedicalExam(patient_cedula=registered_patient, diagnosis_id=diagnosis.id, exam_type='Hemograma',
+                        requested_at=datetime(2024, 3, day, 10, 0)),
+            Appointment(patient_cedula=registered_patient, diagnosis_id=diagnosis.id,
+                        scheduled_date=datetime(2024, 3, day + 7, 8, 0))
+        ])
+        db.session.commit()
+    
+    def count_queries(url):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return response, len(statements)
+    
+    url = f'/api/patients/{registered_patient}/timeline'
+    add_history(1)
+    _, queries_small = count_queries(url)
+    for day in range(2, 6):
+        add_history(day)
+    response, queries_large = count_queries(url)
+    assert queries_large == queries_small
+    
+    data = response.get_json()
+    assert data['patient']['cedula'] == registered_patient
+    assert data['total'] == 20 and len(data['events']) == 20
+    dates = [event['date'] for event in data['events']]
+    assert dates == sorted(dates, reverse=True)
+    assert {event['type'] for event in data['events']} == {'diagnosis', 'test', 'exam', 'appointment'}
+    assert data['events'][0]['record']['scheduled_date'] == data['events'][0]['date']
+    
+    first = client.get(f'{url}?per_page=6').get_json()
+    second = client.get(f'{url}?per_page=6&page=2').get_json()
+    assert first['pages'] == 4
+    assert first['events'] + second['events'] == data['events'][:12]
+    
+    ranged = client.get(f'{url}?since=2024-03-02&until=2024-03-03').get_json()
+    assert [event['type'] for event in ranged['events']] == ['exam', 'test', 'diagnosis']
+    
+    assert client.get(f'{url}?per_page=0').status_code == 400
+    assert client.get(f'{url}?since=ayer').status_code == 400
+    assert client.get('/api/patients/0000/timeline').status_code == 404
+
+def test_delete_patient_cascades(client, registered_patient):
+    """Test de borrado del paciente y su historial con un número fijo de sentencias"""
+    from sqlalchemy import event
+    from backend.app import MedicalTest, Appointment, DiagnosisFeedback
+    
+    for day in range(1, 21):
+        diagnosis = Diagnosis(patient_cedula=registered_patient, symptoms='fiebre', predicted_disease='Gripe',
+                              confidence=70.0, created_at=datetime(2024, 3, day))
+        db.session.add(diagnosis)
+        db.session.flush()
+        db.session.add_all([
+            MedicalTest(diagnosis_id=diagnosis.id, patient_cedula=registered_patient, test_type='Radiografía'),
+            MedicalExam(patient_cedula=registered_patient, diagnosis_id=diagnosis.id, exam_type='Hemograma'),
+            Appointment(patient_cedula=registered_patient, diagnosis_id=diagnosis.id,
+                        scheduled_date=datetime(2024, 4, day)),
+            DiagnosisFeedback(diagnosis_id=diagnosis.id, confirmed_disease='Gripe')
+        ])
+    client.post('/api/patients', json={'cedula': '7770001', 'name': 'Rosa Vera', 'age': 33,
+                                       'email': 'rosa@example.com'})
+    db.session.commit()
+    
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.delete(f'/api/patients/{registered_patient}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    assert len(statements) == 1
+    
+    for model in (Diagnosis, MedicalTest, MedicalExam, Appointment, DiagnosisFeedback):
+        assert db.session.query(model).count() == 0
+    assert db.session.get(Patient, '7770001') is not None
+    assert client.delete(f'/api/patients/{registered_patient}').status_code == 404
+
+def test_lab_worklist(client, registered_patient):
+    """Test de la lista de trabajo: tomas disjuntas, toma vencida, resultados en bloque"""
+    from backend.app import MedicalTest
+    diagnosis = Diagnosis(patient_cedula=registered_patient, symptoms='fiebre', predicted_disease='Gripe')
+    db.session.add(diagnosis)
+    db.session.flush()
+    db.session.add_all([
+        MedicalTest(diagnosis_id=diagnosis.id, patient_cedula=registered_patient,
+                    test_type='Radiografía' if i % 2 else 'Análisis de sangre')
+        for i in range(7)
+    ])
+    db.session.commit()
+    
+    claim = lambda **body: client.post('/api/worklist/claim', json=body)
+    first = claim(worker='lab-1', limit=3).get_json()['tests']
+    second = claim(worker='lab-2', limit=3, test_types=['Radiografía']).get_json()['tests']
+    assert [t['id'] for t in first] == [1, 2, 3]
+    assert [t['id'] for t in second] == [4, 6]
+    assert {t['status'] for t in first + second} == {'claimed'}
+    assert second[0]['claimed_by'] == 'lab-2'
+    
+    response = client.post('/api/worklist/results', json={'worker': 'lab-1', 'results': [
+        {'id': 1, 'results': 'Leucocitos elevados'}, {'id': 2, 'results': 'Normal'}, {'id': 4, 'results': 'x'}
+    ]})
+    assert response.get_json() == {'completed': [1, 2], 'rejected': [4]}
+    db.session.expire_all()
+    assert db.session.get(MedicalTest, 1).status == 'completed'
+    assert db.session.get(MedicalTest, 1).results == 'Leucocitos elevados'
+    assert db.session.get(MedicalTest, 4).results is None
+    
+    # Las tomas vencidas vuelven a la lista; las completadas no
+    MedicalTest.query.filter_by(claimed_by='lab-2').update({'claimed_at': datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    third = claim(worker='lab-3', limit=10).get_json()['tests']
+    assert [t['id'] for t in third] == [4, 5, 6, 7]
+    assert claim(worker='lab-1', limit=10).get_json()['tests'] == []
+    
+    assert claim(limit=3).status_code == 400
+    assert claim(worker='lab-1', limit=0).status_code == 400
+    assert client.post('/api/worklist/results', json={'worker': 'lab-1', 'results': [{'id': '1'}]}).status_code == 400
+
+def test_worklist_claim_statement():
+    """Test de la sentencia de toma: SKIP LOCKED en PostgreSQL e índice parcial de pendientes"""
+    from sqlalchemy.dialects import postgresql
+    from backend.app import MedicalTest
+    
+    sql = str(api.claim_statement('postgresql', 'lab-1', 10).compile(dialect=postgresql.dialect()))
+    assert 'FOR UPDATE SKIP LOCKED' in sql
+    assert sql.startswith('UPDATE medical_tests') and 'RETURNING' in sql
+    assert 'SKIP LOCKED' not in str(api.claim_statement('sqlite', 'lab-1', 10))
+    
+    index = next(i for i in MedicalTest.__table__.indexes if i.name == 'ix_medical_tests_worklist')
+    assert "status IN ('recommended', 'claimed')" in str(index.dialect_options['postgresql']['where'])
+
+def test_fast_json_serialization(client):
+    """Test de serialización con esquemas compilados y proveedor JSON rápido"""
+    response = client.post('/api/patients', json={
+        'cedula': '5550001',
+        'name': 'Luis Mora',
+        'age': 52,
+        'email': 'luis@example.com',
+        'blood_pressure_systolic': 120,
+        'blood_pressure_diastolic': 80
+    })
+    assert response.status_code == 201
+    data = response.get_json()
+    assert data['blood_pressure'] == '120/80'
+    
+    patient = db.session.get(Patient, '5550001')
+    assert data['created_at'] == patient.created_at.isoformat()
+    assert list(patient.to_dict())[:3] == ['cedula', 'name', 'age']
+
+def test_json_provider_fallback(monkeypatch):
+    """Test del camino estándar cuando orjson no está disponible"""
+    import json_provider
+    
+    payload = {'created_at': datetime(2024, 5, 1, 8, 30, 15, 120), 'items': [1, 2]}
+    fast = app.json.dumps(payload)
+    monkeypatch.setattr(json_provider, 'orjson', None)
+    standard = app.json.dumps(payload)
+    
+    assert app.json.loads(fast) == app.json.loads(standard)
+    assert app.json.loads(standard)['created_at'] == '2024-05-01T08:30:15.000120'
+
+def test_bench_json_rows():
+    """Test de humo del benchmark de serialización (también usado por bench_nginx.py --offline)"""
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+    from bench_json import build_rows, legacy_to_dict
+    
+    rows = build_rows(5)
+    assert len(rows) == 5 and all(len(d.recommended_tests) == 3 and d.medications for d in rows)
+    with app.app_context():
+        for d in rows:
+            expected = legacy_to_dict(d)
+            assert {key: d.to_dict()[key] for key in expected} == expected | {'created_at': d.created_at}
+
+def test_diagnose_write_behind(client, registered_patient, trained_model, monkeypatch, tmp_path):
+    """Test de escritura diferida de pruebas de apoyo y cita"""
+    from backend.app import MedicalTest, Appointment
+    from outbox import Outbox
+    
+    monkeypatch.setattr(api, 'outbox', Outbox(db.engine, api.outbox_tasks))
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'dolor'
+    })
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['low_confidence'] is True
+    assert len(data['recommended_tests']) == 3
+    assert 'follow_up_appointment' in data
+    
+    # Hasta que el trabajador procese la outbox solo existen el diagnóstico y su tarea
+    assert MedicalTest.query.count() == 0
+    assert api.outbox.counts() == {'pending': 1}
+    assert api.outbox.process(api.handle_outbox_task) == 1
+    assert MedicalTest.query.filter_by(diagnosis_id=data['diagnosis_id']).count() == 3
+    appointment = Appointment.query.filter_by(diagnosis_id=data['diagnosis_id']).one()
+    assert appointment.scheduled_date.isoformat() == data['follow_up_appointment']['scheduled_date']
+    
+    # Reintentos y reencolados no duplican registros
+    api.handle_outbox_task('support_records', {
+        'diagnosis_id': data['diagnosis_id'],
+        'patient_cedula': registered_patient,
+        'recommended_tests': data['recommended_tests'],
+        'follow_up_date': data['follow_up_appointment']['scheduled_date']
+    })
+    assert MedicalTest.query.count() == 3
+    assert Appointment.query.count() == 1
+    assert not api.outbox.enqueue(db.session.connection(), api.support_records_key(data['diagnosis_id']),
+                                  'support_records', {})
+    db.session.rollback()
+
+def test_diagnose_write_behind_is_atomic(client, registered_patient, trained_model, monkeypatch):
+    """Test de diagnóstico y tarea de la outbox en una sola transacción"""
+    from outbox import Outbox
+    
+    def failing_enqueue(*args):
+        raise RuntimeError('outbox no disponible')
+    
+    outbox = Outbox(db.engine, api.outbox_tasks)
+    monkeypatch.setattr(outbox, 'enqueue', failing_enqueue)
+    monkeypatch.setattr(api, 'outbox', outbox)
+    for core_writes in (True, False):
+        monkeypatch.setattr(api, 'DIAGNOSIS_CORE_WRITES', core_writes)
+        response = client.post('/api/diagnose', json={
+            'patient_cedula': registered_patient,
+            'symptoms': 'dolor'
+        })
+        assert response.status_code == 500
+        assert Diagnosis.query.count() == 0
+
+def test_diagnose_stores_catalog_references(client, registered_patient, trained_model):
+    """Test de medicamentos y pruebas guardados como referencias al catálogo"""
+    _, disease_info = trained_model
+    responses = [client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': symptoms
+    }).get_json() for symptoms in ['fiebre tos', 'fiebre tos', 'mareo']]
+    
+    diagnoses = Diagnosis.query.order_by(Diagnosis.id).all()
+    assert all(d.legacy_medications is None and d.legacy_recommended_tests is None for d in diagnoses)
+    assert diagnoses[0].medication_set_id == diagnoses[1].medication_set_id is not None
+    assert db.session.query(api.MedicationSet).count() == sum(
+        1 for details in disease_info.values() if details['medications'])
+    
+    history = client.get(f'/api/patients/{registered_patient}/diagnoses').get_json()
+    for response, row in zip(responses, reversed(history)):
+        assert row['medications'] == response['medications'] == disease_info[response['predicted_disease']]['medications']
+        assert row['recommended_tests'] == response.get('recommended_tests', [])
+
+def test_diagnosis_core_write_matches_orm(client, registered_patient):
+    """Test de paridad: la escritura Core produce las mismas filas que el ORM"""
+    from backend.app import MedicalTest, Appointment
+    values = dict(
+        patient_cedula=registered_patient, symptoms='fiebre tos', symptoms_json=[],
+        predicted_disease='Gripe/Influenza', confidence=70.0, severity='Moderada', requires_exam=True,
+        test_panel_id=None, medication_set_id=None, legacy_medications=['Oseltamivir'],
+        differential=[{'disease': 'Gripe/Influenza', 'confidence': 70.0}], explanation=None
+    )
+    follow_up = datetime(2024, 5, 8, 9, 0)
+    
+    ids = [write(values, api.SUPPORT_TESTS, follow_up)
+           for write in (api.write_diagnosis_orm, api.write_diagnosis_core)]
+    db.session.expire_all()
+    
+    def snapshot(diagnosis_id):
+        ignored = {'id', 'diagnosis_id', 'created_at', 'requested_at'}
+        strip = lambda row: {k: v for k, v in row.to_dict().items() if k not in ignored}
+        return (
+            strip(db.session.get(Diagnosis, diagnosis_id)),
+            [strip(t) for t in MedicalTest.query.filter_by(diagnosis_id=diagnosis_id).order_by(MedicalTest.id)],
+            [strip(a) for a in Appointment.query.filter_by(diagnosis_id=diagnosis_id)]
+        )
+    
+    orm, core = snapshot(ids[0]), snapshot(ids[1])
+    assert ids[1] == ids[0] + 1
+    assert core == orm
+    assert len(core[1]) == 3 and core[2][0]['scheduled_date'] == follow_up
+    assert core[0]['medications'] == ['Oseltamivir'] and core[0]['recommended_tests'] == []
+    
+    # Sin pruebas de apoyo no se crea la cita
+    diagnosis_id = api.write_diagnosis_core(dict(values, confidence=95.0), [], follow_up)
+    assert Appointment.query.filter_by(diagnosis_id=diagnosis_id).count() == 0
+
+def test_diagnose_with_cascade_metrics(client, registered_patient, trained_model, monkeypatch):
+    """Test de diagnóstico con cascada y métricas de escalado"""
+    from train_model import train_linear_stage
+    from inference import CascadeClassifier
+    from metrics import metrics
+    
+    model, _ = trained_model
+    monkeypatch.setattr(api, 'cascade', CascadeClassifier(model, train_linear_stage(model), margin=0.0))
+    metrics.reset()
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'dolor oido audiencia reducida inflamacion'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['predicted_disease'] == 'Otitis'
+    
+    data = client.get('/api/metrics').get_json()
+    assert data['inference_linear_count'] == 1
+    assert data['cascade']['enabled'] is True
+    assert data['cascade']['escalation_rate'] == 0
+
+def test_diagnose_with_onnx_backend(client, registered_patient, trained_model, monkeypatch, tmp_path):
+    """Test de diagnóstico servido por onnxruntime"""
+    pytest.importorskip('skl2onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx_export import export_onnx, load_onnx_model
+    
+    model, disease_info = trained_model
+    export_onnx(model, disease_info, str(tmp_path))
+    onnx_model, _ = load_onnx_model(str(tmp_path))
+    monkeypatch.setattr(api, 'model', onnx_model)
+    
+    symptoms = 'congestion nasal estornudos goteo nasal'
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': symptoms,
+        'top_k': 2
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['predicted_disease'] == model.predict([symptoms])[0]
+    assert data['confidence'] == round(float(model.predict_proba([symptoms])[0].max()) * 100, 2)
+
+def test_diagnose_with_remote_inference(client, registered_patient, trained_model, monkeypatch):
+    """Test de diagnóstico delegado al servicio de inferencia"""
+    from inference_client import InferenceServiceError
+    
+    class FakeInferenceClient:
+        def __init__(self, fail=False):
+            self.fail = fail
+            self.calls = []
+        
+        def infer(self, texts, top_k=5, explain=False, top_terms=10):
+            self.calls.append((texts, top_k))
+            if self.fail:
+                raise InferenceServiceError('Timeout del servicio de inferencia')
+            return {
+                'predictions': [[{'disease': 'Gripe', 'confidence': 91.5}, {'disease': 'Resfriado', 'confidence': 8.5}]],
+                'input_quality': [{'terms': 4, 'known_terms': 4, 'coverage': 1.0, 'unknown_terms': []}]
+            }
+    
+    remote = FakeInferenceClient()
+    monkeypatch.setattr(api, 'model', None)
+    monkeypatch.setattr(api, 'inference_client', remote)
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta tos seca'
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['predicted_disease'] == 'Gripe'
+    assert data['confidence'] == 91.5
+    assert remote.calls == [(['fiebre alta tos seca'], api.DIFFERENTIAL_TOP_K)]
+    
+    monkeypatch.setattr(api, 'inference_client', FakeInferenceClient(fail=True))
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta tos seca'
+    })
+    assert response.status_code == 503
+
+def test_similar_diagnoses(client, registered_patient, trained_model, monkeypatch, tmp_path):
+    """Test de casos similares por diagnóstico y por texto"""
+    monkeypatch.setattr(api, 'SIMILARITY_INDEX_PATH', str(tmp_path / 'similarity'))
+    monkeypatch.setattr(api, 'similarity_index', None)
+    
+    ids = []
+    for symptoms in ['fiebre alta tos seca', 'fiebre tos dolor muscular', 'dolor oido inflamacion']:
+        response = client.post('/api/diagnose', json={
+            'patient_cedula': registered_patient,
+            'symptoms': symptoms
+        })
+        ids.append(response.get_json()['diagnosis_id'])
+    
+    # Sin índice en disco se construye en segundo plano
+    response = client.get(f'/api/diagnoses/{ids[0]}/similar?k=2')
+    assert response.status_code == 503
+    api.similarity_build.join()
+    
+    response = client.get(f'/api/diagnoses/{ids[0]}/similar?k=2')
+    assert response.status_code == 200
+    similar = response.get_json()['similar']
+    assert similar[0]['diagnosis_id'] == ids[1]
+    assert all(case['diagnosis_id'] != ids[0] for case in similar)
+    
+    # Los diagnósticos nuevos se indexan sin reconstruir el índice
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'dolor oido audiencia reducida'
+    })
+    new_id = response.get_json()['diagnosis_id']
+    response = client.get('/api/diagnoses/similar?symptoms=dolor oido audiencia reducida&k=1')
+    assert response.get_json()['similar'][0]['diagnosis_id'] == new_id
+    
+    assert client.get('/api/diagnoses/similar?symptoms=fiebre&k=0').status_code == 400
+    assert client.get('/api/diagnoses/similar').status_code == 400
+    assert client.get('/api/diagnoses/9999/similar').status_code == 404
+
+def test_similar_indexes_late_commits(client, registered_patient, trained_model, monkeypatch, tmp_path):
+    """Test de un diagnóstico que confirma después de otro con id mayor ya indexado"""
+    monkeypatch.setattr(api, 'SIMILARITY_INDEX_PATH', str(tmp_path / 'similarity'))
+    monkeypatch.setattr(api, 'similarity_index', None)
+    api.build_similarity_index(api.model_vectorizer())
+    
+    def insert(diagnosis_id, symptoms):
+        with db.engine.begin() as conn:
+            conn.execute(Diagnosis.__table__.insert(), {
+                'id': diagnosis_id, 'patient_cedula': registered_patient,
+                'symptoms': symptoms, 'predicted_disease': 'Otitis'
+            })
+    
+    insert(1001, 'fiebre alta tos seca')
+    response = client.get('/api/diagnoses/similar?symptoms=fiebre alta tos&k=1')
+    assert response.get_json()['similar'][0]['diagnosis_id'] == 1001
+    
+    insert(1000, 'dolor oido audiencia reducida')
+    response = client.get('/api/diagnoses/similar?symptoms=dolor oido audiencia&k=1')
+    assert response.get_json()['similar'][0]['diagnosis_id'] == 1000
+    assert api.similarity_index.watermark == 0
+    
+    # Pasada la ventana de asentamiento la marca de agua avanza sin repetir filas
+    monkeypatch.setattr(api, 'SIMILARITY_SETTLE_SECONDS', 0)
+    client.get('/api/diagnoses/similar?symptoms=fiebre&k=1')
+    assert api.similarity_index.watermark == 1001
+    assert len(api.similarity_index) == 2
+
+def test_similar_and_suggest_with_remote_inference(client, registered_patient, remote_inference, monkeypatch, tmp_path):
+    """Test de casos similares y autocompletado con el TF-IDF del servicio de inferencia"""
+    monkeypatch.setattr(api, 'SIMILARITY_INDEX_PATH', str(tmp_path / 'similarity'))
+    monkeypatch.setattr(api, 'similarity_index', None)
+    assert api.model is None and api.model_vectorizer() is not None
+    
+    ids = []
+    for symptoms in ['fiebre alta tos seca', 'dolor oido inflamacion', 'fiebre tos dolor muscular']:
+        response = client.post('/api/diagnose', json={
+            'patient_cedula': registered_patient,
+            'symptoms': symptoms
+        })
+        assert response.status_code == 200
+        ids.append(response.get_json()['diagnosis_id'])
+    
+    api.build_similarity_index(api.model_vectorizer())
+    response = client.get(f'/api/diagnoses/{ids[0]}/similar?k=1')
+    assert response.status_code == 200
+    assert response.get_json()['similar'][0]['diagnosis_id'] == ids[2]
+    
+    response = client.get('/api/symptoms/suggest?prefix=fie&limit=1')
+    assert response.status_code == 200
+    assert response.get_json()['suggestions'][0]['term'] == 'fiebre'
+
+def test_suggest_symptoms(client, registered_patient, trained_model):
+    """Test de autocompletado con el vocabulario del modelo"""
+    response = client.get('/api/symptoms/suggest?prefix=respiración')
+    assert response.status_code == 200
+    assert [s['term'] for s in response.get_json()['suggestions']] == ['respiracion']
+    
+    response = client.get('/api/symptoms/suggest?prefix=fie&limit=1')
+    assert response.get_json()['suggestions'][0]['term'] == 'fiebre'
+    
+    assert client.get('/api/symptoms/suggest').status_code == 400
+    assert client.get('/api/symptoms/suggest?prefix=fie&limit=0').status_code == 400
+
+def test_reload_model_rebuilds_suggester(client, trained_model, monkeypatch):
+    """Test de recarga del modelo y reconstrucción del autocompletado"""
+    import train_model as train_module
+    
+    model, disease_info = trained_model
+    original = api.get_symptom_suggester()
+    reloaded = train_module.train_model()
+    monkeypatch.setattr(train_module, 'load_model', lambda path: reloaded)
+    
+    monkeypatch.setattr(api, 'MODEL_RELOAD_TOKEN', '')
+    assert client.post('/api/model/reload').status_code == 403
+    monkeypatch.setattr(api, 'MODEL_RELOAD_TOKEN', 'secreto')
+    assert client.post('/api/model/reload').status_code == 401
+    assert client.post('/api/model/reload', headers={'Authorization': 'Bearer otro'}).status_code == 401
+    assert api.model is model
+    
+    response = client.post('/api/model/reload', headers={'Authorization': 'Bearer secreto'})
+    assert response.status_code == 200
+    assert response.get_json()['vocabulary_size'] == len(model.named_steps['tfidf'].vocabulary_)
+    assert api.model is reloaded[0]
+    assert api.symptom_suggester is not original
+    assert api.symptom_suggester.vectorizer is reloaded[0].named_steps['tfidf']
+
+def test_model_refresh_on_new_version(client, trained_model, monkeypatch):
+    """Test de recarga por proceso cuando cambia la versión del modelo publicado"""
+    import train_model as train_module
+    
+    reloaded = train_module.train_model()
+    loads = []
+    monkeypatch.setattr(train_module, 'load_model', lambda path: loads.append(path) or reloaded)
+    monkeypatch.setattr(api, 'model_version', 'v1')
+    monkeypatch.setattr(api, 'model_next_check', 0.0)
+    monkeypatch.setattr(api, 'MODEL_CHECK_INTERVAL', 60)
+    monkeypatch.setattr(api, 'artifact_version', lambda path, backend: 'v1')
+    
+    client.get('/health')
+    assert loads == [] and api.model is trained_model[0]
+    
+    # Publicado después de la comprobación: se detecta en la siguiente, no en cada request
+    monkeypatch.setattr(api, 'artifact_version', lambda path, backend: 'v2')
+    client.get('/health')
+    assert loads == []
+    monkeypatch.setattr(api, 'model_next_check', 0.0)
+    response = client.get('/health')
+    assert len(loads) == 1 and api.model is reloaded[0]
+    assert response.get_json()['model_version'] == 'v2'
+
+def test_diagnose_out_of_vocabulary(client, registered_patient, trained_model):
+    """Test de entrada sin términos del vocabulario: no se ejecuta el modelo ni se guarda nada"""
+    from metrics import metrics
+    metrics.reset()
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'me siento raro hoy'
+    })
+    assert response.status_code == 422
+    data = response.get_json()
+    assert data['status'] == 'insufficient_information'
+    assert data['input_quality']['known_terms'] == 0
+    assert 'raro' in data['input_quality']['unknown_terms']
+    assert Diagnosis.query.count() == 0
+    assert metrics.get('inference_forest_count') == 0
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta y algo raro'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['input_quality']['coverage'] == 0.5
+    
+    quality = client.get('/api/metrics').get_json()['input_quality']
+    assert quality == {
+        'checked': 2,
+        'out_of_vocabulary': 1,
+        'insufficient_information': 1,
+        'mean_coverage': 2 / 8
+    }
+
+def test_diagnose_out_of_vocabulary_remote(client, registered_patient, remote_inference, monkeypatch):
+    """Test de entrada sin términos del vocabulario con el servicio de inferencia remoto"""
+    monkeypatch.setattr(api, 'model_vectorizer', lambda: None)  # Solo la comprobación del servicio
+    predictions = []
+    original = remote_inference.model.predict_proba
+    monkeypatch.setattr(remote_inference.model, 'predict_proba', lambda texts: predictions.append(texts) or original(texts))
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'me siento raro hoy'
+    })
+    assert response.status_code == 422
+    assert response.get_json()['input_quality']['known_terms'] == 0
+    assert predictions == [] and Diagnosis.query.count() == 0
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta y algo raro'
+    })
+    assert response.status_code == 200
+    assert response.get_json()['input_quality']['coverage'] == 0.5
+    assert predictions == [['fiebre alta y algo raro']]
+
+def test_diagnose_with_explanation(client, registered_patient, trained_model):
+    """Test de explicación opcional persistida con el diagnóstico"""
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta tos seca dolor muscular',
+        'explain': True
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    explanation = data['explanation']
+    assert explanation['method'] == 'saabas'
+    assert explanation['class'] == data['predicted_disease']
+    assert explanation['contributions']
+    
+    stored = Diagnosis.query.get(data['diagnosis_id'])
+    assert stored.explanation == explanation
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta tos seca'
+    })
+    assert 'explanation' not in response.get_json()
+    assert Diagnosis.query.get(response.get_json()['diagnosis_id']).explanation is None
+    
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre',
+        'explain': 'si'
+    })
+    assert response.status_code == 400
+
+def test_diagnose_with_explanation_remote(client, registered_patient, remote_inference):
+    """Test de explicación calculada por el servicio de inferencia remoto"""
+    from explain import ForestExplainer
+    
+    symptoms = 'fiebre alta tos seca dolor muscular'
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': symptoms,
+        'explain': True
+    })
+    assert response.status_code == 200
+    data = response.get_json()
+    expected = ForestExplainer(remote_inference.model).explain([symptoms], [data['predicted_disease']], api.EXPLAIN_TOP_TERMS)[0]
+    assert data['explanation'] == expected
+    assert Diagnosis.query.get(data['diagnosis_id']).explanation == expected
+
+def test_diagnosis_feedback(client, registered_patient, trained_model):
+    """Test de retroalimentación con la enfermedad confirmada"""
+    response = client.post('/api/diagnose', json={
+        'patient_cedula': registered_patient,
+        'symptoms': 'fiebre alta tos seca dolor muscular'
+    })
+    diagnosis_id = response.get_json()['diagnosis_id']
+    predicted = response.get_json()['predicted_disease']
+    confirmed = 'Neumonía' if predicted != 'Neumonía' else 'Bronquitis'
+    
+    response = client.post(f'/api/diagnoses/{diagnosis_id}/feedback', json={
+        'confirmed_disease': confirmed,
+        'source': 'test',
+        'notes': 'Radiografía con consolidación'
+    })
+    assert response.status_code == 201
+    data = response.get_json()
+    assert data['confirmed_disease'] == confirmed
+    assert data['predicted_disease'] == predicted
+    assert data['agrees'] is False
+    
+    stored = Diagnosis.query.get(diagnosis_id)
+    assert stored.confirmed_disease == confirmed
+    assert stored.confirmed_at is not None
+    assert stored.to_dict()['confirmed_disease'] == confirmed
+    
+    assert client.post(f'/api/diagnoses/{diagnosis_id}/feedback', json={}).status_code == 400
+    assert client.post(f'/api/diagnoses/{diagnosis_id}/feedback', json={
+        'confirmed_disease': 'Enfermedad Inventada'
+    }).status_code == 400
+    assert client.post(f'/api/diagnoses/{diagnosis_id}/feedback', json={
+        'confirmed_disease': confirmed, 'source': 'rumor'
+    }).status_code == 400
+    assert client.post('/api/diagnoses/9999/feedback', json={'confirmed_disease': confirmed}).status_code == 404
@@ -0,0 +1,77 @@
+"""
+Tests para los catálogos de medicamentos y pruebas, y su migración
+"""
+
+import pytest
+import sys
+import os
+
+from sqlalchemy import create_engine, inspect
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from migrate_catalogs import (app, db, Diagnosis, MedicationSet, TestPanel, SUPPORT_TESTS,
+                              migrate, upgrade_schema)
+from app import Patient
+from train_model import MEDICATIONS
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        db.session.add(Patient(cedula='1234567890', name='Ana Torres', age=45, email='ana@example.com'))
+        db.session.commit()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+def insert_legacy_diagnoses(rows):
+    """Diagnósticos con copias JSON, como los escribían las versiones anteriores"""
+    with db.engine.begin() as conn:
+        conn.execute(Diagnosis.__table__.insert(), [
+            {'patient_cedula': '1234567890', 'symptoms': 'fiebre tos', 'predicted_disease': disease,
+             'confidence': confidence, 'medications': medications, 'recommended_tests': tests}
+            for disease, confidence, medications, tests in rows
+        ])
+
+def test_migrate_converts_json_to_references(database):
+    """Test de migración por lotes: mismo contenido servido desde el catálogo"""
+    old_flu = ['Oseltamivir']
+    insert_legacy_diagnoses([
+        ('Gripe/Influenza', 70.0, MEDICATIONS['Gripe/Influenza'], SUPPORT_TESTS),
+        ('Gripe/Influenza', 90.0, MEDICATIONS['Gripe/Influenza'], []),
+        ('Gripe/Influenza', 91.0, old_flu, None),
+        ('Asma', 95.0, MEDICATIONS['Asma'], []),
+        ('Desconocida', 30.0, [], SUPPORT_TESTS),
+    ])
+    before = [d.to_dict() for d in Diagnosis.query.order_by(Diagnosis.id)]
+
+    assert migrate(chunk_size=2) == 5
+    db.session.expire_all()
+
+    diagnoses = Diagnosis.query.order_by(Diagnosis.id).all()
+    assert [d.to_dict() for d in diagnoses] == before
+    assert all(d.legacy_medications is None and d.legacy_recommended_tests is None for d in diagnoses)
+    # Dos versiones para la gripe (lista antigua y actual), un solo panel compartido
+    assert db.session.query(MedicationSet).filter_by(name='Gripe/Influenza').count() == 2
+    assert db.session.query(TestPanel).count() == 1
+    assert diagnoses[0].test_panel_id == diagnoses[4].test_panel_id
+    assert diagnoses[0].medication_set_id == diagnoses[1].medication_set_id != diagnoses[2].medication_set_id
+    assert diagnoses[4].medication_set_id is None
+
+    # Idempotente: una segunda pasada no encuentra filas pendientes
+    assert migrate() == 0
+
+def test_upgrade_adds_reference_columns(tmp_path):
+    """Test de ALTER TABLE sobre una tabla diagnoses creada antes del catálogo"""
+    engine = create_engine(f'sqlite:///{tmp_path / "legacy.db"}')
+    with engine.begin() as conn:
+        conn.exec_driver_sql('CREATE TABLE diagnoses (id INTEGER PRIMARY KEY, medications JSON)')
+
+    added = upgrade_schema(engine)
+    assert {'diagnoses.medication_set_id', 'diagnoses.test_panel_id'} <= set(added)
+    columns = {column['name'] for column in inspect(engine).get_columns('diagnoses')}
+    assert {'medication_set_id', 'test_panel_id'} <= columns
+    assert upgrade_schema(engine) == []
@@ -0,0 +1,51 @@
+"""
+Tests para el borrado masivo de pacientes
+"""
+
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from erase_patients import app, db, declared_foreign_keys, erase, migrate_foreign_keys, read_cedulas
+from app import Patient, Diagnosis, MedicalTest
+
+@pytest.fixture
+def database():
+    with app.app_context():
+        db.create_all()
+        yield
+        db.session.remove()
+        db.drop_all()
+
+def test_erase_in_batches(database, tmp_path):
+    """Test de borrado por lotes: historial eliminado por la BD y cédulas inexistentes ignoradas"""
+    with db.engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), [
+            {'cedula': f'{i:010d}', 'name': f'Paciente {i}', 'age': 40, 'email': f'p{i}@example.com'}
+            for i in range(10)
+        ])
+        conn.execute(Diagnosis.__table__.insert(), [
+            {'id': i * 10 + j, 'patient_cedula': f'{i:010d}', 'symptoms': 'fiebre', 'predicted_disease': 'Gripe'}
+            for i in range(10) for j in range(5)
+        ])
+        conn.execute(MedicalTest.__table__.insert(), [
+            {'diagnosis_id': i * 10, 'patient_cedula': f'{i:010d}', 'test_type': 'Radiografía'} for i in range(10)
+        ])
+    path = tmp_path / 'cedulas.txt'
+    path.write_text('\n'.join(f'{i:010d}' for i in range(7)) + '\n9999999999\n\n')
+    
+    assert erase(read_cedulas(path), batch_size=3) == 7
+    assert db.session.query(Patient).count() == 3
+    assert db.session.query(Diagnosis).count() == 15
+    assert {t.patient_cedula for t in db.session.query(MedicalTest)} == {'0000000007', '0000000008', '0000000009'}
+
+def test_declared_foreign_keys(database):
+    """Test de reglas ON DELETE declaradas en los modelos (migrate-fks solo aplica en PostgreSQL)"""
+    rules = {(table, column): ondelete for table, column, _, _, ondelete in declared_foreign_keys()}
+    assert rules[('diagnoses', 'patient_cedula')] == 'CASCADE'
+    assert rules[('medical_tests', 'diagnosis_id')] == 'CASCADE'
+    assert rules[('appointments', 'diagnosis_id')] == 'SET NULL'
+    assert migrate_foreign_keys(db.engine) == []
@@ -0,0 +1,179 @@
+"""
+Tests para la exportación incremental a Parquet y su lectura en entrenamiento
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backend.app import db, Patient, Diagnosis, DiagnosisFeedback, MedicalTest, MedicalExam
+from export_training_data import export, read_watermark, write_watermark, SCHEMA
+from training_data import iter_training_batches, load_training_frame
+from train_model import train_model
+
+DAY_ONE = datetime(2024, 3, 1, 10, 0)
+DAY_TWO = datetime(2024, 3, 2, 10, 0)
+
+def insert_diagnoses(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(Diagnosis.__table__.insert(), [
+            {'patient_cedula': '1234567890', 'symptoms': symptoms, 'predicted_disease': disease,
+             'confidence': 80.0, 'severity': 'leve', 'created_at': created_at}
+            for symptoms, disease, created_at in rows
+        ])
+
+@pytest.fixture
+def engine(tmp_path):
+    """BD SQLite con diagnósticos de dos días y resultados completados en algunos"""
+    engine = create_engine(f'sqlite:///{tmp_path / "history.db"}')
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), [
+            {'cedula': '1234567890', 'name': 'Ana Torres', 'age': 45, 'email': 'ana@example.com'}
+        ])
+    insert_diagnoses(engine, [
+        ('fiebre tos dolor de garganta', 'Gripe', DAY_ONE),
+        ('dolor de cabeza intenso', 'Migraña', DAY_ONE),
+        ('fiebre tos congestión', 'Resfriado Común', DAY_TWO),
+    ])
+    with engine.begin() as conn:
+        conn.execute(MedicalTest.__table__.insert(), [
+            {'diagnosis_id': 1, 'patient_cedula': '1234567890', 'test_type': 'Hemograma',
+             'status': 'completed', 'results': 'Leucocitos elevados'},
+            {'diagnosis_id': 2, 'patient_cedula': '1234567890', 'test_type': 'Tomografía',
+             'status': 'recommended', 'results': None},
+        ])
+        conn.execute(MedicalExam.__table__.insert(), [
+            {'diagnosis_id': 3, 'patient_cedula': '1234567890', 'exam_type': 'Radiografía de tórax',
+             'status': 'completed', 'results': 'Normal'},
+        ])
+    return engine
+
+def read_rows(output):
+    return sorted(pq.read_table(output).to_pylist(), key=lambda row: row['diagnosis_id'])
+
+def test_export_writes_partitioned_files_with_stable_schema(engine, tmp_path):
+    """Test de particiones por fecha, compresión, esquema y resultados agregados"""
+    output = str(tmp_path / 'export')
+    summary = export(engine, output, chunk_size=2)
+
+    assert summary['rows'] == 3
+    assert sorted(os.listdir(output)) == ['_watermark.json', 'date=2024-03-01', 'date=2024-03-02']
+    for path in summary['files']:
+        parquet = pq.ParquetFile(path)
+        assert parquet.schema_arrow.equals(SCHEMA)
+        assert parquet.metadata.row_group(0).column(0).compression == 'ZSTD'
+
+    rows = read_rows(output)
+    assert [row['confirmed'] for row in rows] == [True, False, True]
+    assert rows[0]['test_results'] == [{'type': 'Hemograma', 'results': 'Leucocitos elevados'}]
+    assert rows[1]['test_results'] == []
+    assert rows[2]['exam_results'] == [{'type': 'Radiografía de tórax', 'results': 'Normal'}]
+
+def test_export_is_incremental_and_idempotent(engine, tmp_path):
+    """Test de marca de agua: repetir no duplica y solo se exporta lo nuevo"""
+    output = str(tmp_path / 'export')
+    export(engine, output)
+    assert export(engine, output)['rows'] == 0
+
+    insert_diagnoses(engine, [('picazón enrojecimiento', 'Dermatitis/Alergia', DAY_TWO)])
+    summary = export(engine, output)
+
+    assert summary['rows'] == 1
+    assert read_watermark(output)['last_id'] == 4
+    assert [row['diagnosis_id'] for row in read_rows(output)] == [1, 2, 3, 4]
+
+def test_interrupted_export_leaves_no_duplicates(engine, tmp_path, monkeypatch):
+    """Test de corte entre escribir archivos y avanzar la marca de agua"""
+    import export_training_data
+
+    output = str(tmp_path / 'export')
+    calls = []
+
+    def failing_write(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('disco lleno')
+        return write_watermark(*args)
+
+    monkeypatch.setattr(export_training_data, 'write_watermark', failing_write)
+    with pytest.raises(RuntimeError):
+        export(engine, output, chunk_size=2)
+    assert read_watermark(output)['last_id'] == 2
+
+    # El lote se repite con otros límites porque llegó un diagnóstico nuevo
+    monkeypatch.setattr(export_training_data, 'write_watermark', write_watermark)
+    insert_diagnoses(engine, [('picazón enrojecimiento', 'Dermatitis/Alergia', DAY_TWO)])
+    export(engine, output, chunk_size=100)
+    assert [row['diagnosis_id'] for row in read_rows(output)] == [1, 2, 3, 4]
+
+def test_settle_window_does_not_skip_recent_rows(engine, tmp_path):
+    """Test de que la marca de agua se detiene en el primer diagnóstico reciente"""
+    output = str(tmp_path / 'export')
+    recent = datetime.utcnow()
+    insert_diagnoses(engine, [
+        ('tos seca', 'Gripe', recent),
+        ('fiebre alta', 'Gripe', recent - timedelta(days=10)),
+    ])
+
+    assert export(engine, output, settle_hours=1)['rows'] == 3
+    assert read_watermark(output)['last_id'] == 3
+
+def confirm(engine, diagnosis_id, disease):
+    """Confirmación como la registra POST /api/diagnoses/<id>/feedback"""
+    with engine.begin() as conn:
+        conn.execute(DiagnosisFeedback.__table__.insert(), {
+            'diagnosis_id': diagnosis_id, 'confirmed_disease': disease, 'source': 'clinician'
+        })
+        conn.execute(Diagnosis.__table__.update().where(Diagnosis.id == diagnosis_id)
+                     .values(confirmed_disease=disease, confirmed_at=datetime.utcnow()))
+
+def test_training_reader_batches_and_filters(engine, tmp_path):
+    """Test de lectura por lotes de columnas y filtros de confirmación y fecha"""
+    output = str(tmp_path / 'export')
+    confirm(engine, 1, 'Gripe')
+    confirm(engine, 2, 'Hipertensión')
+    confirm(engine, 3, 'Resfriado Común')
+    export(engine, output)
+
+    batches = list(iter_training_batches(output, batch_size=1))
+    assert all(batch.schema.names == ['symptoms', 'predicted_disease', 'confirmed_disease'] for batch in batches)
+    assert sum(batch.num_rows for batch in batches) == 3
+
+    frame = load_training_frame(output)
+    assert sorted(frame['disease']) == ['Gripe', 'Hipertensión', 'Resfriado Común']
+    assert list(load_training_frame(output, since='2024-03-02')['disease']) == ['Resfriado Común']
+
+    model, _ = train_model(frame)
+    assert model.predict(['fiebre tos congestión'])[0] in model.classes_
+
+def test_late_confirmations_reach_training_labels(engine, tmp_path):
+    """Test de confirmaciones posteriores a la exportación del diagnóstico y etiquetas solo confirmadas"""
+    output = str(tmp_path / 'export')
+    confirm(engine, 1, 'Gripe')
+    summary = export(engine, output)
+    assert (summary['rows'], summary['labels']) == (3, 1)
+    # Sin confirmar no hay etiqueta: la predicción no se usa
+    assert list(load_training_frame(output)['disease']) == ['Gripe']
+
+    # El 1 se corrige y el 2 se confirma después de exportados
+    confirm(engine, 1, 'Resfriado Común')
+    confirm(engine, 2, 'Migraña')
+    summary = export(engine, output)
+    assert (summary['rows'], summary['labels']) == (0, 2)
+    assert read_watermark(output)['last_feedback_id'] == 3
+
+    frame = load_training_frame(output)
+    assert sorted(zip(frame['symptoms'], frame['disease'])) == [
+        ('dolor de cabeza intenso', 'Migraña'),
+        ('fiebre tos dolor de garganta', 'Resfriado Común'),
+    ]
+    assert export(engine, output)['labels'] == 0
@@ -0,0 +1,118 @@
+"""
+Tests para el reentrenamiento incremental con retroalimentación
+"""
+
+import pytest
+import sys
+import os
+
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backend.app import db, Patient, Diagnosis, DiagnosisFeedback
+from train_model import train_model, train_linear_stage, save_model, load_model, create_dataset
+from feedback_trainer import FeedbackTrainer, grow_forest, read_state, FEEDBACK_TREE_MARK
+from onnx_export import ONNX_MODEL_FILE, load_onnx_model
+
+@pytest.fixture(scope='module')
+def base_model():
+    return train_model()
+
+@pytest.fixture
+def model_dir(tmp_path, base_model):
+    model, disease_info = base_model
+    path = str(tmp_path / 'models')
+    save_model(model, disease_info, path, linear_model=train_linear_stage(model))
+    return path
+
+@pytest.fixture
+def engine(tmp_path):
+    """BD SQLite con diagnósticos confirmados (la mitad corrige la predicción)"""
+    engine = create_engine(f'sqlite:///{tmp_path / "feedback.db"}')
+    db.metadata.create_all(engine)
+    df = create_dataset()
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), [
+            {'cedula': '1234567890', 'name': 'Ana Torres', 'age': 45, 'email': 'ana@example.com'}
+        ])
+        conn.execute(Diagnosis.__table__.insert(), [
+            {'patient_cedula': '1234567890', 'symptoms': row.symptoms, 'predicted_disease': 'Gripe'}
+            for row in df.itertuples()
+        ] * 3)
+        conn.execute(DiagnosisFeedback.__table__.insert(), [
+            {'diagnosis_id': i + 1, 'confirmed_disease': df['disease'][i % len(df)], 'source': 'test'}
+            for i in range(3 * len(df))
+        ])
+    return engine
+
+def test_grow_forest_keeps_full_training_trees(base_model):
+    """Test de warm start: se agregan árboles y se descartan primero los incrementales"""
+    model, _ = base_model
+    df = create_dataset()
+    X = model.named_steps['tfidf'].transform(df['symptoms'])
+    n_base = len(model.named_steps['clf'].estimators_)
+
+    grown = grow_forest(model, X, df['disease'], 5, n_base + 8, 1)
+    grown = grow_forest(grown, X, df['disease'], 5, n_base + 8, 2)
+
+    forest = grown.named_steps['clf']
+    assert len(forest.estimators_) == forest.n_estimators == n_base + 8
+    assert not any(hasattr(tree, FEEDBACK_TREE_MARK) for tree in forest.estimators_[:n_base])
+    assert [getattr(tree, FEEDBACK_TREE_MARK) for tree in forest.estimators_[n_base:]] == [1, 1, 1, 2, 2, 2, 2, 2]
+    assert len(model.named_steps['clf'].estimators_) == n_base  # el modelo servido no se modifica
+    assert list(forest.classes_) == list(model.named_steps['clf'].classes_)
+
+def test_trainer_consumes_micro_batches_and_publishes(engine, model_dir, base_model):
+    """Test de micro-lotes con marca de agua y publicación por save_model"""
+    n_base = len(base_model[0].named_steps['clf'].estimators_)
+    artifacts = set(os.listdir(model_dir))
+    trainer = FeedbackTrainer(engine, model_dir, batch_size=20, min_batch=10, trees_per_batch=4, tolerance=1.0)
+
+    first = trainer.step()
+    assert first['labels'] == 20 and first['replay'] == 0 and first['published']
+    second = trainer.step()
+    assert second['labels'] == 20 and second['replay'] == 20
+    assert trainer.step() is None  # 5 etiquetas pendientes < min_batch
+    assert trainer.step(force=True)['labels'] == 5
+
+    state = read_state(trainer.state_path)
+    assert state['last_feedback_id'] == 45 and state['labels'] == 45 and state['published'] == 3
+
+    model, _ = load_model(model_dir)
+    assert len(model.named_steps['clf'].estimators_) == n_base + 12
+    assert os.path.exists(os.path.join(model_dir, 'linear_model_latest.pkl'))
+
+    # Cada publicación reemplaza los artefactos 'latest' (también el ONNX) sin copias con fecha
+    new_artifacts = set(os.listdir(model_dir)) - artifacts
+    assert ONNX_MODEL_FILE in new_artifacts
+    assert not any(name.startswith(('disease_model_2', 'disease_info_2', 'linear_model_2')) for name in new_artifacts)
+    onnx_model, _ = load_onnx_model(model_dir)
+    texts = list(create_dataset()['symptoms'])
+    assert list(onnx_model.predict(texts)) == list(model.predict(texts))
+
+def test_trainer_requires_onnx_export_for_onnx_deployments(model_dir, engine, monkeypatch):
+    """Test de que sin skl2onnx el entrenador no deja un modelo ONNX desactualizado"""
+    monkeypatch.setitem(sys.modules, 'skl2onnx', None)
+    assert FeedbackTrainer(engine, model_dir).export_onnx is None  # despliegue solo sklearn
+
+    open(os.path.join(model_dir, ONNX_MODEL_FILE), 'wb').close()
+    with pytest.raises(RuntimeError):
+        FeedbackTrainer(engine, model_dir)
+
+def test_trainer_rejects_worse_candidate(engine, model_dir, base_model, monkeypatch):
+    """Test de la compuerta de validación: no se publica, pero se avanza la marca de agua"""
+    import feedback_trainer
+
+    trainer = FeedbackTrainer(engine, model_dir, batch_size=50, min_batch=1, tolerance=0.0)
+    scores = iter([0.9, 0.5])
+    monkeypatch.setattr(feedback_trainer, 'accuracy', lambda *args: next(scores))
+
+    summary = trainer.step()
+
+    assert not summary['published']
+    assert read_state(trainer.state_path)['rejected'] == 1
+    model, _ = load_model(model_dir)
+    assert len(model.named_steps['clf'].estimators_) == len(base_model[0].named_steps['clf'].estimators_)
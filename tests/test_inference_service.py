@@ -0,0 +1,159 @@
+"""
+Tests para el servicio de inferencia independiente y su cliente
+"""
+
+import pytest
+import socket
+import sys
+import os
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from train_model import train_model
+from inference import top_k_diseases
+from inference_service import InferenceService, create_application
+from inference_client import InferenceClient, InferenceServiceError
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def trained():
+    return train_model()
+
+@pytest.fixture
+def service_url(trained):
+    """Servicio de inferencia en un puerto libre"""
+    model, disease_info = trained
+    application = create_application(lambda: InferenceService(model, disease_info))
+    server = make_server('127.0.0.1', 0, application,
+                         server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+def test_batch_prediction_matches_local_model(trained, service_url):
+    """Test de predicción por lotes idéntica al modelo local"""
+    model, _ = trained
+    texts = ['fiebre alta tos seca dolor muscular', 'dolor oido audiencia reducida', 'estornudos']
+    client = InferenceClient(service_url)
+
+    predictions = client.predict(texts, top_k=3)
+
+    probabilities = model.predict_proba(texts)
+    assert predictions == [top_k_diseases(row, model.classes_, 3) for row in probabilities]
+
+def test_out_of_vocabulary_skips_model(trained, service_url):
+    """Test de textos sin términos del vocabulario: predicción vacía y cobertura por texto"""
+    model, _ = trained
+    result = InferenceClient(service_url).infer(['me siento raro', 'fiebre alta rara'], top_k=2)
+
+    assert result['predictions'][0] == []
+    assert result['predictions'][1] == top_k_diseases(model.predict_proba(['fiebre alta rara'])[0], model.classes_, 2)
+    assert [q['known_terms'] for q in result['input_quality']] == [0, 2]
+    assert result['input_quality'][0]['unknown_terms'] == ['me', 'raro', 'siento']
+
+def test_disease_info_and_health(trained, service_url):
+    """Test de endpoints auxiliares del servicio"""
+    _, disease_info = trained
+    client = InferenceClient(service_url)
+
+    assert client.health()['model_loaded'] is True
+    assert client.disease_info() == disease_info
+
+def test_vectorizer_config(trained, service_url):
+    """Test del TF-IDF exportado por el servicio: mismo vector que el modelo local"""
+    import numpy as np
+    from onnx_export import PortableTfidfVectorizer
+
+    model, _ = trained
+    vectorizer = PortableTfidfVectorizer(InferenceClient(service_url).vectorizer_config())
+    texts = ['Fiebre alta, tos seca', 'dolor oido']
+
+    assert vectorizer.vocabulary_ == model.named_steps['tfidf'].vocabulary_
+    assert np.allclose(vectorizer.transform(texts), model.named_steps['tfidf'].transform(texts).toarray(), atol=1e-6)
+
+def test_explanations_follow_cascade_stage(trained):
+    """Test de explicaciones por etapa: lineal si respondió la cascada, bosque si escaló"""
+    from inference import CascadeClassifier
+    from train_model import train_linear_stage
+
+    model, disease_info = trained
+    cascade = CascadeClassifier(model, train_linear_stage(model), margin=0.5)
+    texts = ['fiebre alta tos seca dolor muscular', 'dolor', 'me siento raro']
+    _, escalated = cascade.predict_proba_with_stage(texts[:2])
+    assert list(escalated) == [False, True]
+
+    predictions, _, explanations = InferenceService(model, disease_info, cascade).predict(texts, 1, explain=True)
+
+    assert [e['method'] for e in explanations[:2]] == ['saabas' if e else 'linear' for e in escalated]
+    assert [e['class'] for e in explanations[:2]] == [p[0]['disease'] for p in predictions[:2]]
+    assert explanations[2] is None
+
+def test_reload_on_new_model_version(trained):
+    """Test de recarga del servicio cuando cambia la versión publicada del modelo"""
+    import json
+    from wsgiref.util import setup_testing_defaults
+
+    model, disease_info = trained
+    versions, loads = ['v1'], []
+
+    def factory():
+        loads.append(versions[-1])
+        return InferenceService(model, disease_info, version=versions[-1])
+
+    application = create_application(factory, lambda: versions[-1], check_interval=0)
+
+    def health():
+        environ = {'PATH_INFO': '/health', 'REQUEST_METHOD': 'GET'}
+        setup_testing_defaults(environ)
+        return json.loads(b''.join(application(environ, lambda status, headers: None)))
+
+    assert health()['model_version'] == 'v1'
+    assert health()['model_version'] == 'v1' and loads == ['v1']
+    versions.append('v2')
+    assert health()['model_version'] == 'v2' and loads == ['v1', 'v2']
+
+def test_invalid_requests_raise(service_url):
+    """Test de validación de entrada del servicio"""
+    client = InferenceClient(service_url)
+
+    with pytest.raises(InferenceServiceError, match='400'):
+        client.predict(['fiebre'], top_k=0)
+    with pytest.raises(InferenceServiceError, match='400'):
+        client.infer(['fiebre'], explain=True, top_terms=0)
+    with pytest.raises(InferenceServiceError, match='413'):
+        client.predict(['fiebre'] * 1000)
+
+def test_client_timeout():
+    """Test de timeout cuando el servicio no responde"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    try:
+        client = InferenceClient(f'http://127.0.0.1:{listener.getsockname()[1]}', timeout=0.2)
+        with pytest.raises(InferenceServiceError, match='Timeout'):
+            client.predict(['fiebre'])
+    finally:
+        listener.close()
+
+def test_client_connection_refused():
+    """Test de error de conexión"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+
+    client = InferenceClient(f'http://127.0.0.1:{port}')
+    with pytest.raises(InferenceServiceError):
+        client.disease_info()
@@ -5,10 +5,14 @@ Tests para el modelo ML
 import pytest
 import sys
 import os
+import numpy as np
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
 
-from train_model import train_model, create_dataset, load_model, save_model
+from train_model import (train_model, create_dataset, load_model, save_model,
+                         create_holdout_dataset, train_linear_stage, load_linear_model,
+                         training_frame)
+from inference import top_k_diseases, CascadeClassifier, evaluate_cascade
 
 def test_dataset_creation():
     """Test de creación del dataset"""
@@ -66,8 +70,185 @@ def test_model_saving_loading(tmp_path):
     assert loaded_info is not None
     assert len(loaded_info) == len(disease_info)
 
+def test_top_k_diseases():
+    """Test de selección parcial del top-k"""
+    classes = ['A', 'B', 'C', 'D']
+    probabilities = [0.1, 0.4, 0.2, 0.3]
+    
+    top = top_k_diseases(probabilities, classes, 2)
+    assert [d['disease'] for d in top] == ['B', 'D']
+    assert top[0]['confidence'] == 40.0
+    
+    assert len(top_k_diseases(probabilities, classes, 10)) == 4
+    assert top_k_diseases(probabilities, classes, 0) == []
+
+def test_cascade_escalation():
+    """Test de la cascada: el margen decide qué etapa responde"""
+    model, _ = train_model()
+    linear_model = train_linear_stage(model)
+    texts = list(create_holdout_dataset(samples_per_disease=3)['symptoms'])
+    
+    always_forest = CascadeClassifier(model, linear_model, margin=1.01)
+    probabilities, escalated = always_forest.predict_proba_with_stage(texts)
+    assert escalated.all()
+    assert np.allclose(probabilities, model.predict_proba(texts))
+    
+    never_forest = CascadeClassifier(model, linear_model, margin=0.0)
+    probabilities, escalated = never_forest.predict_proba_with_stage(texts)
+    assert not escalated.any()
+    X = model.named_steps['tfidf'].transform(texts)
+    assert np.allclose(probabilities, linear_model.predict_proba(X))
+
+def test_cascade_evaluation_and_artifacts(tmp_path):
+    """Test del reporte de la cascada y de guardar la etapa lineal"""
+    model, disease_info = train_model()
+    linear_model = train_linear_stage(model)
+    holdout = create_holdout_dataset(samples_per_disease=5)
+    
+    report = evaluate_cascade(model, linear_model, 0.8, holdout['symptoms'], holdout['disease'])
+    assert 0 <= report['escalation_rate'] <= 1
+    assert report['agreement'] > 0.9
+    assert report['samples'] == len(holdout)
+    
+    assert load_linear_model(str(tmp_path)) is None
+    save_model(model, disease_info, str(tmp_path), linear_model=linear_model)
+    assert list(load_linear_model(str(tmp_path)).classes_) == list(model.classes_)
+
+def test_onnx_export_parity(tmp_path):
+    """Test de paridad ONNX/onnxruntime contra predict_proba de sklearn"""
+    pytest.importorskip('skl2onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx_export import export_onnx, load_onnx_model, PortableTfidfVectorizer
+    
+    model, disease_info = train_model()
+    export_onnx(model, disease_info, str(tmp_path))
+    onnx_model, onnx_info = load_onnx_model(str(tmp_path))
+    
+    texts = list(create_holdout_dataset(samples_per_disease=5)['symptoms']) + ['Respiración DIFÍCIL, fiebre!!', '']
+    vectorizer = model.named_steps['tfidf']
+    portable = PortableTfidfVectorizer.from_sklearn(vectorizer)
+    
+    assert np.allclose(portable.transform(texts), vectorizer.transform(texts).toarray(), atol=1e-6)
+    assert list(onnx_model.classes_) == list(model.classes_)
+    assert np.allclose(onnx_model.predict_proba(texts), model.predict_proba(texts), atol=1e-5)
+    assert (onnx_model.predict(texts) == model.predict(texts)).all()
+    assert onnx_info == disease_info
+
+def test_portable_vectorizer_sublinear_tf():
+    """Test de paridad del vectorizador portable con sublinear_tf (términos con tf = 1 y tf > 1)"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from onnx_export import PortableTfidfVectorizer
+    
+    corpus = ['fiebre fiebre tos', 'dolor cabeza dolor dolor', 'tos seca', 'fiebre dolor cabeza cuerpo']
+    texts = corpus + ['Fiebre FIEBRE fiebre, tos', 'náuseas', '']
+    for ngram_range in [(1, 1), (1, 2)]:
+        vectorizer = TfidfVectorizer(sublinear_tf=True, ngram_range=ngram_range, strip_accents='unicode').fit(corpus)
+        portable = PortableTfidfVectorizer.from_sklearn(vectorizer)
+        assert np.allclose(portable.transform(texts), vectorizer.transform(texts).toarray(), atol=1e-6)
+
+def test_forest_compression():
+    """Test de poda de árboles dentro del presupuesto de exactitud"""
+    from compress import compress_model
+    
+    model, _ = train_model()
+    validation = create_holdout_dataset(samples_per_disease=10, seed=7)
+    compressed, report = compress_model(model, validation['symptoms'], validation['disease'], tolerance=0.01)
+    
+    assert report['trees_after'] < report['trees_before']
+    assert report['accuracy_after'] >= report['accuracy_before'] - 0.01
+    assert len(compressed.named_steps['clf'].estimators_) == report['trees_after']
+    assert len(model.named_steps['clf'].estimators_) == 100
+    assert compressed.predict(['fiebre dolor cabeza cuerpo'])[0] in model.classes_
+
+def test_collapse_redundant_leaves():
+    """Test de colapso de hojas hermanas que predicen la misma clase"""
+    from sklearn.tree import DecisionTreeClassifier
+    from compress import collapse_redundant_leaves
+    
+    rng = np.random.RandomState(0)
+    X = rng.rand(400, 3)
+    y = np.where(X[:, 0] + 0.5 * rng.rand(400) > 0.7, 'A', 'B')
+    tree = DecisionTreeClassifier(max_depth=6, min_samples_leaf=5, random_state=0).fit(X, y)
+    before = tree.predict(X)
+    node_count = tree.tree_.node_count
+    
+    removed = collapse_redundant_leaves(tree)
+    assert removed > 0
+    assert tree.tree_.node_count == node_count - removed
+    assert (tree.predict(X) == before).all()
+
 @pytest.fixture
 def trained_model():
     """Fixture para modelo entrenado"""
     model, disease_info = train_model()
     return model, disease_info
+
+def test_vocabulary_coverage():
+    """Test de cobertura del vocabulario con el analizador del modelo"""
+    from inference import vocabulary_coverage
+    
+    model, _ = train_model()
+    vectorizer = model.named_steps['tfidf']
+    
+    empty = vocabulary_coverage(vectorizer, 'me siento raro')
+    assert empty['known_terms'] == 0
+    assert vectorizer.transform(['me siento raro']).nnz == 0
+    
+    partial = vocabulary_coverage(vectorizer, 'Fiebre alta y tos rara')
+    assert partial['terms'] == 4  # 'y' no es token (mínimo 2 caracteres)
+    assert partial['known_terms'] == 3
+    assert partial['unknown_terms'] == ['rara']
+    assert vocabulary_coverage(vectorizer, '')['coverage'] == 0.0
+
+def test_forest_explanation_is_exact():
+    """Test de la descomposición de Saabas: bias + contribuciones = probabilidad"""
+    from explain import ForestExplainer
+    
+    model, _ = train_model()
+    explainer = ForestExplainer(model)
+    texts = list(create_holdout_dataset(samples_per_disease=2)['symptoms'])
+    X = explainer.vectorizer.transform(texts)
+    probabilities = model.predict_proba(texts)
+    
+    for class_index in range(len(explainer.classes_)):
+        contributions = explainer.contributions(X, np.full(len(texts), class_index))
+        reconstructed = explainer.bias[class_index] + np.asarray(contributions.sum(axis=1)).ravel()
+        assert np.allclose(reconstructed, probabilities[:, class_index])
+    
+    explanation = explainer.explain(['fiebre alta tos seca dolor muscular'])[0]
+    assert explanation['class'] == model.predict(['fiebre alta tos seca dolor muscular'])[0]
+    present = [c['term'] for c in explanation['contributions'] if c['present']]
+    assert set(present) <= {'fiebre', 'alta', 'tos', 'seca', 'dolor', 'muscular'}
+    assert present
+
+def test_linear_explanation():
+    """Test de explicación de la etapa lineal (coef * x)"""
+    from explain import explain_linear
+    
+    model, _ = train_model()
+    linear_model = train_linear_stage(model)
+    vectorizer = model.named_steps['tfidf']
+    
+    explanation = explain_linear(linear_model, vectorizer, ['dolor oido inflamacion'], ['Otitis'])[0]
+    assert explanation['method'] == 'linear'
+    assert {c['term'] for c in explanation['contributions']} <= {'dolor', 'oido', 'inflamacion'}
+    
+    X = vectorizer.transform(['dolor oido inflamacion'])
+    class_index = list(linear_model.classes_).index('Otitis')
+    logit = linear_model.decision_function(X)[0, class_index]
+    total = explanation['bias'] + sum(c['contribution'] for c in explanation['contributions'])
+    assert total == pytest.approx(logit, abs=1e-3)
+
+def test_linear_stage_with_exported_history():
+    """Test de etapa lineal entrenada con los mismos ejemplos que el bosque (incluye el historial)"""
+    import pandas as pd
+    
+    extra_data = pd.DataFrame({
+        'symptoms': ['manchas rojas comezon ampollas', 'ampollas fiebre leve comezon'],
+        'disease': ['Varicela', 'Varicela']
+    })
+    model, _ = train_model(extra_data)
+    linear_model = train_linear_stage(model, training_frame(create_dataset(), extra_data))
+    
+    assert 'Varicela' in model.classes_
+    assert list(linear_model.classes_) == list(model.classes_)
@@ -0,0 +1,105 @@
+"""
+Tests para la outbox de escritura diferida
+"""
+
+import pytest
+import sys
+import os
+
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, func, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from outbox import Outbox, OutboxWorker, outbox_table
+
+@pytest.fixture
+def database(tmp_path):
+    """BD SQLite con la tabla de la outbox y una tabla de datos"""
+    engine = create_engine(f'sqlite:///{tmp_path / "outbox.db"}')
+    metadata = MetaData()
+    table = outbox_table(metadata)
+    records = Table('records', metadata, Column('id', Integer, primary_key=True))
+    metadata.create_all(engine)
+    return engine, table, records
+
+def make_outbox(database, **kwargs):
+    engine, table, _ = database
+    return Outbox(engine, table, **kwargs)
+
+def enqueue(outbox, key, kind, payload):
+    with outbox.engine.begin() as conn:
+        return outbox.enqueue(conn, key, kind, payload)
+
+def test_enqueue_is_idempotent(database):
+    """Test de clave de idempotencia"""
+    outbox = make_outbox(database)
+    
+    assert enqueue(outbox, 'task:1', 'demo', {'value': 1})
+    assert not enqueue(outbox, 'task:1', 'demo', {'value': 2})
+    
+    items = outbox.claim()
+    assert len(items) == 1
+    assert items[0].payload == {'value': 1}
+
+def test_enqueue_follows_caller_transaction(database):
+    """Test de atomicidad: la tarea se confirma o se revierte con la escritura que la origina"""
+    engine, _, records = database
+    outbox = make_outbox(database)
+    
+    with pytest.raises(RuntimeError):
+        with engine.begin() as conn:
+            conn.execute(records.insert().values(id=1))
+            outbox.enqueue(conn, 'task:1', 'demo', {})
+            raise RuntimeError('fallo antes del commit')
+    assert outbox.counts() == {}
+    
+    with engine.begin() as conn:
+        conn.execute(records.insert().values(id=1))
+        outbox.enqueue(conn, 'task:1', 'demo', {})
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(records)).scalar() == 1
+    assert outbox.counts() == {'pending': 1}
+
+def test_claimed_items_are_leased(database):
+    """Test de arrendamiento: una tarea reservada no se entrega dos veces"""
+    outbox = make_outbox(database, lease_seconds=60)
+    enqueue(outbox, 'task:1', 'demo', {})
+    
+    assert len(outbox.claim()) == 1
+    assert outbox.claim() == []
+
+def test_failed_items_are_retried_then_dead(database):
+    """Test de reintentos con espera y descarte tras el máximo de intentos"""
+    outbox = make_outbox(database, max_attempts=2, backoff_seconds=0)
+    enqueue(outbox, 'task:1', 'demo', {})
+    calls = []
+    
+    def failing_handler(kind, payload):
+        calls.append(kind)
+        raise RuntimeError('BD no disponible')
+    
+    assert outbox.process(failing_handler) == 1
+    assert outbox.counts() == {'pending': 1}
+    assert outbox.process(failing_handler) == 1
+    assert outbox.counts() == {'dead': 1}
+    assert outbox.process(failing_handler) == 0
+    assert len(calls) == 2
+
+def test_worker_drains_outbox(database):
+    """Test del hilo trabajador"""
+    outbox = make_outbox(database)
+    for i in range(5):
+        enqueue(outbox, f'task:{i}', 'demo', {'i': i})
+    
+    processed = []
+    worker = OutboxWorker(outbox, lambda kind, payload: processed.append(payload['i']), poll_interval=0.01)
+    worker.start()
+    try:
+        for _ in range(200):
+            if outbox.counts() == {'done': 5}:
+                break
+            worker._stop_event.wait(0.01)
+    finally:
+        worker.stop(timeout=2)
+    
+    assert sorted(processed) == list(range(5))
@@ -0,0 +1,65 @@
+"""
+Tests para el particionamiento mensual (DDL y mantenimiento)
+"""
+
+import sys
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backend.app import db
+from partitioning import (PartitionSpec, add_months, month_range, partition_name, bounds_sql,
+                          parse_bounds, conversion_statements, add_partition_statements,
+                          ensure_partitioned, maintain)
+
+SPEC = PartitionSpec('diagnoses', 'created_at')
+
+def test_month_helpers():
+    """Test de aritmética de meses y límites de partición"""
+    assert add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+    assert add_months(datetime(2024, 1, 1), -1) == datetime(2023, 12, 1)
+    months = list(month_range(datetime(2024, 11, 20), datetime(2025, 1, 1)))
+    assert months == [datetime(2024, 11, 1), datetime(2024, 12, 1), datetime(2025, 1, 1)]
+    
+    assert partition_name('diagnoses', datetime(2024, 12, 1)) == 'diagnoses_2024_12'
+    bounds = bounds_sql(datetime(2024, 12, 1))
+    assert bounds == "FROM ('2024-12-01') TO ('2025-01-01')"
+    # Formato que devuelve pg_get_expr para una columna timestamp
+    assert parse_bounds("FOR VALUES FROM ('2024-12-01 00:00:00') TO ('2025-01-01 00:00:00')") == (
+        datetime(2024, 12, 1), datetime(2025, 1, 1))
+    assert parse_bounds('DEFAULT') is None
+
+def test_conversion_statements():
+    """Test del DDL de conversión: clave con la columna de partición y copia de filas"""
+    months = [datetime(2024, 12, 1), datetime(2025, 1, 1)]
+    fk = 'CONSTRAINT diagnoses_patient_cedula_fkey FOREIGN KEY (patient_cedula) REFERENCES patients(cedula)'
+    statements = conversion_statements(SPEC, months, [fk])
+    
+    assert statements[0].startswith('LOCK TABLE diagnoses')
+    assert 'ALTER TABLE diagnoses ADD PRIMARY KEY (id, created_at)' in statements
+    assert f'ALTER TABLE diagnoses ADD {fk}' in statements
+    partitions = [s for s in statements if 'PARTITION OF' in s]
+    assert partitions == [
+        "CREATE TABLE diagnoses_2024_12 PARTITION OF diagnoses FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')",
+        "CREATE TABLE diagnoses_2025_01 PARTITION OF diagnoses FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')",
+        'CREATE TABLE diagnoses_default PARTITION OF diagnoses DEFAULT',
+    ]
+    # Las filas se copian después de crear todas las particiones
+    assert statements.index('INSERT INTO diagnoses SELECT * FROM diagnoses_legacy') > statements.index(partitions[-1])
+    assert statements[-1] == 'DROP TABLE diagnoses_legacy CASCADE'
+    
+    added = add_partition_statements(SPEC, datetime(2025, 2, 1))
+    assert 'DELETE FROM diagnoses_default' in added[1]
+    assert added[-1].startswith('ALTER TABLE diagnoses ATTACH PARTITION diagnoses_2025_02')
+
+def test_partitioning_is_noop_on_sqlite(tmp_path):
+    """Test de que fuera de PostgreSQL las tablas quedan como están"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'medical.db'}")
+    db.metadata.create_all(engine)
+    
+    assert ensure_partitioned(engine, premake=3) == {'converted': [], 'created': []}
+    assert maintain(engine, retain_months=12) == {'created': [], 'detached': [], 'archived': []}
@@ -0,0 +1,109 @@
+"""
+Tests para la re-evaluación masiva del historial
+"""
+
+import pytest
+import sys
+import os
+import json
+
+import joblib
+from sqlalchemy import create_engine, select, func
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backend.app import db, Patient, Diagnosis, DiagnosisRescore
+from train_model import train_model, create_dataset
+from rescore import rescore, disagreement_report
+
+@pytest.fixture(scope='module')
+def model_path(tmp_path_factory):
+    model, _ = train_model()
+    path = tmp_path_factory.mktemp('modelo') / 'candidate.pkl'
+    joblib.dump(model, path)
+    return str(path)
+
+@pytest.fixture
+def engine(tmp_path):
+    """BD SQLite en archivo con historial sintético"""
+    engine = create_engine(f'sqlite:///{tmp_path / "history.db"}')
+    db.metadata.create_all(engine)
+    df = create_dataset()
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), [
+            {'cedula': '1234567890', 'name': 'Ana Torres', 'age': 45, 'email': 'ana@example.com'}
+        ])
+        rows = []
+        for repeat in range(4):
+            for i, row in enumerate(df.itertuples()):
+                # Una de cada tres etiquetas guardadas se altera para producir desacuerdos
+                stored = 'Gripe' if (i + repeat) % 3 == 0 else row.disease
+                rows.append({
+                    'patient_cedula': '1234567890',
+                    'symptoms': row.symptoms,
+                    'predicted_disease': stored,
+                    'severity': row.severity
+                })
+        conn.execute(Diagnosis.__table__.insert(), rows)
+    return engine
+
+def count_rescores(engine, run_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(DiagnosisRescore).where(DiagnosisRescore.run_id == run_id)
+        ).scalar()
+
+def test_rescore_writes_side_table_and_report(engine, model_path, tmp_path):
+    """Test de corrida completa en paralelo con reporte de desacuerdos"""
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    run_id, state = rescore(engine, model_path, 'run-1', checkpoint, chunk_size=7, workers=2)
+
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(Diagnosis)).scalar()
+        last_id = conn.execute(select(func.max(Diagnosis.id))).scalar()
+    assert count_rescores(engine, run_id) == total
+    assert state == {'run_id': 'run-1', 'last_id': last_id, 'processed': total}
+    assert json.load(open(checkpoint)) == state
+
+    report = disagreement_report(engine, run_id)
+    assert report['total'] == total
+    assert report['disagreements'] > 0
+    assert sum(g['disagreements'] for g in report['by_disease_severity']) == report['disagreements']
+    assert all(change['stored'] != change['candidate'] for change in report['top_changes'])
+
+def test_rescore_resumes_from_checkpoint(engine, model_path, tmp_path, monkeypatch):
+    """Test de reanudación tras una interrupción sin duplicar ni perder filas"""
+    import rescore as rescore_module
+
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    original = rescore_module.write_results
+    calls = []
+
+    def failing_write(*args):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError('conexión perdida')
+        return original(*args)
+
+    monkeypatch.setattr(rescore_module, 'write_results', failing_write)
+    with pytest.raises(RuntimeError):
+        rescore(engine, model_path, 'run-2', checkpoint, chunk_size=10, workers=1)
+    assert json.load(open(checkpoint))['processed'] == 20
+
+    monkeypatch.setattr(rescore_module, 'write_results', original)
+    _, state = rescore(engine, model_path, 'run-2', checkpoint, chunk_size=10, workers=1)
+
+    with engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(Diagnosis)).scalar()
+    assert state['processed'] == total
+    assert count_rescores(engine, 'run-2') == total
+
+def test_checkpoint_of_other_run_is_rejected(engine, model_path, tmp_path):
+    """Test de protección contra mezclar corridas"""
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    rescore(engine, model_path, 'run-a', checkpoint, chunk_size=50)
+
+    with pytest.raises(ValueError):
+        rescore(engine, model_path, 'run-b', checkpoint, chunk_size=50)
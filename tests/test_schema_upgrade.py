@@ -0,0 +1,42 @@
+"""
+Tests para la actualización del esquema de bases creadas por versiones anteriores
+"""
+
+import sys
+import os
+
+from sqlalchemy import MetaData, Table, create_engine, inspect, select
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.app import db, Patient, Diagnosis, MedicalTest, UPGRADE_COLUMNS, UPGRADE_INDEXES, upgrade_schema
+
+def create_previous_schema(engine):
+    """Tablas de los modelos actuales sin las columnas ni índices de UPGRADE_COLUMNS / UPGRADE_INDEXES"""
+    previous = MetaData()
+    for table in db.metadata.sorted_tables:
+        Table(table.name, previous, *[column._copy() for column in table.columns if column not in UPGRADE_COLUMNS])
+    previous.create_all(engine)
+
+def test_upgrade_previous_schema(tmp_path):
+    """Test de ALTER TABLE idempotente sobre una BD creada con el esquema anterior"""
+    engine = create_engine(f'sqlite:///{tmp_path / "previous.db"}')
+    create_previous_schema(engine)
+    
+    expected = [f'{c.table.name}.{c.name}' for c in UPGRADE_COLUMNS + UPGRADE_INDEXES]
+    assert sorted(upgrade_schema(engine)) == sorted(expected)
+    inspector = inspect(engine)
+    for column in UPGRADE_COLUMNS:
+        assert column.name in {c['name'] for c in inspector.get_columns(column.table.name)}
+    for index in UPGRADE_INDEXES:
+        assert index.name in {i['name'] for i in inspector.get_indexes(index.table.name)}
+    assert upgrade_schema(engine) == []
+    
+    # Los modelos leen y escriben sobre la tabla actualizada
+    with Session(engine) as session:
+        session.add(Patient(cedula='1234567890', name='Ana Torres', age=45, email='ana@example.com'))
+        session.add(Diagnosis(patient_cedula='1234567890', symptoms='fiebre tos', predicted_disease='Gripe/Influenza'))
+        session.commit()
+        assert len(session.execute(select(Diagnosis)).scalars().all()) == 1
+        assert session.execute(select(MedicalTest).where(MedicalTest.claimed_by.is_(None))).all() == []
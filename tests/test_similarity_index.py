@@ -0,0 +1,145 @@
+"""
+Tests para el índice de casos similares
+"""
+
+import pytest
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from train_model import train_model, create_dataset
+from similarity_index import SimilarityIndex
+
+@pytest.fixture(scope='module')
+def vectorizer():
+    model, _ = train_model()
+    return model.named_steps['tfidf']
+
+@pytest.fixture(scope='module')
+def corpus():
+    df = create_dataset()
+    return list(range(1, len(df) + 1)), df['symptoms'].tolist()
+
+def brute_force(vectorizer, ids, texts, query, k):
+    """Similitud coseno exhaustiva como referencia"""
+    X = vectorizer.transform(texts)
+    scores = (X @ vectorizer.transform([query]).T).toarray().ravel()
+    order = np.lexsort((ids, -scores))[:k]
+    return [(ids[i], scores[i]) for i in order if scores[i] > 0]
+
+def test_query_matches_brute_force(vectorizer, corpus):
+    """Test de resultados idénticos a la búsqueda exhaustiva (base + delta)"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer, flush_threshold=10 ** 6)
+    index.add(ids[:8], texts[:8])
+    index.flush()
+    index.add(ids[8:], texts[8:])
+
+    query = 'fiebre alta tos seca dolor muscular'
+    result = index.query(query, k=5)
+    expected = brute_force(vectorizer, ids, texts, query, 5)
+
+    assert [i for i, _ in result] == [i for i, _ in expected]
+    assert np.allclose([s for _, s in result], [s for _, s in expected], atol=1e-5)
+
+def test_exclude_and_unknown_terms(vectorizer, corpus):
+    """Test de exclusión del propio caso y consultas sin términos conocidos"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer)
+    index.add(ids, texts)
+
+    assert all(i != 1 for i, _ in index.query(texts[0], k=5, exclude=1))
+    assert index.query('xyzzy qwerty', k=5) == []
+
+def test_watermark_skips_indexed_rows(vectorizer, corpus):
+    """Test de adición incremental idempotente"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer)
+
+    assert index.add(ids[:10], texts[:10]) == 10
+    assert index.add(ids[:12], texts[:12]) == 2
+    assert len(index) == 12
+
+    index.settle(12)
+    assert index.watermark == 12
+    assert index.add(ids[:12], texts[:12]) == 0
+
+def test_late_commit_below_indexed_ids(vectorizer, corpus):
+    """Test de un diagnóstico con id menor que aparece después de uno mayor"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer)
+    index.add([1, 2, 4], [texts[0], texts[1], texts[3]])
+    index.settle(2)
+
+    # El 3 confirma tarde: sigue por encima de la marca de agua y se indexa; el 4 no se repite
+    assert index.add([3, 4, 5], [texts[2], texts[3], texts[4]]) == 2
+    assert len(index) == 5
+    assert index.query(texts[2], k=1)[0][0] == 3
+
+def test_flush_merges_segments_logarithmically(vectorizer, corpus):
+    """Test de fusión en bloque: los segmentos quedan en tamaños decrecientes y sin duplicados"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer, flush_threshold=10 ** 6)
+    for start in range(0, 14, 2):
+        index.add(ids[start:start + 2], texts[start:start + 2])
+        index.flush()
+
+    sizes = [len(s['diagnosis_ids']) for s in index._segments]
+    assert sizes == [8, 4, 2]
+    assert sorted(np.concatenate([s['diagnosis_ids'] for s in index._segments]).tolist()) == ids[:14]
+
+    query = texts[5]
+    expected = brute_force(vectorizer, ids[:14], texts[:14], query, 5)
+    assert [i for i, _ in index.query(query, k=5)] == [i for i, _ in expected]
+
+def test_persist_and_mmap_load(vectorizer, corpus, tmp_path):
+    """Test de persistencia con carga por mmap y autoflush por umbral"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer, str(tmp_path), flush_threshold=10)
+    index.add(ids, texts)
+
+    index.settle(ids[-3])
+    index.flush()
+
+    loaded = SimilarityIndex.load(str(tmp_path), vectorizer)
+    assert all(isinstance(s['doc_ids'], np.memmap) for s in loaded._segments)
+    assert len(loaded) == len(ids)
+    assert loaded.watermark == ids[-3]
+    assert loaded.add(ids, texts) == 0
+    assert loaded.query(texts[3], k=3) == index.query(texts[3], k=3)
+    # Solo quedan en disco los segmentos publicados
+    assert len([f for f in os.listdir(tmp_path) if f.startswith('doc_ids.')]) == len(loaded._segments)
+
+def test_save_rewrites_segments_removed_by_other_process(vectorizer, corpus, tmp_path):
+    """Test de un segmento borrado por otro proceso: se reescribe desde memoria al persistir"""
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer, str(tmp_path), flush_threshold=10 ** 6)
+    index.add(ids[:5], texts[:5])
+    index.flush()
+    other = SimilarityIndex.load(str(tmp_path), vectorizer)
+
+    # Este proceso fusiona el segmento y borra sus archivos
+    index.add(ids[5:10], texts[5:10])
+    index.flush()
+    other.add(ids[10:12], texts[10:12])
+    other.flush()
+
+    loaded = SimilarityIndex.load(str(tmp_path), vectorizer)
+    assert loaded is not None
+    assert len(loaded) == 7
+
+def test_load_rejects_other_vectorizer(vectorizer, corpus, tmp_path):
+    """Test de invalidación del índice cuando cambia el vocabulario"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    ids, texts = corpus
+    index = SimilarityIndex(vectorizer, str(tmp_path))
+    index.add(ids, texts)
+    index.flush()
+
+    other = TfidfVectorizer().fit(['otro vocabulario distinto'])
+    assert SimilarityIndex.load(str(tmp_path), other) is None
+    assert SimilarityIndex.load(str(tmp_path / 'vacio'), vectorizer) is None
@@ -0,0 +1,47 @@
+"""
+Tests para el autocompletado de síntomas
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from symptom_suggest import SymptomSuggester, normalize_term
+
+VOCABULARY = ['respiración', 'respirar', 'resfriado', 'dolor', 'dolores', 'diarrea', 'fiebre']
+
+def test_normalize_term():
+    """Test de normalización sin tildes ni mayúsculas"""
+    assert normalize_term('Respiración') == 'respiracion'
+    assert normalize_term('VÓMITO') == 'vomito'
+
+def test_prefix_is_accent_insensitive():
+    """Test de coincidencia con y sin tildes en el prefijo"""
+    suggester = SymptomSuggester(VOCABULARY)
+
+    for prefix in ['respiracion', 'respiración', 'RESPIRACIÓ']:
+        assert [s['term'] for s in suggester.suggest(prefix)] == ['respiración']
+    assert suggester.suggest('xyz') == []
+    assert suggester.suggest('   ') == []
+
+def test_ranking_by_historical_frequency():
+    """Test de orden por frecuencia y luego por longitud"""
+    suggester = SymptomSuggester(VOCABULARY, {'respirar': 5, 'resfriado': 9})
+
+    assert [s['term'] for s in suggester.suggest('res')] == ['resfriado', 'respirar', 'respiración']
+    assert [s['term'] for s in suggester.suggest('d')] == ['dolor', 'diarrea', 'dolores']
+    assert suggester.suggest('res', limit=1) == [{'term': 'resfriado', 'frequency': 9}]
+
+def test_from_vectorizer_counts_history():
+    """Test de frecuencias históricas con el mismo analizador del modelo"""
+    vectorizer = TfidfVectorizer(lowercase=True).fit(['dolor de cabeza', 'dolor de garganta fiebre'])
+    history = ['Dolor intenso y fiebre', 'fiebre alta', 'fiebre']
+
+    suggester = SymptomSuggester.from_vectorizer(vectorizer, history)
+
+    assert suggester.suggest('fie') == [{'term': 'fiebre', 'frequency': 3}]
+    assert suggester.suggest('in') == []  # 'intenso' no está en el vocabulario
+    assert suggester.vectorizer is vectorizer
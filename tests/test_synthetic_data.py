@@ -0,0 +1,90 @@
+"""
+Tests para el generador de datos sintéticos
+"""
+
+import sys
+import os
+
+import numpy as np
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, func, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from backend.app import db, Patient, Diagnosis, MedicalTest, Appointment, MedicationSet, TestPanel
+from synthetic_data import DatabaseWriter, FileWriter, SymptomSampler, DISEASES, build_parser, generate
+from train_model import SYMPTOM_DISEASE_DATA
+
+def make_args(*argv):
+    return build_parser().parse_args(['--patients', '300', '--batch-size', '120', *argv])
+
+def test_symptoms_follow_disease_distribution():
+    """Test de que los términos de cada enfermedad dominan sus síntomas"""
+    sampler = SymptomSampler(noise=0.1)
+    rng = np.random.default_rng(0)
+    for code, symptoms in enumerate(SYMPTOM_DISEASE_DATA['symptoms']):
+        own = set(symptoms.split())
+        texts = sampler.sample(rng, np.full(200, code))
+        terms = [term for text in texts for term in text.split() if term in sampler.tokens]
+        assert sum(term in own for term in terms) / len(terms) > 0.7
+        assert all(len(set(text.split())) == len(text.split()) for text in texts)
+
+def test_generate_into_database(tmp_path):
+    """Test de carga por lotes en la BD con relaciones consistentes"""
+    engine = create_engine(f'sqlite:///{tmp_path / "synthetic.db"}')
+    db.metadata.create_all(engine)
+
+    totals = generate(DatabaseWriter(engine), make_args())
+
+    with engine.connect() as conn:
+        count = lambda model: conn.execute(select(func.count()).select_from(model)).scalar()
+        assert count(Patient) == totals['patients'] == 300
+        assert count(Diagnosis) == totals['diagnoses'] > 300
+        assert count(MedicalTest) == totals['medical_tests'] == 3 * totals['appointments']
+        assert count(Appointment) == totals['appointments']
+        assert conn.execute(select(func.count(func.distinct(Patient.email)))).scalar() == 300
+
+        orphans = conn.execute(
+            select(func.count()).select_from(MedicalTest)
+            .outerjoin(Diagnosis, Diagnosis.id == MedicalTest.diagnosis_id).where(Diagnosis.id.is_(None))
+        ).scalar()
+        assert orphans == 0
+        low = conn.execute(select(func.count()).select_from(Diagnosis).where(Diagnosis.confidence < 84)).scalar()
+        assert low == totals['appointments']
+        diagnosis = conn.execute(select(Diagnosis).limit(1)).first()
+        assert diagnosis.predicted_disease in DISEASES
+        assert diagnosis.medications is None and diagnosis.recommended_tests is None
+
+        # Referencias a los catálogos en lugar del JSON por fila
+        medications = conn.execute(
+            select(func.count()).select_from(Diagnosis)
+            .join(MedicationSet, MedicationSet.id == Diagnosis.medication_set_id)
+            .where(MedicationSet.name == Diagnosis.predicted_disease)
+        ).scalar()
+        assert medications == conn.execute(
+            select(func.count()).select_from(Diagnosis).where(Diagnosis.medication_set_id.isnot(None))
+        ).scalar() > 0
+        panels = conn.execute(
+            select(func.count()).select_from(Diagnosis).join(TestPanel, TestPanel.id == Diagnosis.test_panel_id)
+        ).scalar()
+        assert panels == low
+        assert conn.execute(select(func.count()).select_from(TestPanel)).scalar() == 1
+
+    # Una segunda corrida reutiliza las mismas entradas del catálogo
+    args = make_args('--cedula-offset', '3000000000')
+    generate(DatabaseWriter(engine), args, first_diagnosis_id=totals['diagnoses'] + 1)
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(TestPanel)).scalar() == 1
+
+def test_generate_is_reproducible(tmp_path):
+    """Test de salida idéntica con la misma semilla y distinta con otra"""
+    outputs = {}
+    for name, seed in [('a', '7'), ('b', '7'), ('c', '8')]:
+        generate(FileWriter(str(tmp_path / name), 'parquet'), make_args('--seed', seed))
+        outputs[name] = pq.read_table(tmp_path / name / 'diagnoses.parquet')
+
+    assert outputs['a'].equals(outputs['b'])
+    assert not outputs['a'].equals(outputs['c'])
+    assert set(outputs['a'].column('predicted_disease').to_pylist()) <= set(DISEASES)
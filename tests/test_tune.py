@@ -0,0 +1,52 @@
+"""
+Tests para la búsqueda de hiperparámetros
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ml_model'))
+
+from tune import tune, mark_pareto, create_tuning_dataset
+from train_model import build_pipeline
+
+GRID = {
+    'tfidf__max_features': [50, 100],
+    'clf__n_estimators': [5, 20],
+    'clf__max_depth': [5],
+}
+
+def test_tune_leaderboard_with_cached_features(tmp_path):
+    """Test de leaderboard completo y reutilización del TF-IDF cacheado en disco"""
+    df = create_tuning_dataset(samples_per_disease=4)
+    cache_dir = str(tmp_path / 'cache')
+
+    rows, _ = tune(df, param_grid=GRID, folds=3, n_jobs=2, cache_dir=cache_dir, latency_samples=10)
+
+    assert len(rows) == 4
+    assert [row['rank'] for row in rows] == [1, 2, 3, 4]
+    assert all(rows[i]['cv_accuracy'] >= rows[i + 1]['cv_accuracy'] for i in range(3))
+    for row in rows:
+        assert 0 <= row['test_accuracy'] <= 1
+        assert row['latency_ms'] > 0 and row['size_kb'] > 0
+    assert any(row['pareto'] for row in rows)
+
+    # Un vectorizador ajustado por (max_features, pliegue): 2 x 3, compartido por ambos bosques
+    cached = [name for _, _, names in os.walk(cache_dir) for name in names if name == 'output.pkl']
+    assert len(cached) == 6
+
+def test_mark_pareto():
+    """Test de configuraciones dominadas"""
+    rows = mark_pareto([
+        {'cv_accuracy': 0.9, 'latency_ms': 5.0, 'size_kb': 500},
+        {'cv_accuracy': 0.9, 'latency_ms': 2.0, 'size_kb': 100},
+        {'cv_accuracy': 0.8, 'latency_ms': 1.0, 'size_kb': 50},
+        {'cv_accuracy': 0.7, 'latency_ms': 3.0, 'size_kb': 80},
+    ])
+    assert [row['pareto'] for row in rows] == [False, True, True, False]
+
+def test_build_pipeline_accepts_json_params():
+    """Test de parámetros leídos del leaderboard en JSON"""
+    model = build_pipeline({'tfidf__ngram_range': [1, 2], 'clf__max_depth': None})
+    assert model.named_steps['tfidf'].ngram_range == (1, 2)
+    assert model.named_steps['clf'].max_depth is None